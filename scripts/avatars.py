@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+作者头像
+
+构建时汇总全部文章的作者（按 姓名+邮箱 去重），每位作者只请求一次头像，
+结果缓存在 .cache/avatars，每个TTL周期只重新确认一次；头像缩放到页面显示的尺寸，
+以带内容哈希的文件名发布，读者不再向第三方请求头像。
+"""
+
+import re
+import json
+import time
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import images
+from cache_files import write_atomic
+from http_cache import cached_get
+
+AVATAR_CACHE_DIR = Path(".cache/avatars")
+INDEX_FILE = AVATAR_CACHE_DIR / "index.json"
+HTTP_CACHE_DIR = AVATAR_CACHE_DIR / "http"
+OUTPUT_DIR = "avatars"
+
+DEFAULT_SETTINGS = {
+    # 模板中头像为 w-10 h-10（40px），按2倍屏生成
+    'size': 40,
+    'ttl': 7 * 24 * 3600,
+    'concurrency': 4,
+    'githubUrl': "https://avatars.githubusercontent.com",
+    'gravatarUrl': "https://www.gravatar.com/avatar",
+    # 作者姓名或邮箱 -> GitHub用户名，用于无法从提交信息推断的作者
+    'logins': {}
+}
+
+NOREPLY_RE = re.compile(r'^(?:(\d+)\+)?([A-Za-z0-9-]+)@users\.noreply\.github\.com$', re.I)
+LOGIN_RE = re.compile(r'^[A-Za-z0-9](?:[A-Za-z0-9-]{0,38})$')
+
+IMAGE_MAGIC = (
+    (b'\x89PNG\r\n\x1a\n', '.png'),
+    (b'\xff\xd8\xff', '.jpg'),
+    (b'GIF8', '.gif'),
+)
+
+def load_index():
+    try:
+        with open(INDEX_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_index(index):
+    write_atomic(INDEX_FILE, json.dumps(index, ensure_ascii=False, indent=1))
+
+def author_key(name, email):
+    return f"{name or ''}\t{(email or '').lower()}"
+
+def sniff_suffix(data):
+    """由文件头判断图片格式，不是图片时返回None"""
+    for magic, suffix in IMAGE_MAGIC:
+        if data.startswith(magic):
+            return suffix
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return '.webp'
+    return None
+
+def avatar_candidates(name, email, settings):
+    """按可信程度排列的头像地址
+
+    依次为：配置中指定的GitHub用户名、GitHub隐私邮箱中的用户id/用户名、
+    邮箱对应的Gravatar，最后才把作者姓名当作GitHub用户名尝试。
+    """
+    pixels = settings['size'] * 2
+    github = settings['githubUrl'].rstrip('/')
+    candidates = []
+
+    logins = settings.get('logins') or {}
+    login = logins.get(email or '') or logins.get(name or '')
+    if login:
+        candidates.append(f"{github}/{login}?s={pixels}")
+
+    match = NOREPLY_RE.match(email or '')
+    if match:
+        user_id, login = match.groups()
+        candidates.append(f"{github}/u/{user_id}?s={pixels}" if user_id
+                          else f"{github}/{login}?s={pixels}")
+    elif email and settings.get('gravatarUrl'):
+        digest = hashlib.md5(email.strip().lower().encode('utf-8')).hexdigest()
+        candidates.append(f"{settings['gravatarUrl'].rstrip('/')}/{digest}?s={pixels}&d=404")
+
+    if name and LOGIN_RE.match(name):
+        candidates.append(f"{github}/{name}?s={pixels}")
+
+    # 去掉重复的地址，保持顺序
+    return list(dict.fromkeys(candidates))
+
+def fetch_avatar(url, ttl, offline, timeout=10):
+    """下载（或从缓存读取）一个头像，返回 (内容, 状态)，不是图片时内容为None"""
+    body, status = cached_get(url, headers={'User-Agent': 'Mozilla/5.0'}, ttl=ttl,
+                              offline=offline, timeout=timeout, cache_dir=HTTP_CACHE_DIR)
+    if body is not None and sniff_suffix(body) is None:
+        return None, f"不是图片: {url}"
+    return body, status
+
+def resolve_avatar(name, email, entry, settings, offline, now):
+    """
+    确定一位作者的头像，返回 (索引记录或None, 内容或None, 状态)
+
+    上次确定的地址（包括"没有头像"）在TTL内直接沿用；过期后按顺序重新尝试候选地址。
+    所有地址都明确不可用（HTTP错误、不是图片）时记录为没有头像，
+    网络错误时沿用旧的结果，下次构建再试。
+    """
+    ttl = settings['ttl']
+    candidates = avatar_candidates(name, email, settings)
+    if entry is not None and entry['url'] is not None and entry['url'] not in candidates:
+        entry = None
+
+    if entry is not None and (offline or now - entry['checked_at'] < ttl):
+        if entry['url'] is None:
+            return entry, None, 'offline' if offline else 'fresh'
+        body, status = fetch_avatar(entry['url'], ttl, offline)
+        if body is not None:
+            return entry, body, status
+    if offline:
+        return entry, None, '离线模式且没有缓存'
+
+    errors = []
+    for url in candidates:
+        body, status = fetch_avatar(url, ttl, offline)
+        if body is not None:
+            return {'url': url, 'checked_at': now}, body, status
+        errors.append(status)
+
+    if all(error.startswith(('HTTP ', '不是图片')) for error in errors):
+        return {'url': None, 'checked_at': now}, None, errors[0] if errors else '没有可用的头像地址'
+    if entry is not None and entry['url']:
+        body, _ = fetch_avatar(entry['url'], ttl, offline=True)
+        if body is not None:
+            return entry, body, 'stale'
+    return entry, None, errors[0]
+
+def fetch_avatars(authors, settings=None, offline=False):
+    """
+    获取一组作者的头像，返回 ({作者key: 缓存中的文件名}, {状态: 作者数})
+
+    authors 为 {(姓名, 邮箱), ...}；请求在有限大小的线程池中并发进行。
+    """
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    index = load_index()
+    now = time.time()
+    authors = sorted(authors, key=lambda author: author_key(*author))
+
+    def resolve(author):
+        key = author_key(*author)
+        try:
+            return key, resolve_avatar(*author, index.get(key), settings, offline, now)
+        except Exception as e:
+            return key, (index.get(key), None, str(e))
+
+    workers = max(1, min(settings['concurrency'], len(authors)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(resolve, authors))
+
+    files = {}
+    counts = {}
+    changed = False
+    for key, (entry, body, status) in results:
+        counts[status] = counts.get(status, 0) + 1
+        if entry is not None and index.get(key) != entry:
+            index[key] = entry
+            changed = True
+        if body is None:
+            continue
+        file_name = f"{hashlib.sha256(body).hexdigest()[:16]}{sniff_suffix(body)}"
+        path = AVATAR_CACHE_DIR / file_name
+        if not path.exists():
+            write_atomic(path, body)
+        files[key] = file_name
+
+    if changed:
+        save_index(index)
+    return files, counts
+
+def make_avatar_urls(files, build_dir, size=DEFAULT_SETTINGS['size'], jobs=1):
+    """把头像缩放为2倍显示尺寸并写入构建目录，返回 ({作者key: 地址}, 图片统计)"""
+    pipeline = images.ImagePipeline({'widths': [size * 2], 'formats': ['webp'], 'quality': 80},
+                                    output_dir=OUTPUT_DIR)
+    pipeline.source = images.DirImageSource(AVATAR_CACHE_DIR)
+    for file_name in set(files.values()):
+        pipeline.add_image(file_name)
+    pipeline.encode_pending(jobs)
+    pipeline.write(build_dir, originals=False)
+
+    urls = {}
+    for key, file_name in files.items():
+        if file_name not in pipeline.records:
+            continue
+        src, _, variants = pipeline.image_urls(file_name)
+        webp = variants.get('image/webp')
+        urls[key] = webp[-1][1] if webp else src
+    return urls, pipeline.stats
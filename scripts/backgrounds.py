@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+背景图片池
+
+构建时从 background.apiUrl 获取若干张随机图片，保存在 .cache/backgrounds，
+每个TTL周期只更新一次；图片经缩放、压缩后作为站点文件发布，页面从 /backgrounds.js
+中的静态列表随机选择，不再在每次访问时请求第三方API。
+"""
+
+import json
+import time
+import hashlib
+import posixpath
+from pathlib import Path
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+import images
+from cache_files import write_atomic
+
+BACKGROUND_CACHE_DIR = Path(".cache/backgrounds")
+POOL_FILE = BACKGROUND_CACHE_DIR / "pool.json"
+DEFAULT_POOL_SIZE = 6
+DEFAULT_POOL_TTL = 24 * 3600
+MAX_DOWNLOADS = 4
+
+# 背景铺满屏幕，按屏幕宽度选择；WebP各浏览器都已支持，只生成一种格式
+IMAGE_SETTINGS = {
+    'widths': [1280, 1920, 2560],
+    'formats': ['webp'],
+    'quality': 70
+}
+OUTPUT_DIR = "backgrounds"
+SCRIPT_NAME = "backgrounds.js"
+
+CONTENT_TYPE_SUFFIXES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/avif': '.avif',
+    'image/gif': '.gif'
+}
+
+def load_pool():
+    try:
+        with open(POOL_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_pool(pool):
+    write_atomic(POOL_FILE, json.dumps(pool, ensure_ascii=False, indent=1))
+
+def image_suffix(content_type, url):
+    """由Content-Type（或地址的扩展名）确定图片扩展名，不是图片时返回None"""
+    suffix = CONTENT_TYPE_SUFFIXES.get(content_type.split(';')[0].strip().lower())
+    if suffix is None:
+        suffix = posixpath.splitext(urlsplit(url).path)[1].lower()
+    return suffix if suffix in images.IMAGE_SUFFIXES else None
+
+def download_background(api_url, timeout=10):
+    """请求一次API，返回 (图片内容, 扩展名, 图片地址)
+
+    API可以直接返回图片，也可以返回带 url 字段的JSON（如LoliAPI的 ?type=json）。
+    """
+    import requests
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    response = requests.get(api_url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+
+    content_type = response.headers.get('Content-Type', '')
+    if not content_type.startswith('image/'):
+        image_url = response.json()['url']
+        response = requests.get(image_url, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '')
+
+    suffix = image_suffix(content_type, response.url)
+    if suffix is None:
+        raise ValueError(f"不是图片: {response.url} ({content_type})")
+    return response.content, suffix, response.url
+
+def _try_download(api_url, timeout):
+    try:
+        return download_background(api_url, timeout), None
+    except Exception as e:
+        return None, str(e)
+
+def fetch_background_pool(api_url, size=DEFAULT_POOL_SIZE, ttl=DEFAULT_POOL_TTL,
+                          offline=False, timeout=10):
+    """
+    获取背景图片池，返回 (图片列表, 状态)，图片为 {'file': 缓存中的文件名, 'source': 原地址}
+
+    状态: fresh（未过期）、fetched（已更新）、offline（离线模式使用缓存）、
+    stale（请求失败使用旧的图片）、其他字符串表示失败原因
+    """
+    pool = load_pool() or {}
+    cached = [image for image in pool.get('images', [])
+              if (BACKGROUND_CACHE_DIR / image['file']).is_file()]
+
+    if offline:
+        return (cached, 'offline') if cached else ([], '离线模式且没有缓存')
+    if not api_url:
+        return cached, 'stale' if cached else '没有配置 background.apiUrl'
+
+    # API返回的图片可能重复，池中图片少于 size 张也视为有效
+    now = time.time()
+    if (pool.get('api_url') == api_url and now - pool.get('fetched_at', 0) < ttl
+            and cached and len(cached) == len(pool['images'])):
+        return cached[:size], 'fresh'
+
+    # 每次请求返回一张随机图片，并发请求
+    with ThreadPoolExecutor(max_workers=max(1, min(size, MAX_DOWNLOADS))) as executor:
+        results = list(executor.map(lambda _: _try_download(api_url, timeout), range(size)))
+
+    fetched = []
+    errors = []
+    for result, error in results:
+        if result is None:
+            errors.append(error)
+            continue
+        data, suffix, source = result
+        file_name = f"{hashlib.sha256(data).hexdigest()[:16]}{suffix}"
+        path = BACKGROUND_CACHE_DIR / file_name
+        if not path.exists():
+            write_atomic(path, data)
+        fetched.append({'file': file_name, 'source': source})
+
+    if not fetched:
+        return cached, 'stale' if cached else errors[0]
+
+    # 新图片在前，不足时用上次的图片补齐；API可能返回重复的图片
+    pool_images = []
+    keep = set()
+    for image in fetched + cached:
+        if image['file'] not in keep and len(pool_images) < size:
+            pool_images.append(image)
+            keep.add(image['file'])
+    for path in BACKGROUND_CACHE_DIR.glob("*.*"):
+        if path.name not in keep and path != POOL_FILE:
+            path.unlink()
+
+    save_pool({'api_url': api_url, 'fetched_at': now, 'images': pool_images})
+    return pool_images, 'fetched'
+
+def make_background_list(pool_images, build_dir, jobs=1):
+    """缩放、压缩池中的图片并写入构建目录，返回页面使用的列表"""
+    pipeline = images.ImagePipeline(IMAGE_SETTINGS, output_dir=OUTPUT_DIR)
+    pipeline.source = images.DirImageSource(BACKGROUND_CACHE_DIR)
+    files = [image['file'] for image in pool_images if pipeline.add_image(image['file'])]
+    pipeline.encode_pending(jobs)
+    # 原图很大，有缩放后的版本时不发布
+    pipeline.write(build_dir, originals=False)
+
+    backgrounds = []
+    for file_name in files:
+        src, size, variants = pipeline.image_urls(file_name)
+        entry = {'src': src, 'variants': variants.get('image/webp', [])}
+        if size:
+            entry['width'], entry['height'] = size
+        backgrounds.append(entry)
+    return backgrounds, pipeline.stats
+
+def write_background_script(build_dir, backgrounds, default_background):
+    """写出 /backgrounds.js：图片列表和按屏幕宽度选图的函数
+
+    地址不带内容哈希，图片池更新时页面本身不变，增量构建不必重新生成所有页面。
+    """
+    data = json.dumps({'default': default_background, 'images': backgrounds},
+                      ensure_ascii=False, separators=(',', ':'))
+    script = f"""// 构建时生成的背景图片列表
+window.SITE_BACKGROUNDS = {data};
+
+// 每张图片取不窄于屏幕的最小版本，返回 [{{url, width, height}}]
+function backgroundChoices() {{
+    var target = window.innerWidth * (window.devicePixelRatio || 1);
+    return window.SITE_BACKGROUNDS.images.map(function (image) {{
+        var variants = image.variants;
+        var chosen = variants.filter(function (v) {{ return v[0] >= target; }})[0] || variants[variants.length - 1];
+        return {{url: chosen ? chosen[1] : image.src, width: image.width, height: image.height}};
+    }});
+}}
+
+// 地址仍在图片池中时返回对应的图片，否则返回null
+window.findBackground = function (url) {{
+    return backgroundChoices().filter(function (image) {{ return image.url === url; }})[0] || null;
+}};
+
+// 随机选择一张（尽量避开 exclude），没有图片时返回null
+window.pickBackground = function (exclude) {{
+    var list = backgroundChoices();
+    var choices = list.filter(function (image) {{ return image.url !== exclude; }});
+    if (!choices.length) choices = list;
+    return choices.length ? choices[Math.floor(Math.random() * choices.length)] : null;
+}};
+
+// 在页面背景上显示一张图片，没有图片时使用默认背景
+window.applyBackground = function (element, image) {{
+    element.style.backgroundImage = image ? "url('" + image.url + "')" : window.SITE_BACKGROUNDS['default'];
+}};
+"""
+    path = Path(build_dir) / SCRIPT_NAME
+    path.write_text(script, encoding='utf-8')
+    return path
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+"""
+构建性能基准测试
+
+生成一个合成的articles仓库，分别测量 fetch_articles、extract_article_info、
+convert_markdown_to_html 和完整的 build_with_templates（冷缓存、热缓存、无变化的增量构建、
+流式构建）。--articles 给出多个文章数时依次在各自的工作区运行，最后按文章数列出峰值内存，
+可以看出内存占用是否随文章数增长（流式构建应基本持平）。
+
+用法:
+    python scripts/bench.py --articles 2000 --groups 20 --jobs 4 --json bench.json
+    python scripts/bench.py --articles 2000 --compare bench.json
+    python scripts/bench.py --articles 500,1000,2000 --only build-stream
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import subprocess
+import contextlib
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+REPO_ROOT = SCRIPTS_DIR.parent
+
+BENCHMARKS = ['fetch', 'extract', 'markdown-cold', 'markdown-warm', 'build-cold', 'build-warm',
+              'build-noop', 'build-stream']
+
+CJK_CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动"
+    "同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二"
+    "理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社"
+    "义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没"
+)
+LATIN_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua build cache render index python "
+    "markdown template article group commit branch worker process thread memory"
+).split()
+CODE_LANGS = ['python', 'bash', 'javascript', 'c']
+AUTHORS = [("alice", "alice@example.com"), ("bob", "bob@example.com"),
+           ("carol", "carol@example.com"), ("dave", "dave@example.com")]
+
+def make_paragraph(rng, cjk_ratio):
+    """生成一段中英混排文本"""
+    parts = []
+    for _ in range(rng.randint(3, 8)):
+        if rng.random() < cjk_ratio:
+            parts.append(''.join(rng.choice(CJK_CHARS) for _ in range(rng.randint(8, 40))) + "。")
+        else:
+            words = [rng.choice(LATIN_WORDS) for _ in range(rng.randint(5, 20))]
+            if rng.random() < 0.3:
+                words[0] = f"**{words[0]}**"
+            if rng.random() < 0.3:
+                words[-1] = f"`{words[-1]}`"
+            parts.append(' '.join(words) + ".")
+    return ' '.join(parts)
+
+def make_code_block(rng):
+    """生成一个代码块"""
+    lang = rng.choice(CODE_LANGS)
+    lines = []
+    for i in range(rng.randint(5, 30)):
+        name = rng.choice(LATIN_WORDS)
+        if lang == 'python':
+            lines.append(f"def {name}_{i}(x):\n    return x * {i}  # {name}")
+        elif lang == 'bash':
+            lines.append(f"echo \"{name}\" | grep -c {i} > /dev/null")
+        elif lang == 'javascript':
+            lines.append(f"const {name}{i} = (x) => x + {i}; // {name}")
+        else:
+            lines.append(f"int {name}_{i}(int x) {{ return x << {i % 8}; }}")
+    return f"```{lang}\n" + '\n'.join(lines) + "\n```"
+
+def make_table(rng):
+    """生成一个表格"""
+    cols = rng.randint(2, 5)
+    rows = [
+        "| " + " | ".join(rng.choice(LATIN_WORDS) for _ in range(cols)) + " |"
+        for _ in range(rng.randint(3, 10))
+    ]
+    header = "| " + " | ".join(f"col{i}" for i in range(cols)) + " |"
+    sep = "|" + "---|" * cols
+    return '\n'.join([header, sep] + rows)
+
+def make_article(rng, title, params):
+    """生成一篇文章的初始内容"""
+    blocks = [f"# {title}", make_paragraph(rng, params['cjk_ratio'])]
+    extras = ['code'] * params['code_blocks'] + ['table'] * params['tables']
+    extras += ['text'] * params['paragraphs']
+    rng.shuffle(extras)
+    for kind in extras:
+        if kind == 'code':
+            blocks.append(make_code_block(rng))
+        elif kind == 'table':
+            blocks.append(make_table(rng))
+        else:
+            if rng.random() < 0.2:
+                blocks.append(f"## {make_paragraph(rng, params['cjk_ratio'])[:30]}")
+            blocks.append(make_paragraph(rng, params['cjk_ratio']))
+    return '\n\n'.join(blocks) + '\n'
+
+def generate_corpus(repo_dir, params):
+    """用 git fast-import 生成合成的articles分支"""
+    rng = random.Random(params['seed'])
+    repo_dir = Path(repo_dir)
+
+    paths = []
+    for i in range(params['articles']):
+        group = i % (params['groups'] + 1)
+        # 第0组放在根目录（default分组）
+        paths.append(f"post-{i:05d}.md" if group == 0 else f"group-{group:03d}/post-{i:05d}.md")
+    contents = [make_article(rng, f"文章 {i} {rng.choice(LATIN_WORDS)}", params)
+                for i in range(params['articles'])]
+
+    proc = subprocess.Popen(['git', 'fast-import', '--quiet'], cwd=repo_dir,
+                            stdin=subprocess.PIPE)
+    out = proc.stdin
+    base_ts = 1700000000
+
+    def data(payload):
+        out.write(f"data {len(payload)}\n".encode('ascii'))
+        out.write(payload)
+        out.write(b"\n")
+
+    for rev in range(params['commits']):
+        name, email = AUTHORS[rev % len(AUTHORS)]
+        ts = base_ts + rev * 86400
+        out.write(b"commit refs/heads/articles\n")
+        out.write(f"mark :{rev + 1}\n".encode('ascii'))
+        out.write(f"author {name} <{email}> {ts} +0800\n".encode('utf-8'))
+        out.write(f"committer {name} <{email}> {ts} +0800\n".encode('utf-8'))
+        data(f"revision {rev}".encode('utf-8'))
+        if rev > 0:
+            out.write(f"from :{rev}\n".encode('ascii'))
+
+        for i, path in enumerate(paths):
+            if rev > 0:
+                # 后续提交只修改部分文章，使各文章的提交次数和日期不同
+                if rng.random() > params['edit_ratio']:
+                    continue
+                contents[i] += '\n' + make_paragraph(rng, params['cjk_ratio']) + '\n'
+            out.write(f"M 100644 inline {path}\n".encode('utf-8'))
+            data(contents[i].encode('utf-8'))
+        out.write(b"\n")
+
+    out.close()
+    if proc.wait() != 0:
+        raise RuntimeError("git fast-import 失败")
+
+def prepare_workspace(workspace, params):
+    """准备测试工作区：模板、配置、静态文件和合成的articles分支"""
+    workspace = Path(workspace)
+    marker = workspace / ".bench-corpus.json"
+    if marker.exists() and json.loads(marker.read_text(encoding='utf-8')) == params:
+        print(f"✓ 复用已有语料: {workspace}")
+        return
+
+    if workspace.exists():
+        shutil.rmtree(workspace)
+    workspace.mkdir(parents=True)
+
+    shutil.copytree(REPO_ROOT / "templates", workspace / "templates")
+    shutil.copytree(REPO_ROOT / "site", workspace / "site",
+                    ignore=shutil.ignore_patterns("_site", "_staging"))
+    shutil.copy2(REPO_ROOT / "config.json", workspace / "config.json")
+
+    subprocess.run(['git', 'init', '-q', str(workspace)], check=True)
+    print(f"📝 生成合成语料: {params['articles']} 篇文章，{params['groups']} 个分组，"
+          f"{params['commits']} 次提交...")
+    start = time.perf_counter()
+    generate_corpus(workspace, params)
+    print(f"✓ 语料生成完成: {time.perf_counter() - start:.2f}s")
+    marker.write_text(json.dumps(params), encoding='utf-8')
+
+def run_benchmark(name, jobs):
+    """在当前进程（工作区目录下）执行一项测试，返回结果"""
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    import build
+    from profiling import profiler
+
+    quiet = contextlib.redirect_stdout(open(os.devnull, 'w', encoding='utf-8'))
+
+    if name.startswith('build-') or name == 'markdown-cold':
+        shutil.rmtree(build.RENDER_CACHE_DIR, ignore_errors=True)
+    if name == 'build-cold':
+        shutil.rmtree(build.postprocess.COMPRESS_CACHE_DIR, ignore_errors=True)
+        shutil.rmtree("site/_site", ignore_errors=True)
+
+    # 准备阶段（不计时）
+    with quiet:
+        if name in ('extract', 'markdown-cold', 'markdown-warm'):
+            articles, _ = build.fetch_articles()
+            sources = [(a['source'], a['filename'], a['group']) for a in articles]
+        if name == 'markdown-warm':
+            for source, _, _ in sources:
+                build.convert_markdown_to_html(source)
+        if name in ('build-warm', 'build-noop', 'build-stream'):
+            build.build_with_templates(jobs=jobs, offline=True, full=True,
+                                       stream=name == 'build-stream')
+
+    profiler.enable()
+    profiler.drain()
+    start = time.perf_counter()
+    with quiet:
+        if name == 'fetch':
+            count = len(build.fetch_articles()[0])
+        elif name == 'extract':
+            for source, filename, group in sources:
+                build.extract_article_info(source, filename, group)
+            count = len(sources)
+        elif name == 'markdown-cold':
+            for source, _, _ in sources:
+                build.convert_markdown_to_html(source, use_cache=False)
+            count = len(sources)
+        elif name == 'markdown-warm':
+            for source, _, _ in sources:
+                build.convert_markdown_to_html(source)
+            count = len(sources)
+        else:
+            # build-noop 沿用上次的构建状态，其余各项重新渲染全部页面
+            build.build_with_templates(jobs=jobs, offline=True, full=name != 'build-noop',
+                                       stream=name == 'build-stream')
+            pages = Path("site/_site/articles/groups").glob("*/*.html")
+            count = sum(1 for page in pages if page.name != "index.html")
+    seconds = time.perf_counter() - start
+
+    rss = profiler.peak_rss_kb() or {}
+    return {
+        'name': name,
+        'seconds': round(seconds, 4),
+        'articles': count,
+        'articles_per_sec': round(count / seconds, 1) if seconds else None,
+        'peak_rss_mb': round(rss.get('self', 0) / 1024, 1),
+        'children_peak_rss_mb': round(rss.get('children', 0) / 1024, 1),
+        'subprocess_calls': profiler.counters.get('subprocess_calls', 0)
+    }
+
+def run_isolated(name, workspace, jobs):
+    """在独立子进程中执行测试，保证峰值内存互不影响"""
+    cmd = [sys.executable, str(Path(__file__).resolve()), '--run-one', name, '--jobs', str(jobs)]
+    result = subprocess.run(cmd, cwd=workspace, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{name} 失败:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def git_revision():
+    """当前构建脚本所在提交"""
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                            capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else None
+
+def print_results(results, baseline=None):
+    """打印结果表格，有基线时显示变化"""
+    base = {(r['name'], r.get('size')): r for r in (baseline or {}).get('results', [])}
+    labels = [f"{r['name']}/{r['size']}" if 'size' in r else r['name'] for r in results]
+    width = max([15] + [len(label) + 2 for label in labels])
+    print(f"\n{'测试':<{width}}{'耗时(s)':>10}{'篇/秒':>10}{'峰值MB':>9}{'子进程MB':>10}{'子进程':>8}")
+    for r, label in zip(results, labels):
+        line = (f"{label:<{width}}{r['seconds']:>10.3f}{r['articles_per_sec'] or 0:>10.1f}"
+                f"{r['peak_rss_mb']:>9.1f}{r['children_peak_rss_mb']:>10.1f}{r['subprocess_calls']:>8}")
+        old = base.get((r['name'], r.get('size')))
+        if old and old['seconds']:
+            line += f"   {(r['seconds'] / old['seconds'] - 1) * 100:+.1f}%"
+        print(line)
+
+def print_memory_curve(results, sizes):
+    """按文章数列出各项测试的峰值内存"""
+    peaks = {(r['name'], r['size']): r['peak_rss_mb'] for r in results}
+    names = list(dict.fromkeys(r['name'] for r in results))
+    print(f"\n峰值内存(MB)随文章数的变化\n{'测试':<15}" + ''.join(f"{size:>10}" for size in sizes))
+    for name in names:
+        print(f"{name:<15}" + ''.join(f"{peaks[name, size]:>10.1f}" for size in sizes))
+
+def article_counts(value):
+    """文章数量，可以逗号分隔多个"""
+    try:
+        counts = [int(part) for part in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的文章数量: {value}")
+    if not counts or min(counts) <= 0:
+        raise argparse.ArgumentTypeError(f"无效的文章数量: {value}")
+    return counts
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="构建性能基准测试")
+    parser.add_argument('--articles', type=article_counts, default=[500],
+                        help="文章数量，逗号分隔多个时依次测试（工作区为 --workspace 下的 articles-N）")
+    parser.add_argument('--groups', type=int, default=10, help="分组数量（另有根目录default分组）")
+    parser.add_argument('--code-blocks', type=int, default=3, help="每篇文章的代码块数量")
+    parser.add_argument('--tables', type=int, default=1, help="每篇文章的表格数量")
+    parser.add_argument('--paragraphs', type=int, default=8, help="每篇文章的段落数量")
+    parser.add_argument('--commits', type=int, default=3, help="提交次数（每次修改部分文章）")
+    parser.add_argument('--edit-ratio', type=float, default=0.5, help="后续每次提交修改的文章比例")
+    parser.add_argument('--cjk-ratio', type=float, default=0.6, help="中文段落所占比例")
+    parser.add_argument('--seed', type=int, default=57, help="随机种子")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="完整构建时的并行进程数")
+    parser.add_argument('--only', help=f"只运行部分测试，逗号分隔: {','.join(BENCHMARKS)}")
+    parser.add_argument('--workspace', default=".bench", help="工作区目录（默认 .bench）")
+    parser.add_argument('--json', metavar='PATH', help="把结果写入JSON文件")
+    parser.add_argument('--compare', metavar='PATH', help="与之前的JSON结果对比")
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """主函数"""
+    args = parse_args(argv)
+
+    if args.run_one:
+        print(json.dumps(run_benchmark(args.run_one, args.jobs)))
+        return True
+
+    params = {
+        'groups': args.groups,
+        'code_blocks': args.code_blocks,
+        'tables': args.tables,
+        'paragraphs': args.paragraphs,
+        'commits': args.commits,
+        'edit_ratio': args.edit_ratio,
+        'cjk_ratio': args.cjk_ratio,
+        'seed': args.seed
+    }
+    names = args.only.split(',') if args.only else BENCHMARKS
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        print(f"❌ 未知的测试: {', '.join(unknown)}")
+        return False
+
+    results = []
+    corpora = []
+    sizes = args.articles
+    for size in sizes:
+        corpus = dict(params, articles=size)
+        workspace = Path(args.workspace).resolve()
+        if len(sizes) > 1:
+            workspace = workspace / f"articles-{size}"
+        prepare_workspace(workspace, corpus)
+        corpora.append(corpus)
+        for name in names:
+            print(f"⏱ 运行: {name}" + (f"（{size} 篇）" if len(sizes) > 1 else ""))
+            result = run_isolated(name, workspace, args.jobs)
+            if len(sizes) > 1:
+                result['size'] = size
+            results.append(result)
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+    print_results(results, baseline)
+    if len(sizes) > 1:
+        print_memory_curve(results, sizes)
+
+    if args.json:
+        report = {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'jobs': args.jobs,
+            'corpus': corpora[0] if len(corpora) == 1 else corpora,
+            'results': results
+        }
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"\n✓ 写入结果: {args.json}")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -3,21 +3,98 @@
 构建网站
 """
 
+import io
 import os
 import re
+import posixpath
+import hashlib
 import shutil
-import requests
 import subprocess
 from pathlib import Path
 import sys
 import json
 import tempfile
-from datetime import datetime
-import markdown
-from jinja2 import Environment, FileSystemLoader
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from http_cache import cached_get_json
+from cache_files import write_atomic, file_entries, prune_lru
+from profiling import profiler
+from search_index import SearchIndex
+from site_index import SiteIndex
+import postprocess
+import images
+import backgrounds
+import avatars
+import related
+from build_state import BuildState
+
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_PROFILE_TTL = 3600
+
+def write_page(path, content):
+    """写入生成的页面"""
+    data = content.encode('utf-8')
+    path.write_bytes(data)
+    profiler.add('bytes_written', len(data))
+    profiler.add('pages_written')
+
+# 稳定模式（--stable-build-time）：页面的“最后更新于”取内容相关的日期，相同输入得到相同输出
+STABLE_BUILD_TIME = False
+_source_date = None
+
+def get_source_date():
+    """稳定模式下的基准日期：SOURCE_DATE_EPOCH，否则为站点仓库最近一次提交的日期"""
+    global _source_date
+    if _source_date is None:
+        timestamp = os.environ.get('SOURCE_DATE_EPOCH')
+        if not timestamp:
+            result = subprocess.run(['git', 'log', '-1', '--format=%ct'],
+                                    capture_output=True, text=True)
+            timestamp = result.stdout.strip() if result.returncode == 0 else ''
+        moment = datetime.fromtimestamp(int(timestamp), timezone.utc) if timestamp else datetime.now()
+        _source_date = moment.strftime('%Y-%m-%d')
+    return _source_date
+
+def get_build_time(dates=()):
+    """页面的“最后更新于”时间；稳定模式下取页面所含文章的最新日期"""
+    if not STABLE_BUILD_TIME:
+        return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return max(dates, default=None) or get_source_date()
+
+# 完整构建时的依赖图；为None时（serve模式）总是渲染
+BUILD_STATE = None
+
+# 只是入口、不参与生成页面的脚本
+ENTRY_SCRIPTS = {'serve.py', 'bench.py'}
+
+def generator_code_digests():
+    """参与生成的代码（scripts/ 下已导入的模块）-> 内容哈希，任何一个变化时全部重建"""
+    scripts_dir = Path(__file__).resolve().parent
+    files = {Path(module.__file__).resolve() for module in list(sys.modules.values())
+             if getattr(module, '__file__', None)}
+    return {
+        path.name: hashlib.sha256(path.read_bytes()).hexdigest()
+        for path in sorted(files)
+        if path.parent == scripts_dir and path.suffix == '.py' and path.name not in ENTRY_SCRIPTS
+    }
+
+def page_is_fresh(path, template_name, articles=(), config_keys=(), outputs=None, extra=None):
+    """页面的输入与上次构建相同时返回True，沿用上次输出的文件"""
+    if BUILD_STATE is None:
+        return False
+    return BUILD_STATE.check(path, template_name, articles, config_keys, outputs, extra)
+
+JINJA_CACHE_DIR = Path(".cache/jinja")
+
+def init_jinja(auto_reload=False):
+    """初始化Jinja2模板引擎（模板编译结果缓存在 .cache/jinja）
+
+    构建期间模板不会变化，默认不检查模板文件的修改时间；serve --watch 需要 auto_reload=True。
+    """
+    from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
 
-def init_jinja():
-    """初始化Jinja2模板引擎"""
     templates_dir = Path("templates")
     if not templates_dir.exists():
         templates_dir.mkdir(exist_ok=True)
@@ -27,6 +104,7 @@ def init_jinja():
         if not subdir_path.exists():
             subdir_path.mkdir(exist_ok=True)
             print(f"⚠ 创建模板子目录: templates/{subdir}/")
+    JINJA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
     env = Environment(
         loader=FileSystemLoader([
@@ -34,104 +112,158 @@ def init_jinja():
             str(templates_dir / "articles")
         ]),
         trim_blocks=True,
-        lstrip_blocks=True
+        lstrip_blocks=True,
+        auto_reload=auto_reload,
+        bytecode_cache=FileSystemBytecodeCache(str(JINJA_CACHE_DIR))
     )
+    env.globals['highlight_css'] = f"/{get_highlight_stylesheet()[0]}"
     return env
 
-def get_git_info(file_path):
-    """获取Git信息"""
-    try:
-        # 获取文件所在的Git仓库根目录
-        repo_root = file_path.parent
-
-        # 第一次提交的作者（原作者）
-        cmd = ['git', 'log', '--reverse', '--format=%an', '--', str(file_path.name)]
-        result = subprocess.run(cmd, cwd=repo_root, capture_output=True, text=True)
-        first_author_line = result.stdout.strip().split('\n')[0] if result.returncode == 0 and result.stdout.strip() else None
-        author_name = first_author_line if first_author_line else None
-
-        # 第一次提交的邮箱
-        cmd = ['git', 'log', '--reverse', '--format=%ae', '--', str(file_path.name)]
-        result = subprocess.run(cmd, cwd=repo_root, capture_output=True, text=True)
-        first_email_line = result.stdout.strip().split('\n')[0] if result.returncode == 0 and result.stdout.strip() else None
-        author_email = first_email_line if first_email_line else None
-
-        # 最后一次修改时间
-        cmd = ['git', 'log', '-1', '--format=%cd', '--date=short', '--', str(file_path.name)]
-        result = subprocess.run(cmd, cwd=repo_root, capture_output=True, text=True)
-        last_modified = result.stdout.strip() if result.returncode == 0 else datetime.now().strftime('%Y-%m-%d')
-
-        # 提交次数
-        cmd = ['git', 'log', '--oneline', '--', str(file_path.name)]
-        result = subprocess.run(cmd, cwd=repo_root, capture_output=True, text=True)
-        commit_count = len([line for line in result.stdout.strip().split('\n') if line])
-
-        # 获取作者头像URL
-        avatar_url = ''
-        if author_name:
-            avatar_url = f"https://avatars.githubusercontent.com/{author_name}"
-
-        print()
-        print(f"{file_path} 的统计信息")
-        print(f"lastModified: {last_modified}")
-        print(f"commitCount: {commit_count}")
-        print(f"author: {author_name}")
-        print(f"author_email: {author_email}")
-        print(f"avatar_url: {avatar_url}")
-        print("============")
+def build_git_index(repo_dir, ref='HEAD'):
+    """一次遍历Git历史，建立 文件路径 -> Git信息 的索引"""
+    cmd = [
+        'git', '-c', 'core.quotePath=false', 'log', '-M', '--name-status',
+        '--date=short', '--format=%x1e%an%x09%ae%x09%cd', ref, '--'
+    ]
+    index = {}
+    # 重命名前的旧路径 -> 当前路径
+    aliases = {}
+    # 已经追溯到创建提交的路径，更早的同名历史不再计入
+    closed = set()
+    commit = None
+
+    proc = subprocess.Popen(cmd, cwd=repo_dir, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True,
+                            encoding='utf-8', errors='replace')
+    for line in proc.stdout:
+        line = line.rstrip('\n')
+        if line.startswith('\x1e'):
+            commit = line[1:].split('\t')
+            continue
+        if not line or commit is None:
+            continue
 
+        parts = line.split('\t')
+        status = parts[0][:1]
+        path = parts[-1]
+        key = aliases.get(path, path)
+        if key in closed:
+            continue
+
+        entry = index.get(key)
+        if entry is None:
+            # git log 从新到旧输出，第一次遇到即最后修改
+            entry = index[key] = {'lastModified': commit[2], 'commitCount': 0}
+        entry['commitCount'] += 1
+        # 不断覆盖，最终保留最早一次提交的作者
+        entry['author'] = commit[0]
+        entry['author_email'] = commit[1]
+
+        if status == 'R' and len(parts) == 3:
+            aliases[parts[1]] = key
+        elif status == 'A':
+            closed.add(key)
+    proc.wait()
+
+    if proc.returncode != 0:
+        print(f"⚠ 读取Git历史失败 (exit {proc.returncode})")
+    return index
+
+def get_git_info(git_index, rel_path):
+    """从Git索引中获取文件的Git信息"""
+    entry = git_index.get(rel_path)
+    if entry is None:
         return {
-            'lastModified': last_modified,
-            'commitCount': commit_count,
-            'author': author_name or 'Unknown',
-            'author_email': author_email,
-            'avatar_url': avatar_url
-        }
-    except Exception as e:
-        print(f"⚠ 获取Git信息失败: {e}")
-        return {
-            'lastModified': datetime.now().strftime('%Y-%m-%d'),
+            'lastModified': get_build_time()[:10],
             'commitCount': 1,
             'author': 'Unknown',
-            'author_email': None,
-            'avatar_url': ''
+            'author_email': None
         }
 
+    # 作者头像在读取全部文章后统一获取（见 process_avatars）
+    return {
+        'lastModified': entry['lastModified'],
+        'commitCount': entry['commitCount'],
+        'author': entry['author'] or 'Unknown',
+        'author_email': entry['author_email'] or None
+    }
+
+HR_RE = re.compile(r'^[-*_]{3,}$')
+LINK_RE = re.compile(r'\[([^\]]+)\]\([^)]+\)')
+BOLD_RE = re.compile(r'\*\*([^*]+)\*\*')
+ITALIC_RE = re.compile(r'\*([^*]+)\*')
+CODE_RE = re.compile(r'`([^`]+)`')
+# 英文按单词计，中日文每个字计一次；链接地址和HTML标签不计入字数
+LATIN_WORD_RE = re.compile(r"[0-9A-Za-z\u00c0-\u024f][0-9A-Za-z\u00c0-\u024f'\u2019.\-]*")
+CJK_CHAR_RE = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]')
+NOT_COUNTED_RE = re.compile(r'\]\([^)\n]*\)|</?[A-Za-z][^>\n]*>')
+WORDS_PER_MINUTE = 200
+CJK_CHARS_PER_MINUTE = 400
+
+def count_matches(pattern, text, pos=0, endpos=sys.maxsize):
+    """text[pos:endpos] 中的匹配数，逐个匹配计数，不生成匹配列表"""
+    return sum(1 for _ in pattern.finditer(text, pos, endpos))
+
+def count_words(text, pos=0):
+    """返回 text[pos:] 的 (英文单词数, 中日文字数)，不复制文本"""
+    words = count_matches(LATIN_WORD_RE, text, pos)
+    cjk = count_matches(CJK_CHAR_RE, text, pos)
+    if text.find('](', pos) != -1 or text.find('<', pos) != -1:
+        for skipped in NOT_COUNTED_RE.finditer(text, pos):
+            words -= count_matches(LATIN_WORD_RE, text, skipped.start(), skipped.end())
+            cjk -= count_matches(CJK_CHAR_RE, text, skipped.start(), skipped.end())
+    return words, cjk
+
+def clean_description(line):
+    """去掉链接、粗体、斜体和行内代码标记，截取前150个字符"""
+    clean = LINK_RE.sub(r'\1', line)
+    clean = BOLD_RE.sub(r'\1', clean)
+    clean = ITALIC_RE.sub(r'\1', clean)
+    clean = CODE_RE.sub(r'\1', clean)
+    return clean[:150] + '...' if len(clean) > 150 else clean
+
 def extract_article_info(md_content, filename, group_name):
-    """提取文章信息"""
-    lines = md_content.strip().split('\n')
+    """一次遍历提取文章信息（标题、描述、字数、阅读时间）
 
-    # 提取标题
-    title = Path(filename).stem
+    md_content 可以是完整文本，也可以是逐行产生文本的迭代器（例如打开的文件）。
+    """
+    text = md_content if isinstance(md_content, str) else None
+    lines = io.StringIO(text) if text is not None else md_content
+
+    title = None
+    description = None
+    words = cjk = 0
+    started = False
     for line in lines:
-        if line.startswith('# '):
+        line = line.rstrip('\r\n')
+        if not started:
+            # 与原先对全文strip()的行为一致：忽略开头的空行和缩进
+            if not line.strip():
+                continue
+            line = line.lstrip()
+            started = True
+
+        if title is None and line.startswith('# '):
             title = line[2:].strip()
+        if description is None:
+            stripped = line.strip()
+            if stripped and not stripped.startswith(('#', '![')) and not HR_RE.match(stripped):
+                description = clean_description(stripped)
+
+        line_words, line_cjk = count_words(line)
+        words += line_words
+        cjk += line_cjk
+
+        if text is not None and title is not None and description is not None:
+            # 标题和描述都已找到，剩余部分在原文上直接计数
+            rest_words, rest_cjk = count_words(text, lines.tell())
+            words += rest_words
+            cjk += rest_cjk
             break
 
-    # 提取描述
-    description = ''
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        if line.startswith('#') or line.startswith('!['):
-            continue
-        if re.match(r'^[-*_]{3,}$', line):
-            continue
-
-        clean = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', line)
-        clean = re.sub(r'\*\*([^*]+)\*\*', r'\1', clean)
-        clean = re.sub(r'\*([^*]+)\*', r'\1', clean)
-        clean = re.sub(r'`([^`]+)`', r'\1', clean)
-
-        description = clean[:150]
-        if len(clean) > 150:
-            description += '...'
-        break
-
-    # 计算字数
-    clean_content = md_content.replace('#', '').replace('*', '').replace('`', '').strip()
-    word_count = len(clean_content.split())
+    title = title or Path(filename).stem
+    word_count = words + cjk
+    reading_time = round(words / WORDS_PER_MINUTE + cjk / CJK_CHARS_PER_MINUTE)
 
     return {
         'filename': filename,
@@ -139,118 +271,412 @@ def extract_article_info(md_content, filename, group_name):
         'title': title,
         'description': description or title,
         'word_count': word_count,
-        'reading_time': max(1, word_count // 300),
+        'reading_time': max(1, reading_time),
         'group': group_name,
         'avatar_url': '',
         'author_email': ''
     }
 
-def convert_markdown_to_html(content):
-    """转换Markdown为HTML"""
-    md_extensions = [
-        'markdown.extensions.extra',
-        'markdown.extensions.codehilite',
-        'markdown.extensions.tables',
-        'markdown.extensions.toc'
-    ]
-    return markdown.markdown(content, extensions=md_extensions)
-
-def fetch_articles():
-    """从Git拉取文章"""
-    temp_dir = tempfile.mkdtemp(prefix="articles_")
+MD_EXTENSIONS = [
+    'markdown.extensions.extra',
+    'markdown.extensions.codehilite',
+    'markdown.extensions.tables',
+    'markdown.extensions.toc'
+]
+MD_EXTENSION_CONFIGS = {
+    'markdown.extensions.codehilite': {'css_class': 'codehilite'}
+}
+
+# 构建时代码高亮样式（与原先highlight.js的github-dark主题一致）
+HIGHLIGHT_STYLE = 'github-dark'
+
+RENDER_CACHE_DIR = Path(".cache/render")
+RENDER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_md_converter = None
+_render_fingerprint = None
+
+def get_markdown_converter():
+    """获取当前进程复用的Markdown转换器"""
+    global _md_converter
+    if _md_converter is None:
+        import markdown
+        _md_converter = markdown.Markdown(
+            extensions=MD_EXTENSIONS,
+            extension_configs=MD_EXTENSION_CONFIGS
+        )
+    return _md_converter
+
+def get_render_fingerprint():
+    """渲染配置指纹，扩展或Pygments版本变化时缓存自动失效"""
+    global _render_fingerprint
+    if _render_fingerprint is None:
+        import markdown
+        import pygments
+        _render_fingerprint = json.dumps({
+            'extensions': MD_EXTENSIONS,
+            'configs': MD_EXTENSION_CONFIGS,
+            'markdown': markdown.__version__,
+            'pygments': pygments.__version__
+        }, sort_keys=True)
+    return _render_fingerprint
+
+HIGHLIGHT_CACHE_DIR = Path(".cache/highlight")
+_highlight_stylesheet = None
+
+def get_highlight_stylesheet():
+    """生成Pygments代码高亮样式表，返回 (带内容哈希的文件名, 内容)"""
+    global _highlight_stylesheet
+    if _highlight_stylesheet is None:
+        import pygments
+        selector = '.' + MD_EXTENSION_CONFIGS['markdown.extensions.codehilite']['css_class']
+        # 导入pygments.formatters较慢，生成结果按版本和样式缓存
+        cache_file = HIGHLIGHT_CACHE_DIR / f"{HIGHLIGHT_STYLE}-{selector[1:]}-{pygments.__version__}.css"
+        try:
+            data = cache_file.read_bytes()
+        except OSError:
+            data = render_highlight_stylesheet(selector)
+            try:
+                write_atomic(cache_file, data)
+            except OSError:
+                pass
+
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        _highlight_stylesheet = (f"highlight.{digest}.css", data)
+    return _highlight_stylesheet
+
+def render_highlight_stylesheet(selector):
+    """用Pygments生成样式表内容"""
+    from pygments.formatters import HtmlFormatter
+    from pygments.token import Token
+
+    # 背景沿用style.css中代码块的半透明背景，这里只输出文字颜色
+    formatter = HtmlFormatter(style=HIGHLIGHT_STYLE, nobackground=True)
+    rules = formatter.get_background_style_defs(selector)
+    text_color = formatter.style.styles.get(Token)
+    if text_color:
+        rules.append(f"{selector} {{ color: {text_color} }}")
+    rules.extend(formatter.get_token_style_defs(selector))
+    return ("\n".join(rules) + "\n").encode('utf-8')
+
+def convert_markdown_to_html(content, use_cache=True):
+    """转换Markdown为HTML（按内容哈希缓存）"""
+    cache_file = None
+    if use_cache:
+        digest = hashlib.sha256(get_render_fingerprint().encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content.encode('utf-8'))
+        key = digest.hexdigest()
+        cache_file = RENDER_CACHE_DIR / key[:2] / f"{key}.html"
+        try:
+            data = cache_file.read_bytes()
+            # 刷新mtime，淘汰时按最近使用排序
+            os.utime(cache_file)
+            profiler.add('render_cache_hits')
+            profiler.add('bytes_read', len(data))
+            return data.decode('utf-8')
+        except OSError:
+            pass
+
+    md = get_markdown_converter()
+    md.reset()
+    html = md.convert(content)
+    profiler.add('render_cache_misses')
+
+    if cache_file is not None:
+        try:
+            write_atomic(cache_file, html)
+        except OSError as e:
+            print(f"⚠ 写入渲染缓存失败: {e}")
+    return html
+
+def prune_render_cache(max_bytes=RENDER_CACHE_MAX_BYTES):
+    """按最近使用时间淘汰渲染缓存，使总大小不超过上限"""
+    if not RENDER_CACHE_DIR.exists():
+        return 0
+    return prune_lru(file_entries(RENDER_CACHE_DIR.glob("*/*.html")), max_bytes)
+
+ARTICLES_REFS = ['refs/heads/articles', 'refs/remotes/origin/articles']
+
+class GitBlobReader:
+    """通过常驻的 git cat-file --batch 进程读取Git对象"""
+
+    def __init__(self, repo_dir="."):
+        self.proc = subprocess.Popen(
+            ['git', 'cat-file', '--batch'], cwd=repo_dir,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+
+    def read(self, oid):
+        """读取对象内容（bytes）"""
+        self.proc.stdin.write(oid.encode('ascii') + b'\n')
+        self.proc.stdin.flush()
+        header = self.proc.stdout.readline().split()
+        if len(header) != 3:
+            raise KeyError(f"Git对象不存在: {oid}")
+        size = int(header[2])
+        data = self.proc.stdout.read(size)
+        # 每个对象后跟一个换行
+        self.proc.stdout.read(1)
+        return data
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ArticleSource:
+    """流式构建时按需读取文章源文本：Git仓库中的blob，或本地目录中的文件
+
+    只保存仓库位置，可以传给进程池，每个进程各自打开读取器。
+    """
+
+    def __init__(self, repo_dir=None, articles_dir=None, temp_dir=None):
+        self.repo_dir = repo_dir
+        self.articles_dir = articles_dir
+        # 临时克隆的仓库，渲染完成后由 close() 删除
+        self.temp_dir = temp_dir
+        self._reader = None
+
+    def __getstate__(self):
+        return {'repo_dir': self.repo_dir, 'articles_dir': self.articles_dir,
+                'temp_dir': None, '_reader': None}
+
+    def read(self, article):
+        if self.articles_dir is not None:
+            data = (Path(self.articles_dir) / article['path']).read_bytes()
+        else:
+            if self._reader is None:
+                self._reader = GitBlobReader(self.repo_dir)
+            data = self._reader.read(article['blob'])
+        profiler.add('bytes_read', len(data))
+        return data.decode('utf-8')
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self.temp_dir and Path(self.temp_dir).exists():
+            shutil.rmtree(self.temp_dir)
+
+# 流式构建时文章不保留源文本，渲染时从这里读取
+ARTICLE_SOURCE = None
+
+def resolve_articles_ref(repo_dir="."):
+    """在本地仓库中查找articles分支，找不到返回None"""
+    for ref in ARTICLES_REFS:
+        cmd = ['git', 'rev-parse', '--verify', '--quiet', f'{ref}^{{commit}}']
+        result = subprocess.run(cmd, cwd=repo_dir, capture_output=True, text=True)
+        if result.returncode == 0:
+            return ref
+    return None
+
+def list_article_blobs(repo_dir, ref, image_blobs=None):
+    """列出分支中的文章，返回 [(分组, 文件名, 路径, blob id)]
+
+    传入 image_blobs 时，同时把分支中的图片记录为 {路径: blob id}。
+    """
+    cmd = ['git', 'ls-tree', '-r', '-z', '--full-tree', ref]
+    result = subprocess.run(cmd, cwd=repo_dir, capture_output=True, check=True)
+
+    root_blobs = []
+    group_blobs = []
+    for entry in result.stdout.decode('utf-8', errors='replace').split('\0'):
+        if not entry:
+            continue
+        meta, path = entry.split('\t', 1)
+        _, obj_type, oid = meta.split()
+        if obj_type != 'blob':
+            continue
+        if not path.endswith('.md'):
+            if image_blobs is not None and posixpath.splitext(path)[1].lower() in images.IMAGE_SUFFIXES:
+                image_blobs[path] = oid
+            continue
 
+        parts = path.split('/')
+        # 根目录的文章归default分组，只识别一层分组目录
+        if len(parts) == 1:
+            root_blobs.append(("default", parts[0], path, oid))
+        elif len(parts) == 2 and not parts[0].startswith('.'):
+            group_blobs.append((parts[0], parts[1], path, oid))
+    return root_blobs + group_blobs
+
+def clone_articles(temp_dir):
+    """本地没有articles分支时，从远程克隆（只取对象，不检出工作区）"""
+    cmd = ['git', 'config', '--get', 'remote.origin.url']
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    repo_url = result.stdout.strip() if result.returncode == 0 else "."
+
+    # 需要完整历史才能统计提交次数和作者
+    cmd = ['git', 'clone', '--bare', '-b', 'articles', '--single-branch', repo_url, temp_dir]
+    subprocess.run(cmd, check=True)
+
+def make_article(content, filename, group_name, path, git_index, search_index=None,
+                 image_pipeline=None, blob=None, related_index=None):
+    """由源文本和Git信息构造文章数据，同时加入搜索索引和相关文章索引、登记引用的图片
+
+    传入 blob（内容的Git对象id）时为流式构建：不保留源文本，渲染时再从 ARTICLE_SOURCE 读取。
+    """
+    with profiler.span("extract_article_info", cat='step'):
+        info = extract_article_info(content, filename, group_name)
+
+    git_info = get_git_info(git_index, path)
+    info['date'] = git_info['lastModified']
+    info['commit_count'] = git_info['commitCount']
+    info['author'] = git_info['author']
+    info['author_email'] = git_info['author_email']
+    info['path'] = path
+    if blob is None:
+        # 保留源文本供渲染使用，不再落盘
+        info['source'] = content
+    else:
+        # 同时作为文章内容的哈希，供增量构建判断是否变化
+        info['blob'] = blob
+
+    if search_index is not None:
+        with profiler.span("search_index", cat='step'):
+            search_index.add_document(path, content, [
+                info['title'],
+                f"/articles/groups/{group_name}/{info['html_name']}",
+                group_name,
+                info['date']
+            ])
+
+    if related_index is not None:
+        with profiler.span("related_signature", cat='step'):
+            related_index.add_document(path, content)
+
+    if image_pipeline is not None:
+        with profiler.span("images", cat='step'):
+            info['image_refs'] = image_pipeline.add_article(path, content)
+    return info
+
+def list_article_files(articles_dir):
+    """列出本地目录中的文章，返回 [(分组, 文件名, 路径)]"""
+    articles_dir = Path(articles_dir)
+    files = [("default", md_file.name, md_file.name)
+             for md_file in sorted(articles_dir.glob("*.md"))]
+    for group_dir in sorted(articles_dir.iterdir()):
+        if group_dir.is_dir() and not group_dir.name.startswith('.'):
+            for md_file in sorted(group_dir.glob("*.md")):
+                files.append((group_dir.name, md_file.name, f"{group_dir.name}/{md_file.name}"))
+    return files
+
+def load_articles_from_dir(articles_dir, search_index=None, image_pipeline=None, stream=False,
+                           related_index=None):
+    """从本地目录（例如articles分支的worktree）读取文章"""
+    global ARTICLE_SOURCE
     try:
-        # 获取远程URL
-        cmd = ['git', 'config', '--get', 'remote.origin.url']
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        repo_url = result.stdout.strip() if result.returncode == 0 else "."
+        articles_dir = Path(articles_dir)
+        if stream:
+            ARTICLE_SOURCE = ArticleSource(articles_dir=articles_dir)
+        print(f"📥 从本地目录读取文章: {articles_dir}")
+        if image_pipeline is not None:
+            image_pipeline.source = images.DirImageSource(articles_dir)
+
+        git_index = {}
+        if (articles_dir / ".git").exists():
+            with profiler.span("build_git_index", cat='step'):
+                git_index = build_git_index(articles_dir)
+            print(f"✓ 索引完成: {len(git_index)} 个文件")
+
+        all_articles = []
+        for group_name, filename, path in list_article_files(articles_dir):
+            data = (articles_dir / path).read_bytes()
+            profiler.add('bytes_read', len(data))
+            blob = images.git_blob_hash(data) if stream else None
+            all_articles.append(make_article(data.decode('utf-8'), filename, group_name,
+                                             path, git_index, search_index, image_pipeline, blob,
+                                             related_index))
+
+        site_index = SiteIndex(all_articles)
+        print(f"✓ 读取完成: {len(site_index)} 篇文章，{len(site_index.groups)} 个分组")
+        return all_articles, site_index
+
+    except Exception as e:
+        print(f"✗ 读取失败: {e}")
+        return [], SiteIndex()
+
+def fetch_articles(articles_dir=None, search_index=None, image_pipeline=None, stream=False,
+                   related_index=None):
+    """从Git读取文章，指定articles_dir时从本地目录读取，返回 (文章列表, 站点索引)
 
-        # 克隆articles分支
-        print("📥 从Git拉取文章...")
-        cmd = ['git', 'clone', '-b', 'articles', '--depth', '1', repo_url, temp_dir]
-        subprocess.run(cmd, check=True)
+    stream 为True时文章只保留元数据，并设置 ARTICLE_SOURCE 供渲染时读取源文本；
+    临时克隆的仓库要等渲染完成后由 ARTICLE_SOURCE.close() 删除。
+    """
+    global ARTICLE_SOURCE
+    if articles_dir:
+        return load_articles_from_dir(articles_dir, search_index, image_pipeline, stream,
+                                      related_index)
+
+    temp_dir = None
+
+    try:
+        repo_dir = "."
+        ref = resolve_articles_ref()
+        if ref:
+            print(f"📥 从本地分支读取文章: {ref}")
+        else:
+            print("📥 本地没有articles分支，从Git拉取文章...")
+            temp_dir = tempfile.mkdtemp(prefix="articles_")
+            with profiler.span("clone_articles", cat='step'):
+                clone_articles(temp_dir)
+            repo_dir = temp_dir
+            ref = 'HEAD'
+
+        print("📜 建立Git历史索引...")
+        with profiler.span("build_git_index", cat='step'):
+            git_index = build_git_index(repo_dir, ref)
+        print(f"✓ 索引完成: {len(git_index)} 个文件")
+
+        if stream:
+            ARTICLE_SOURCE = ArticleSource(repo_dir=repo_dir, temp_dir=temp_dir)
+            temp_dir = None
 
         all_articles = []
-        articles_by_group = {}
-
-        temp_path = Path(temp_dir)
-
-        # 处理默认分组（根目录）
-        for md_file in temp_path.glob("*.md"):
-            content = md_file.read_text(encoding='utf-8')
-            info = extract_article_info(content, md_file.name, "default")
-
-            git_info = get_git_info(md_file)
-            info.update(git_info)
-            info['date'] = git_info['lastModified']
-            info['commit_count'] = git_info['commitCount']
-            info['author'] = git_info['author']
-            info['avatar_url'] = git_info.get('avatar_url', '')
-            info['author_email'] = git_info.get('author_email', '')
-
-            all_articles.append(info)
-            if "default" not in articles_by_group:
-                articles_by_group["default"] = []
-            articles_by_group["default"].append(info)
-
-        # 处理分组目录
-        for item in temp_path.iterdir():
-            if item.is_dir() and not item.name.startswith('.'):
-                group_name = item.name
-                for md_file in item.glob("*.md"):
-                    content = md_file.read_text(encoding='utf-8')
-                    info = extract_article_info(content, md_file.name, group_name)
-
-                    git_info = get_git_info(md_file)
-                    info.update(git_info)
-                    info['date'] = git_info['lastModified']
-                    info['commit_count'] = git_info['commitCount']
-                    info['author'] = git_info['author']
-                    info['avatar_url'] = git_info.get('avatar_url', '')
-                    info['author_email'] = git_info.get('author_email', '')
-
-                    all_articles.append(info)
-                    if group_name not in articles_by_group:
-                        articles_by_group[group_name] = []
-                    articles_by_group[group_name].append(info)
-
-        # 按时间排序
-        for group in articles_by_group.values():
-            group.sort(key=lambda x: x['date'], reverse=True)
-        all_articles.sort(key=lambda x: x['date'], reverse=True)
-
-        # 保存原始文件
-        temp_save = Path("temp_articles")
-        if temp_save.exists():
-            shutil.rmtree(temp_save)
-        shutil.copytree(temp_dir, temp_save)
-
-        # 将根目录的.md文件移动到default文件夹
-        default_dir = temp_save / "default"
-        default_dir.mkdir(exist_ok=True)
-
-        # 移动根目录的.md文件到default文件夹
-        for md_file in temp_save.glob("*.md"):
-            if md_file.is_file():
-                target_path = default_dir / md_file.name
-                shutil.move(str(md_file), str(target_path))
-                print(f"📁 移动文件: {md_file.name} -> default/")
-
-        shutil.rmtree(temp_dir)
-
-        print(f"✓ 拉取完成: {len(all_articles)} 篇文章，{len(articles_by_group)} 个分组")
-        return all_articles, articles_by_group
+        image_blobs = {}
+        with GitBlobReader(repo_dir) as reader:
+            if image_pipeline is not None:
+                image_pipeline.source = images.GitImageSource(image_blobs, reader)
+            for group_name, filename, path, oid in list_article_blobs(repo_dir, ref, image_blobs):
+                data = reader.read(oid)
+                profiler.add('bytes_read', len(data))
+                all_articles.append(make_article(data.decode('utf-8'), filename, group_name,
+                                                 path, git_index, search_index, image_pipeline,
+                                                 oid if stream else None, related_index))
+            if image_pipeline is not None:
+                image_pipeline.source = None
+
+        site_index = SiteIndex(all_articles)
+        print(f"✓ 拉取完成: {len(site_index)} 篇文章，{len(site_index.groups)} 个分组")
+        return all_articles, site_index
 
     except Exception as e:
         print(f"✗ 拉取失败: {e}")
-        if Path(temp_dir).exists():
+        return [], SiteIndex()
+
+    finally:
+        if temp_dir and Path(temp_dir).exists():
             shutil.rmtree(temp_dir)
-        return [], {}
 
 def generate_home_page(env, config, build_dir):
     """生成主页"""
     try:
+        # 稳定模式下页脚的日期取 get_source_date()，也是页面的输入
+        if page_is_fresh(build_dir / "index.html", "index.html",
+                         config_keys=('site', 'buttons', 'socialLinks', 'background', 'styles'),
+                         extra=get_source_date() if STABLE_BUILD_TIME else None):
+            print("✓ 未变化: /index.html")
+            return True
+
         template = env.get_template("index.html")
+        build_time = get_build_time()
 
         context = {
             'site': config['site'],
@@ -259,12 +685,12 @@ def generate_home_page(env, config, build_dir):
             'background': config['background'],
             'styles': config['styles'],
             'title': config['site']['title'],
-            'current_year': datetime.now().year,
-            'build_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            'current_year': int(build_time[:4]),
+            'build_time': build_time
         }
 
         content = template.render(**context)
-        (build_dir / "index.html").write_text(content, encoding='utf-8')
+        write_page(build_dir / "index.html", content)
         print("✓ 生成: /index.html")
         return True
 
@@ -274,153 +700,603 @@ def generate_home_page(env, config, build_dir):
         traceback.print_exc()
         return False
 
-def generate_all_groups_page(env, groups_info, build_dir):
-    """生成所有分组页面"""
-    try:
-        template = env.get_template("all_groups.html")
+PAGE_SIZE_DEFAULTS = {
+    'articlesPerPage': 20,
+    'groupsPerPage': 30,
+    'groupArticlesPerPage': 20
+}
+
+def get_page_sizes(config):
+    """读取分页配置，0 表示不分页"""
+    return {**PAGE_SIZE_DEFAULTS, **config.get('pagination', {})}
+
+PREFETCH_DEFAULTS = {
+    # 文章页预取上一篇和下一篇
+    'neighbours': True,
+    # 列表页预取每页靠前的几项，0 表示不预取
+    'listingItems': 4,
+    # 文章页之间点击时只替换正文（/nav.js + 分组的 nav.json）
+    'instantNavigation': True
+}
+NAV_MANIFEST_NAME = "nav.json"
+
+def get_prefetch_settings(config):
+    """读取预取和即时跳转配置"""
+    return {**PREFETCH_DEFAULTS, **config.get('build', {}).get('prefetch', {})}
+
+def write_nav_manifest(group, group_dir):
+    """写出分组的导航清单：文章按上一篇/下一篇的顺序排列，客户端据此预取相邻文章"""
+    manifest = {
+        'base': group.url,
+        'pages': [entry.html_name for entry in group.entries]
+    }
+    group_dir.mkdir(parents=True, exist_ok=True)
+    write_page(group_dir / NAV_MANIFEST_NAME,
+               json.dumps(manifest, ensure_ascii=False, separators=(',', ':')))
+
+def paginate(items, per_page):
+    """把列表切分成若干页，至少返回一页"""
+    if not per_page or per_page <= 0:
+        return [items]
+    pages = [items[i:i + per_page] for i in range(0, len(items), per_page)]
+    return pages or [items]
+
+def page_url(base_url, page):
+    """第1页使用列表本身的地址，之后为 page/N/"""
+    return base_url if page == 1 else f"{base_url}page/{page}/"
+
+def pagination_context(base_url, page, pages, total):
+    """模板和清单使用的分页信息"""
+    return {
+        'page': page,
+        'pages': pages,
+        'total': total,
+        'url': page_url(base_url, page),
+        'prev_url': page_url(base_url, page - 1) if page > 1 else None,
+        'next_url': page_url(base_url, page + 1) if page < pages else None,
+        'manifest_url': page_url(base_url, page) + "index.json",
+        'prev_manifest_url': page_url(base_url, page - 1) + "index.json" if page > 1 else None,
+        'next_manifest_url': page_url(base_url, page + 1) + "index.json" if page < pages else None
+    }
 
-        # 计算统计数据
-        total_articles = sum(info['count'] for info in groups_info.values())
-        total_words = sum(info['total_words'] for info in groups_info.values())
-        total_reading_time = sum(info['total_reading_time'] for info in groups_info.values())
+def write_listing_page(env, template_name, context, pagination, records, base_dir,
+                       articles='*', config_keys=(), extra=None):
+    """写入一页列表及其JSON清单，输入没有变化时跳过并返回False
 
-        # 获取最近更新的文章（前5篇）
-        all_articles = []
-        for group_name, info in groups_info.items():
-            all_articles.extend(info['articles'])
-        all_articles.sort(key=lambda x: x['date'], reverse=True)
-        recent_articles = all_articles[:5]
+    页面的输入为 articles 中的文章、config_keys 和分页信息；extra 为页面用到的其他数据。
+    """
+    out_dir = base_dir if pagination['page'] == 1 else base_dir / "page" / str(pagination['page'])
+    if page_is_fresh(out_dir / "index.html", template_name, articles, config_keys,
+                     outputs=[out_dir / "index.html", out_dir / "index.json"],
+                     extra=pagination if extra is None else [pagination, extra]):
+        return False
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    template = env.get_template(template_name)
+    write_page(out_dir / "index.html", template.render(pagination=pagination, **context))
+
+    manifest = {
+        'page': pagination['page'],
+        'pages': pagination['pages'],
+        'total': pagination['total'],
+        'prev': pagination['prev_manifest_url'],
+        'next': pagination['next_manifest_url'],
+        'items': records
+    }
+    write_page(out_dir / "index.json",
+               json.dumps(manifest, ensure_ascii=False, separators=(',', ':')))
+    return True
 
-        context = {
-            'title': '所有分组',
-            'groups': groups_info,
-            'total_articles': total_articles,
-            'total_words': total_words,
-            'total_reading_time': total_reading_time,
-            'recent_articles': recent_articles,
-            'current_year': datetime.now().year,
-            'build_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+def listing_summary(pages, written):
+    """列表页数及其中未变化的页数"""
+    if written == pages:
+        return f"{pages} 页"
+    return f"{pages} 页，其中 {pages - written} 页未变化"
 
-        content = template.render(**context)
+def generate_all_groups_page(env, site_index, build_dir, per_page=0, prefetch=0):
+    """生成所有分组页面"""
+    try:
+        groups = site_index.groups
+        build_time = get_build_time([site_index.all.latest_date])
 
         groups_dir = build_dir / "articles" / "groups"
-        groups_dir.mkdir(parents=True, exist_ok=True)
+        pages = paginate(list(groups.items()), per_page)
+        if len(pages) > 1 and 'page' in groups:
+            print("⚠ 存在名为 page 的分组，会与分组列表的分页地址冲突")
+
+        written = 0
+        for n, items in enumerate(pages, 1):
+            pagination = pagination_context("/articles/groups/", n, len(pages), len(groups))
+            context = {
+                'title': '所有分组' if n == 1 else f'所有分组 - 第 {n} 页',
+                'groups': dict(items),
+                'group_count': len(groups),
+                'total_articles': site_index.all.count,
+                'total_words': site_index.all.total_words,
+                'total_reading_time': site_index.all.total_reading_time,
+                # 最近更新的文章（前5篇）
+                'recent_articles': site_index.recent(5),
+                'prefetch_urls': [group.url for _, group in items[:prefetch]],
+                'current_year': int(build_time[:4]),
+                'build_time': build_time
+            }
+            records = [group.record() for _, group in items]
+            written += write_listing_page(env, "all_groups.html", context, pagination, records, groups_dir,
+                               config_keys=('pagination.groupsPerPage', 'build.prefetch'))
 
-        (groups_dir / "index.html").write_text(content, encoding='utf-8')
-        print("✓ 生成: /articles/groups/index.html")
+        print(f"✓ 生成: /articles/groups/index.html（{listing_summary(len(pages), written)}）")
         return True
 
     except Exception as e:
         print(f"✗ 生成所有分组页面失败: {e}")
         return False
 
-def generate_all_articles_page(env, all_articles, groups_info, build_dir):
+def generate_all_articles_page(env, site_index, build_dir, per_page=0, prefetch=0):
     """生成所有文章页面"""
     try:
-        template = env.get_template("all_articles.html")
+        all_view = site_index.all
+        build_time = get_build_time([all_view.latest_date])
 
-        # 计算统计数据
-        total_words = sum(a['word_count'] for a in all_articles)
-        total_reading_time = sum(a['reading_time'] for a in all_articles)
+        articles_dir = build_dir / "articles"
+        pages = paginate(all_view.entries, per_page)
 
-        context = {
-            'title': '所有文章',
-            'all_articles': all_articles,
-            'groups_info': groups_info,
-            'total_articles': len(all_articles),
-            'total_words': total_words,
-            'total_reading_time': total_reading_time,
-            'group_count': len(groups_info),
-            'current_year': datetime.now().year,
-            'build_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        written = 0
+        for n, items in enumerate(pages, 1):
+            pagination = pagination_context("/articles/", n, len(pages), all_view.count)
+            context = {
+                'title': '所有文章' if n == 1 else f'所有文章 - 第 {n} 页',
+                'all_articles': items,
+                'groups_info': site_index.groups,
+                'total_articles': all_view.count,
+                'total_words': all_view.total_words,
+                'total_reading_time': all_view.total_reading_time,
+                'group_count': len(site_index.groups),
+                'prefetch_urls': [entry.url for entry in items[:prefetch]],
+                'current_year': int(build_time[:4]),
+                'build_time': build_time
+            }
+            records = [entry.record() for entry in items]
+            written += write_listing_page(env, "all_articles.html", context, pagination, records, articles_dir,
+                               config_keys=('pagination.articlesPerPage', 'build.prefetch'))
 
-        content = template.render(**context)
+        print(f"✓ 生成: /articles/index.html（{listing_summary(len(pages), written)}）")
+        return True
 
-        articles_dir = build_dir / "articles"
-        articles_dir.mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        print(f"✗ 生成所有文章页面失败: {e}")
+        return False
 
-        (articles_dir / "index.html").write_text(content, encoding='utf-8')
-        print("✓ 生成: /articles/index.html")
+def generate_archive_listing(env, year, month, entries, months, archive_dir, per_page=0,
+                             prefetch=0):
+    """生成某年（month为None）或某月的归档列表，返回 (页数, 写入的页数)"""
+    label = f"{year}年" if month is None else f"{year}年{int(month)}月"
+    base_url = f"/articles/archive/{year}/" if month is None else f"/articles/archive/{year}/{month}/"
+    out_dir = archive_dir / year if month is None else archive_dir / year / month
+    build_time = get_build_time([entries[0].date])
+    total_words = sum(entry.word_count for entry in entries)
+    period = f"archive:{year}" if month is None else f"archive:{year}/{month}"
+    pages = paginate(entries, per_page)
+
+    written = 0
+    for n, items in enumerate(pages, 1):
+        pagination = pagination_context(base_url, n, len(pages), len(entries))
+        context = {
+            'title': f'{label} - 文章归档' if n == 1 else f'{label} - 文章归档 - 第 {n} 页',
+            'archive_label': label,
+            'year': year,
+            'month': month,
+            'months': months,
+            'articles': items,
+            'total_articles': len(entries),
+            'total_words': total_words,
+            'prefetch_urls': [entry.url for entry in items[:prefetch]],
+            'current_year': int(build_time[:4]),
+            'build_time': build_time
+        }
+        records = [entry.record() for entry in items]
+        # 月份导航列出全年各月的文章数，不只取决于本月的文章
+        written += write_listing_page(env, "archive.html", context, pagination, records, out_dir,
+                                      period, ('pagination.articlesPerPage', 'build.prefetch'),
+                                      extra=months)
+    return len(pages), written
+
+def generate_archive_pages(env, site_index, build_dir, per_page=0, prefetch=0):
+    """生成文章归档：归档首页，以及每年、每月的文章列表
+
+    每个时间段的文章都是站点索引日期视图中连续的一段，不再遍历全部文章。
+    """
+    try:
+        archive_dir = build_dir / "articles" / "archive"
+        years = site_index.years()
+        latest_date = site_index.all.latest_date
+        build_time = get_build_time([latest_date])
+
+        # 归档首页只用到各月的文章数
+        index_path = archive_dir / "index.html"
+        if not page_is_fresh(index_path, "archives.html", extra={'years': years, 'latest': latest_date}):
+            archive_dir.mkdir(parents=True, exist_ok=True)
+            template = env.get_template("archives.html")
+            write_page(index_path, template.render(
+                title='文章归档',
+                years=years,
+                total_articles=site_index.all.count,
+                current_year=int(build_time[:4]),
+                build_time=build_time
+            ))
+
+        pages = written = 0
+        for year, _, months in years:
+            periods = [(None, site_index.year_entries(year))]
+            periods.extend((month, site_index.month_entries(year, month)) for month, _ in months)
+            for month, entries in periods:
+                n, w = generate_archive_listing(env, year, month, entries, months, archive_dir,
+                                                per_page, prefetch)
+                pages += n
+                written += w
+
+        month_count = sum(len(months) for _, _, months in years)
+        print(f"✓ 生成: /articles/archive/（{len(years)} 年，{month_count} 个月，"
+              f"{listing_summary(pages, written)}）")
         return True
 
     except Exception as e:
-        print(f"✗ 生成所有文章页面失败: {e}")
+        print(f"✗ 生成归档页面失败: {e}")
         return False
 
-def generate_group_pages(env, articles_by_group, build_dir, config):
+def generate_group_index(env, group, build_dir, per_page=0, prefetch=0):
+    """生成单个分组的首页（及分页），返回分组目录"""
+    group_name = group.name
+    build_time = get_build_time([group.latest_date])
+    group_title = f'{group_name} - 文章分类' if group_name != 'default' else '默认分组 - 文章分类'
+
+    group_dir = build_dir / "articles" / "groups" / group_name
+    # 首页沿用时不会创建目录，文章页仍写在这里
+    group_dir.mkdir(parents=True, exist_ok=True)
+    pages = paginate(group.entries, per_page)
+
+    written = 0
+    for n, items in enumerate(pages, 1):
+        pagination = pagination_context(group.url, n, len(pages), group.count)
+        context = {
+            'title': group_title if n == 1 else f'{group_title} - 第 {n} 页',
+            'group_name': group_name,
+            'current_group': group_name,
+            'articles': items,
+            'total_articles': group.count,
+            'total_words': group.total_words,
+            'total_reading_time': group.total_reading_time,
+            'latest_date': group.latest_date,
+            'prefetch_urls': [entry.url for entry in items[:prefetch]],
+            'current_year': int(build_time[:4]),
+            'build_time': build_time
+        }
+        records = [entry.record() for entry in items]
+        written += write_listing_page(env, "group_index.html", context, pagination, records, group_dir,
+                           f"group:{group_name}",
+                           ('pagination.groupArticlesPerPage', 'build.prefetch'))
+
+    print(f"✓ 生成: /articles/groups/{group_name}/（{listing_summary(len(pages), written)}）")
+    return group_dir
+
+def generate_group_pages(env, site_index, build_dir, config, jobs=1):
     """生成分组页面"""
-    temp_articles_dir = Path("temp_articles")
     site_title = config['site']['title']
+    per_page = get_page_sizes(config)['groupArticlesPerPage']
+    prefetch = get_prefetch_settings(config)
+    fresh = 0
 
-    for group_name, articles in articles_by_group.items():
-        try:
-            # 分组首页
-            total_words = sum(a['word_count'] for a in articles)
-            total_reading_time = sum(a['reading_time'] for a in articles)
-            latest_date = max((a['date'] for a in articles), default='')
+    def stale_tasks():
+        nonlocal fresh
+        for group_name, group in site_index.groups.items():
+            try:
+                # 分组首页
+                group_dir = generate_group_index(env, group, build_dir, per_page,
+                                                 prefetch['listingItems'])
+                if prefetch['instantNavigation']:
+                    write_nav_manifest(group, group_dir)
+                tasks = make_article_tasks(group.articles(), group_name, group_dir, site_title,
+                                           site_index.entries, prefetch)
+            except Exception as e:
+                print(f"✗ 生成分组 '{group_name}' 页面失败: {e}")
+                continue
+
+            # 分组内需要重新生成的文章详情页
+            for task in tasks:
+                if article_page_is_fresh(task):
+                    fresh += 1
+                else:
+                    yield task
+
+    # 任务逐个生成、渲染、写入，渲染结果写入后即释放
+    run_article_tasks(env, stale_tasks(), jobs)
+    if fresh:
+        print(f"✓ 未变化: {fresh} 篇文章页面")
+
+def article_page_is_fresh(task):
+    """文章页面依赖文章本身、相邻两篇文章、相关文章、站点标题和预取配置"""
+    article = task['article']
+    neighbours = [task['prev_article'], task['next_article']]
+    return page_is_fresh(task['group_dir'] / article['html_name'], "article_detail.html",
+                         [article['path']] + [a['path'] if a else None for a in neighbours]
+                         + article.get('related', []),
+                         ('site.title', 'build.prefetch'))
+
+def make_article_tasks(articles, group_name, group_dir, site_title, entries=None, prefetch=None):
+    """准备分组内每篇文章的渲染任务
+
+    entries 为站点索引中的文章记录（用于相关文章），prefetch 为预取配置（默认 PREFETCH_DEFAULTS）。
+    """
+    prefetch = prefetch or PREFETCH_DEFAULTS
+    nav_manifest = (f"/articles/groups/{group_name}/{NAV_MANIFEST_NAME}"
+                    if prefetch['instantNavigation'] else None)
+    tasks = []
+    for i, article in enumerate(articles):
+        # 获取相邻文章
+        prev_article = articles[i-1] if i > 0 else None
+        next_article = articles[i+1] if i < len(articles)-1 else None
+        neighbours = [a for a in (next_article, prev_article) if a] if prefetch['neighbours'] else []
+
+        tasks.append({
+            'article': article,
+            'prev_article': prev_article,
+            'next_article': next_article,
+            # 相关文章只传精简记录，不把完整的文章数据带进任务
+            'related_articles': [entries[path].record() for path in article.get('related', ())
+                                 if entries and path in entries],
+            # 先预取下一篇（按阅读顺序更可能打开）
+            'prefetch_urls': [f"/articles/groups/{group_name}/{a['html_name']}" for a in neighbours],
+            'nav_manifest': nav_manifest,
+            'group_name': group_name,
+            'group_dir': group_dir,
+            'site_title': site_title,
+            'build_time': get_build_time([article['date']])
+        })
+    return tasks
+
+def render_article_task(template, task):
+    """用文章详情模板渲染单篇文章并写入文件，没有源文本时返回False"""
+    article = task['article']
+
+    md_content = article.get('source')
+    if md_content is None and 'blob' in article and ARTICLE_SOURCE is not None:
+        with profiler.span("read_source", cat='step'):
+            md_content = ARTICLE_SOURCE.read(article)
+    if md_content is None:
+        return False
 
-            template = env.get_template("group_index.html")
-            context = {
-                'title': f'{group_name} - 文章分类' if group_name != 'default' else '默认分组 - 文章分类',
-                'group_name': group_name,
-                'current_group': group_name,
-                'articles': articles,
-                'total_words': total_words,
-                'total_reading_time': total_reading_time,
-                'latest_date': latest_date,
-                'current_year': datetime.now().year,
-                'build_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
+    with profiler.span("markdown", cat='step'):
+        html_content = convert_markdown_to_html(md_content)
+    if article.get('images'):
+        html_content = images.rewrite_images(html_content, article['images'])
+    # 渲染结果只放进本页的上下文，写入后即可释放，不留在共享的文章数据中
+    article = dict(article, content=html_content)
+
+    # 生成文章页面
+    context = {
+        'title': f"{article['title']} - {task['site_title']}",
+        'article': article,
+        'prev_article': task['prev_article'],
+        'next_article': task['next_article'],
+        'related_articles': task['related_articles'],
+        'prefetch_urls': task['prefetch_urls'],
+        'nav_manifest': task['nav_manifest'],
+        'current_year': int(task['build_time'][:4]),
+        'build_time': task['build_time']
+    }
 
-            group_dir = build_dir / "articles" / "groups" / group_name
-            group_dir.mkdir(parents=True, exist_ok=True)
+    with profiler.span("jinja", cat='step'):
+        content = template.render(**context)
+    with profiler.span("write", cat='step'):
+        write_page(task['group_dir'] / article['html_name'], content)
+    return True
 
-            (group_dir / "index.html").write_text(template.render(**context), encoding='utf-8')
-            print(f"✓ 生成: /articles/groups/{group_name}/")
+_worker_template = None
+
+def _init_render_worker(profile=False, article_source=None):
+    """进程池初始化：每个进程只创建一次模板环境和Markdown转换器"""
+    global _worker_template, ARTICLE_SOURCE
+    ARTICLE_SOURCE = article_source
+    if profile:
+        profiler.enable()
+        # fork出的子进程会继承父进程已记录的数据，先丢弃
+        profiler.drain()
+    _worker_template = init_jinja().get_template("article_detail.html")
+    get_markdown_converter()
+
+def profiled_render_article(template, task):
+    """渲染文章并记录耗时，返回 (是否生成, 错误信息)"""
+    article = task['article']
+    try:
+        with profiler.span(f"{article['group']}/{article['filename']}", cat='article'):
+            return render_article_task(template, task), None
+    except Exception as e:
+        return False, str(e)
+
+def _render_article_worker(task):
+    """在子进程中渲染文章，返回 (是否生成, 错误信息, 统计数据)"""
+    written, error = profiled_render_article(_worker_template, task)
+    return written, error, profiler.drain() if profiler.enabled else None
+
+# 进程池每批提交的任务数（每个进程），文章逐批读出，内存占用不随文章数增长
+RENDER_BATCH_PER_JOB = 32
+
+def run_article_tasks(env, tasks, jobs=1):
+    """渲染文章任务（可以是生成器，逐个取出渲染），jobs > 1 时使用进程池"""
+    tasks = iter(tasks)
+    if jobs > 1:
+        batch_size = jobs * RENDER_BATCH_PER_JOB
+        batch = list(islice(tasks, batch_size))
+        if len(batch) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_render_worker,
+                                     initargs=(profiler.enabled, ARTICLE_SOURCE)) as pool:
+                def submit(batch):
+                    chunksize = max(1, len(batch) // (jobs * 4))
+                    return batch, pool.map(_render_article_worker, batch, chunksize=chunksize)
+
+                # 进程池渲染这一批时读出下一批，同时最多两批在内存中
+                pending = submit(batch)
+                while pending:
+                    batch = list(islice(tasks, batch_size))
+                    current, pending = pending, (submit(batch) if batch else None)
+                    for task, (written, error, stats) in zip(*current):
+                        if stats:
+                            profiler.merge(*stats)
+                        report_article_result(task, written, error)
+            return
+        tasks = batch
+
+    # 模板只查找一次，所有文章共用
+    template = None
+    for task in tasks:
+        if template is None:
+            template = env.get_template("article_detail.html")
+        written, error = profiled_render_article(template, task)
+        report_article_result(task, written, error)
+
+def report_article_result(task, written, error):
+    """输出单篇文章的生成结果"""
+    article = task['article']
+    if error is not None:
+        print(f"✗ 生成文章 '{article['title']}' 页面失败: {error}")
+    elif written:
+        print(f"  → 生成: /articles/groups/{task['group_name']}/{article['html_name']}")
+
+def generate_search_index(env, search_index, build_dir):
+    """写出搜索索引和搜索页面"""
+    try:
+        search_dir = build_dir / "search"
+        # 内容与上次输出相同的索引文件直接沿用
+        reuse = BUILD_STATE.reuse_output if BUILD_STATE is not None else None
+        shard_count, encoded, written = search_index.write(search_dir / "data", reuse)
+        size_kb = search_index.size_bytes() / 1024
+        print(f"✓ 生成: /search/data/（{len(search_index.docs)} 篇文章，{shard_count} 个分片，"
+              f"{size_kb:.1f} KB，重新编码 {encoded} 个、写入 {written} 个文件）")
+
+        if page_is_fresh(search_dir / "index.html", "search.html", '*'):
+            return True
+
+        # 索引文件全部沿用时暂存目录中还没有 search/
+        search_dir.mkdir(parents=True, exist_ok=True)
+        template = env.get_template("search.html")
+        build_time = get_build_time(meta[3] for meta, *_ in search_index.docs.values())
+        context = {
+            'title': '搜索',
+            'current_year': int(build_time[:4]),
+            'build_time': build_time
+        }
+        write_page(search_dir / "index.html", template.render(**context))
+        print("✓ 生成: /search/index.html")
+        return True
 
-            # 分组内的文章详情页
-            generate_article_pages(env, articles, group_name, group_dir, temp_articles_dir, site_title)
+    except Exception as e:
+        print(f"✗ 生成搜索索引失败: {e}")
+        return False
 
-        except Exception as e:
-            print(f"✗ 生成分组 '{group_name}' 页面失败: {e}")
+def make_image_pipeline(config):
+    """按配置创建图片处理器，build.images 为 false 时不处理图片"""
+    settings = config.get('build', {}).get('images', {})
+    if settings is False:
+        return None
+    return images.ImagePipeline(settings)
 
-def generate_article_pages(env, articles, group_name, group_dir, temp_articles_dir, site_title):
-    """生成文章详情页面"""
-    for i, article in enumerate(articles):
-        try:
-            # 读取Markdown内容
-            md_file = temp_articles_dir / article['group'] / article['filename']
-            if not md_file.exists():
-                md_file = temp_articles_dir / "default" / article['filename']
-
-            if md_file.exists():
-                md_content = md_file.read_text(encoding='utf-8')
-                html_content = convert_markdown_to_html(md_content)
-                article['content'] = html_content
-
-                # 获取相邻文章
-                prev_article = articles[i-1] if i > 0 else None
-                next_article = articles[i+1] if i < len(articles)-1 else None
-
-                # 生成文章页面
-                template = env.get_template("article_detail.html")
-                context = {
-                    'title': f"{article['title']} - {site_title}",
-                    'article': article,
-                    'prev_article': prev_article,
-                    'next_article': next_article,
-                    'current_year': datetime.now().year,
-                    'build_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-
-                article_file = group_dir / article['html_name']
-                article_file.write_text(template.render(**context), encoding='utf-8')
-                print(f"  → 生成: /articles/groups/{group_name}/{article['html_name']}")
-
-        except Exception as e:
-            print(f"✗ 生成文章 '{article['title']}' 页面失败: {e}")
+def process_article_images(image_pipeline, all_articles, build_dir, jobs=1):
+    """编码新图片并写入构建目录，把图片信息附加到引用它们的文章"""
+    try:
+        if image_pipeline.pending and not images.available_formats(image_pipeline.settings['formats']):
+            print("⚠ 未安装Pillow（或不支持配置的格式），图片只复制原图")
+        image_pipeline.encode_pending(jobs)
+
+        for article in all_articles:
+            refs = article.pop('image_refs', None)
+            if refs is not None:
+                article['images'] = {src: image_pipeline.image_record(path)
+                                     for src, path in refs if path in image_pipeline.records}
+        written = image_pipeline.write(build_dir)
+
+        stats = image_pipeline.stats
+        print(f"✓ 图片: {stats['images']} 张，新编码 {stats['encoded']} 张，"
+              f"复用缓存 {stats['hits']} 张，写入 {written} 个文件")
+        return True
+
+    except Exception as e:
+        print(f"✗ 处理图片失败: {e}")
+        for article in all_articles:
+            article.pop('image_refs', None)
+        return False
+
+def make_related_index(config):
+    """按配置创建相关文章索引，build.related 为 false 时不计算"""
+    settings = config.get('build', {}).get('related', {})
+    if settings is False:
+        return None
+    return related.RelatedIndex(settings)
+
+def process_related(related_index, site_index):
+    """计算每篇文章的相关文章，结果（路径列表）附加到文章数据，计入文章的哈希"""
+    try:
+        start = time.perf_counter()
+        related_paths = related_index.compute()
+        related_index.save()
+        for path, entry in site_index.entries.items():
+            entry.article['related'] = related_paths.get(path, [])
+
+        if related.load_numpy() is None:
+            print("⚠ 未安装NumPy，相关文章使用纯Python计算（较慢）")
+        stats = related_index.stats
+        print(f"✓ 相关文章: {len(related_paths)} 篇，签名复用缓存 {stats['hits']} 篇，"
+              f"新计算 {stats['computed']} 篇，重新排序 {stats['rows']} 篇、合并 {stats['merged']} 篇，"
+              f"{time.perf_counter() - start:.2f} 秒")
+        return True
+
+    except Exception as e:
+        print(f"✗ 计算相关文章失败: {e}")
+        return False
+
+def author_key(article):
+    return avatars.author_key(article['author'], article.get('author_email'))
+
+def process_avatars(config, all_articles, build_dir, offline=False, jobs=1):
+    """
+    获取全部作者的头像（每位作者只请求一次）并写入构建目录，返回 {作者key: 头像地址}
+
+    build.avatars 为 false 时不获取，页面显示默认图标。
+    """
+    settings = config.get('build', {}).get('avatars', {})
+    if settings is False:
+        return {}
+    settings = dict(avatars.DEFAULT_SETTINGS, **settings)
+
+    # 没有Git记录的文章作者为Unknown，不猜测头像
+    authors = {(article['author'], article['author_email'])
+               for article in all_articles if article.get('author_email')}
+    if not authors:
+        return {}
+    try:
+        files, counts = avatars.fetch_avatars(authors, settings, offline)
+        avatar_urls, stats = avatars.make_avatar_urls(files, build_dir, settings['size'], jobs)
+    except Exception as e:
+        print(f"✗ 获取作者头像失败: {e}")
+        return {}
+
+    status_text = {
+        'fresh': '未过期',
+        'fetched': '已下载',
+        'revalidated': '未变化',
+        'offline': '离线缓存',
+        'stale': '请求失败，使用旧头像'
+    }
+    summary = "，".join(f"{status_text.get(status, status)} {count}"
+                       for status, count in sorted(counts.items()))
+    print(f"✓ 作者头像: {len(avatar_urls)}/{len(authors)} 位作者（{summary}），"
+          f"新编码 {stats['encoded']} 张")
+    apply_avatars(all_articles, avatar_urls)
+    return avatar_urls
+
+def apply_avatars(articles, avatar_urls):
+    """把头像地址附加到文章，没有头像的作者为空字符串"""
+    for article in articles:
+        article['avatar_url'] = avatar_urls.get(author_key(article), '')
 
 def copy_static_files(build_dir):
     """复制静态文件"""
@@ -430,7 +1306,8 @@ def copy_static_files(build_dir):
     static_files = [
         ("style.css", "CSS样式文件"),
         ("404.html", "404页面"),
-        ("favicon.ico", "网站图标")
+        ("favicon.ico", "网站图标"),
+        ("nav.js", "即时跳转脚本")
     ]
 
     for filename, description in static_files:
@@ -444,131 +1321,349 @@ def copy_static_files(build_dir):
         else:
             print(f"⚠ {filename} 不存在，跳过复制")
 
+    # 生成代码高亮样式表，并删除旧版本
+    css_name, css_data = get_highlight_stylesheet()
+    for old_file in Path(build_dir).glob("highlight.*.css"):
+        if old_file.name != css_name:
+            old_file.unlink()
+    (Path(build_dir) / css_name).write_bytes(css_data)
+    print(f"✓ 生成: {css_name} (代码高亮样式)")
+
+
+def postprocess_output(build_dir, build_config, jobs=1):
+    """压缩HTML/CSS并生成预压缩文件（.gz/.br）"""
+    minify = build_config.get('minify', True)
+    precompress = build_config.get('precompress', True)
+    if precompress and postprocess.brotli is None:
+        print("⚠ 未安装brotli，只生成 .gz 文件")
+
+    stats = postprocess.postprocess_site(build_dir, minify, precompress, jobs)
+    if minify:
+        print(f"✓ 压缩HTML/CSS: {stats['files']} 个文本文件，减少 {stats['saved'] / 1024:.1f} KB")
+    if precompress:
+        print(f"✓ 预压缩: 写入 {stats['written']} 个文件（复用缓存 {stats['hits']} 个）")
+
+    max_mb = build_config.get('compressCacheMaxMB')
+    max_bytes = max_mb * 1024 * 1024 if max_mb else postprocess.COMPRESS_CACHE_MAX_BYTES
+    removed = postprocess.prune_compress_cache(max_bytes)
+    if removed:
+        print(f"✓ 淘汰预压缩缓存: {removed} 个文件")
+
+
+def fetch_github_profile(config, offline=False):
+    """获取GitHub用户信息（带缓存），返回 (数据, 状态)"""
+    try:
+        build_config = config.get('build', {})
+        api_base = build_config.get('githubApiUrl', GITHUB_API_URL).rstrip('/')
+        ttl = build_config.get('githubProfileTTL', GITHUB_PROFILE_TTL)
+        username = config['site']['username']
 
-def build_with_templates():
-    """使用模板构建站点"""
-    print("🚀 开始模板构建...")
-    print("=" * 50)
+        return cached_get_json(f"{api_base}/users/{username}", headers={
+            'User-Agent': 'Mozilla/5.0',
+            'Accept': 'application/vnd.github.v3+json'
+        }, ttl=ttl, offline=offline, timeout=10)
+    except Exception as e:
+        return None, str(e)
 
-    # 初始化模板环境
-    env = init_jinja()
-    build_dir = Path("site/_site")
+def apply_github_profile(config, data, status):
+    """用GitHub用户信息更新配置"""
+    if data is None:
+        print(f"⚠ 从GitHub API获取信息失败: {status}")
+        print("⚠ 使用配置文件中的原始信息")
+        return
+
+    status_text = {
+        'fresh': '使用未过期的缓存',
+        'revalidated': '缓存未变化 (304)',
+        'fetched': '已更新缓存',
+        'offline': '离线模式，使用缓存',
+        'stale': '请求失败，使用旧缓存'
+    }
+    print(f"✓ GitHub用户信息: {status_text.get(status, status)}")
 
-    # 清理构建目录
-    if build_dir.exists():
-        shutil.rmtree(build_dir)
-    build_dir.mkdir(parents=True)
+    # 更新配置
+    if data.get('name'):
+        config['site']['name'] = data['name']
+        print(f"✓ 更新 name: {data['name']}")
+
+    if data.get('bio'):
+        config['site']['subtitle'] = data['bio']
+        print(f"✓ 更新 subtitle: {data['bio'][:50]}...")
+
+def fetch_backgrounds(config, offline=False):
+    """获取背景图片池（每个TTL周期只请求一次API），返回 (图片列表, 状态)"""
+    try:
+        background = config.get('background', {})
+        return backgrounds.fetch_background_pool(
+            background.get('apiUrl'),
+            size=background.get('poolSize', backgrounds.DEFAULT_POOL_SIZE),
+            ttl=background.get('poolTTL', backgrounds.DEFAULT_POOL_TTL),
+            offline=offline
+        )
+    except Exception as e:
+        return [], str(e)
+
+def generate_backgrounds(config, pool_images, status, build_dir, jobs=1):
+    """缩放背景图片并写出 /backgrounds.js，没有图片时页面使用默认背景"""
+    status_text = {
+        'fresh': '使用未过期的缓存',
+        'fetched': '已更新图片池',
+        'offline': '离线模式，使用缓存',
+        'stale': '请求失败，使用上次的图片'
+    }
+    if pool_images:
+        print(f"✓ 背景图片池: {status_text.get(status, status)}")
+    else:
+        print(f"⚠ 获取背景图片失败: {status}")
+        print("⚠ 页面使用默认背景")
 
-    # 1. 读取配置文件
-    print("📄 读取配置文件...")
     try:
-        with open("config.json", "r", encoding="utf-8") as f:
+        background_list, stats = backgrounds.make_background_list(pool_images, build_dir, jobs)
+        backgrounds.write_background_script(build_dir, background_list,
+                                            config['background'].get('defaultBackground', ''))
+        if background_list:
+            print(f"✓ 生成: /{backgrounds.SCRIPT_NAME}（{len(background_list)} 张背景图片，"
+                  f"新编码 {stats['encoded']} 张）")
+        return True
+    except Exception as e:
+        print(f"✗ 生成背景图片失败: {e}")
+        return False
+
+def load_config(path="config.json"):
+    """读取配置文件，失败时返回None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
             config = json.load(f)
         print("✓ 配置文件读取成功")
+        return config
     except Exception as e:
         print(f"✗ 读取配置文件失败: {e}")
-        return False
+        return None
 
-    # 更新config配置信息（从GitHub API）
-    print("\n🌐 从GitHub API获取用户信息...")
-    try:
-        username = config['site']['username']
-        api_url = f"https://api.github.com/users/{username}"
+def build_with_templates(jobs=1, offline=False, profile_path=None, articles_dir=None,
+                         stable_build_time=False, full=False, stream=False):
+    """使用模板构建站点
 
-        # 使用 requests 调用 GitHub API
-        response = requests.get(api_url, headers={
-            'User-Agent': 'Mozilla/5.0',
-            'Accept': 'application/vnd.github.v3+json'
-        }, timeout=10)
+    stream 为True时文章只在内存中保留元数据，源文本在渲染时逐篇读取，渲染结果写入后即释放，
+    峰值内存不随文章总量增长。
+    """
+    global STABLE_BUILD_TIME, BUILD_STATE, ARTICLE_SOURCE
+    if profile_path:
+        profiler.enable()
+        profiler.record_startup()
 
-        if response.status_code == 200:
-            data = response.json()
+    print("🚀 开始模板构建...")
+    print("=" * 50)
 
-            # 更新配置
-            if data.get('name'):
-                config['site']['name'] = data['name']
-                print(f"✓ 更新 name: {data['name']}")
+    # 初始化模板环境
+    with profiler.span("0. 初始化"):
+        env = init_jinja()
+        output_dir = Path("site/_site")
+        # 先生成到暂存目录，最后只把内容变化的文件同步到输出目录
+        build_dir = Path("site/_staging")
 
-            if data.get('bio'):
-                config['site']['subtitle'] = data['bio']
-                print(f"✓ 更新 subtitle: {data['bio'][:50]}...")
+        # 清理暂存目录
+        if build_dir.exists():
+            shutil.rmtree(build_dir)
+        build_dir.mkdir(parents=True)
 
-        else:
-            print(f"⚠ GitHub API 返回状态码: {response.status_code}")
-    except Exception as e:
-        print(f"⚠ 从GitHub API获取信息失败: {e}")
-        print("⚠ 使用配置文件中的原始信息")
-
-    # 2. 生成主页
-    print("\n🏠 生成主页...")
-    if not generate_home_page(env, config, build_dir):
-        print("⚠ 主页生成失败，继续构建其他页面")
+    # 1. 读取配置文件
+    print("📄 读取配置文件...")
+    with profiler.span("1. 读取配置文件"):
+        config = load_config()
+        if config is None:
+            return False
+        STABLE_BUILD_TIME = stable_build_time or config.get('build', {}).get('stableBuildTime', False)
+        stream = stream or config.get('build', {}).get('streaming', False)
 
-    # 3. 拉取文章
+    # 2. 拉取文章，同时在后台获取GitHub用户信息和背景图片
     print("\n📥 拉取文章...")
-    all_articles, articles_by_group = fetch_articles()
+    with profiler.span("2. 拉取文章"):
+        search_index = SearchIndex() if config.get('build', {}).get('searchIndex', True) else None
+        image_pipeline = make_image_pipeline(config)
+        related_index = make_related_index(config)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            profile_future = pool.submit(fetch_github_profile, config, offline)
+            backgrounds_future = pool.submit(fetch_backgrounds, config, offline)
+            all_articles, site_index = fetch_articles(articles_dir, search_index,
+                                                      image_pipeline, stream, related_index)
+
+        # 更新config配置信息（从GitHub API）
+        print("\n🌐 从GitHub API获取用户信息...")
+        apply_github_profile(config, *profile_future.result())
+
+    # 文章引用的图片：生成多种宽度和格式，结果附加到文章数据（计入文章的哈希）
+    if image_pipeline is not None and all_articles:
+        print("\n🖼 处理文章图片...")
+        with profiler.span("2.1 处理文章图片"):
+            process_article_images(image_pipeline, all_articles, build_dir, jobs)
+
+    # 作者头像：按作者去重后获取，发布为本地文件（地址计入文章的哈希）
+    if all_articles:
+        print("\n👤 获取作者头像...")
+        with profiler.span("2.2 获取作者头像"):
+            process_avatars(config, all_articles, build_dir, offline, jobs)
+
+    # 相关文章：跨分组按内容相似度计算
+    if related_index is not None and all_articles:
+        print("\n🔗 计算相关文章...")
+        with profiler.span("2.3 计算相关文章"):
+            process_related(related_index, site_index)
+
+    # 读取上次构建的依赖图，只渲染输入有变化的页面
+    with profiler.span("2.4 读取构建状态"):
+        build_config = config.get('build', {})
+        BUILD_STATE = BuildState(env, build_dir, output_dir)
+        BUILD_STATE.load(
+            render=get_render_fingerprint(),
+            globals=env.globals.get('highlight_css'),
+            stable=STABLE_BUILD_TIME,
+            minify=build_config.get('minify', True),
+            precompress=build_config.get('precompress', True),
+            # 生成代码变化时全部重建
+            code=generator_code_digests()
+        )
+        if full:
+            BUILD_STATE.previous = {}
+        BUILD_STATE.set_config(config)
+        BUILD_STATE.set_articles(site_index)
+
+    # 3. 生成主页
+    print("\n🏠 生成主页...")
+    with profiler.span("3. 生成主页"):
+        if not generate_home_page(env, config, build_dir):
+            print("⚠ 主页生成失败，继续构建其他页面")
 
     if all_articles:
-        print(f"✓ 拉取完成: {len(all_articles)} 篇文章，{len(articles_by_group)} 个分组")
-
-        # 4. 准备分组信息
-        print("\n📊 准备分组信息...")
-        groups_info = {}
-        for group_name, articles in articles_by_group.items():
-            total_words = sum(a['word_count'] for a in articles)
-            total_reading_time = sum(a['reading_time'] for a in articles)
-            latest_date = max((a['date'] for a in articles), default='')
-
-            groups_info[group_name] = {
-                'count': len(articles),
-                'total_words': total_words,
-                'total_reading_time': total_reading_time,
-                'latest_date': latest_date,
-                'articles': articles,
-                'description': f"{group_name} 分类的文章"
-            }
+        print(f"✓ 拉取完成: {len(site_index)} 篇文章，{len(site_index.groups)} 个分组")
+        listing_prefetch = get_prefetch_settings(config)['listingItems']
 
         # 5. 生成所有分组页面
         print("\n📁 生成所有分组页面...")
-        generate_all_groups_page(env, groups_info, build_dir)
+        with profiler.span("5. 生成所有分组页面"):
+            generate_all_groups_page(env, site_index, build_dir,
+                                     get_page_sizes(config)['groupsPerPage'], listing_prefetch)
 
         # 6. 生成所有文章页面
         print("\n📄 生成所有文章页面...")
-        generate_all_articles_page(env, all_articles, groups_info, build_dir)
+        with profiler.span("6. 生成所有文章页面"):
+            generate_all_articles_page(env, site_index, build_dir,
+                                       get_page_sizes(config)['articlesPerPage'], listing_prefetch)
+
+        # 按年、月归档
+        print("\n🗓 生成归档页面...")
+        with profiler.span("6.1 生成归档页面"):
+            generate_archive_pages(env, site_index, build_dir,
+                                   get_page_sizes(config)['articlesPerPage'], listing_prefetch)
 
         # 7. 生成分组页面
         print("\n📂 生成分组页面...")
-        generate_group_pages(env, articles_by_group, build_dir, config)
+        with profiler.span("7. 生成分组页面"):
+            generate_group_pages(env, site_index, build_dir, config, jobs)
+
+        # 生成搜索索引
+        if search_index is not None:
+            print("\n🔍 生成搜索索引...")
+            with profiler.span("7.1 生成搜索索引"):
+                generate_search_index(env, search_index, build_dir)
     else:
         print("⚠ 没有文章可构建，跳过文章相关页面")
 
+    # 流式构建读取源文本用的读取器和临时仓库
+    if ARTICLE_SOURCE is not None:
+        ARTICLE_SOURCE.close()
+        ARTICLE_SOURCE = None
+
+    # 清理渲染缓存
+    max_mb = config.get('build', {}).get('renderCacheMaxMB')
+    max_bytes = max_mb * 1024 * 1024 if max_mb else RENDER_CACHE_MAX_BYTES
+    removed = prune_render_cache(max_bytes)
+    if removed:
+        print(f"✓ 淘汰渲染缓存: {removed} 个文件")
+    max_mb = config.get('build', {}).get('imageCacheMaxMB')
+    removed = images.prune_image_cache(max_mb * 1024 * 1024 if max_mb else images.IMAGE_CACHE_MAX_BYTES)
+    if removed:
+        print(f"✓ 淘汰图片缓存: {removed} 张图片")
+
     # 8. 复制静态文件
     print("\n📋 复制静态文件...")
-    copy_static_files(build_dir)
+    with profiler.span("8. 复制静态文件"):
+        copy_static_files(build_dir)
+
+    # 背景图片
+    print("\n🌄 生成背景图片...")
+    with profiler.span("8.1 生成背景图片"):
+        generate_backgrounds(config, *backgrounds_future.result(), build_dir, jobs)
+
+    # 9. 压缩输出
+    if build_config.get('minify', True) or build_config.get('precompress', True):
+        print("\n🗜 压缩输出...")
+        with profiler.span("9. 压缩输出"):
+            postprocess_output(build_dir, build_config, jobs)
 
-    # 9. 创建.nojekyll
+    # 10. 创建.nojekyll
     (build_dir / ".nojekyll").touch()
     print("✓ 创建: .nojekyll")
 
-    # 10. 清理临时文件
-    print("\n🧹 清理临时文件...")
-    temp_articles_dir = Path("temp_articles")
-    if temp_articles_dir.exists():
-        shutil.rmtree(temp_articles_dir)
-        print("✓ 清理: temp_articles/")
+    # 11. 同步输出目录
+    print("\n🔄 同步输出目录...")
+    with profiler.span("11. 同步输出目录"):
+        changed, unchanged, removed = postprocess.sync_output(build_dir, output_dir,
+                                                              BUILD_STATE.kept)
+        print(f"✓ 同步: 更新 {changed} 个文件，未变化 {unchanged} 个，删除 {removed} 个")
+        BUILD_STATE.save()
+        print(f"✓ 沿用未变化的页面: {BUILD_STATE.skipped} 个（共 {len(BUILD_STATE.pages)} 个）")
+        profiler.add('pages_skipped', BUILD_STATE.skipped)
+        BUILD_STATE = None
+        print(f"✓ 写入: {postprocess.MANIFEST_NAME}")
 
     print("\n" + "=" * 50)
     print("🎉 模板构建完成!")
     print(f"📊 统计:")
     print(f"  文章总数: {len(all_articles)}")
-    print(f"  分组数量: {len(articles_by_group)}")
-    print(f"  输出目录: {build_dir}")
+    print(f"  分组数量: {len(site_index.groups)}")
+    print(f"  输出目录: {output_dir}")
     print("=" * 50)
+
+    if profile_path:
+        profiler.print_summary()
+        profiler.write_trace(profile_path)
+        print(f"✓ 写入性能数据: {profile_path}")
     return True
 
 
-def main():
+def parse_args(argv=None):
+    """解析命令行参数"""
+    import argparse
+    parser = argparse.ArgumentParser(description="构建网站")
+    parser.add_argument('command', nargs='?', choices=['build', 'serve'], default='build',
+                        help="build: 构建站点（默认）；serve: 构建并启动本地预览服务器")
+    parser.add_argument('--articles-dir', metavar='DIR',
+                        help="从本地目录（例如 git worktree add ../articles articles）读取文章")
+    parser.add_argument('--watch', action='store_true',
+                        help="serve 时监视文章、模板、静态文件和配置，变化后增量重建")
+    parser.add_argument('--host', default='127.0.0.1', help="serve 监听地址")
+    parser.add_argument('--port', type=int, default=8000, help="serve 监听端口")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="并行渲染文章的进程数，0 表示使用全部CPU核心")
+    parser.add_argument('--offline', action='store_true',
+                        help="离线模式：不访问网络，使用缓存的远程数据")
+    parser.add_argument('--stable-build-time', action='store_true',
+                        help="页面的“最后更新于”取文章日期而不是当前时间，使输出可复现")
+    parser.add_argument('--full', action='store_true',
+                        help="忽略上次的构建状态，重新渲染全部页面")
+    parser.add_argument('--stream', action='store_true',
+                        help="流式构建：内存中只保留文章元数据，渲染时逐篇读取源文本（适合大量文章）")
+    parser.add_argument('--profile', nargs='?', const='build-profile.json', metavar='PATH',
+                        help="记录各阶段耗时，写入Chrome trace-event格式的JSON（默认 build-profile.json）")
+    args = parser.parse_args(argv)
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    return args
+
+def main(argv=None):
     """主函数"""
+    args = parse_args(argv)
     try:
         # 检查必要的目录和文件
         if not Path("config.json").exists():
@@ -582,8 +1677,16 @@ def main():
             Path("templates/articles").mkdir(exist_ok=True)
             print("⚠ 请确保模板文件已放置在 templates/home/ 和 templates/articles/ 目录中")
 
+        if args.command == 'serve':
+            from serve import serve
+            return serve(args)
+
         # 执行构建
-        success = build_with_templates()
+        success = build_with_templates(jobs=args.jobs, offline=args.offline,
+                                       profile_path=args.profile,
+                                       articles_dir=args.articles_dir,
+                                       stable_build_time=args.stable_build_time,
+                                       full=args.full, stream=args.stream)
         return success
 
     except Exception as e:
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+增量构建的依赖图
+
+记录每个输出页面用到的文章、模板和配置项，保存在 .cache/build-state.json。
+下次构建时，输入没有变化且上次的输出仍在的页面不再渲染，直接沿用输出目录中的文件。
+"""
+
+import json
+import hashlib
+from pathlib import Path
+
+import postprocess
+from cache_files import write_atomic
+
+BUILD_STATE_FILE = Path(".cache/build-state.json")
+STATE_VERSION = 1
+
+# 预压缩生成的同名文件，随页面一起沿用
+SIBLING_SUFFIXES = ('.gz', '.br')
+
+def digest_json(value):
+    data = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+class BuildState:
+    """页面 -> (模板, 文章, 配置项) 的依赖图，以及各输入的内容哈希"""
+
+    def __init__(self, env, build_dir, output_dir, path=BUILD_STATE_FILE):
+        self.env = env
+        self.build_dir = Path(build_dir)
+        self.output_dir = Path(output_dir)
+        self.path = Path(path)
+        self.manifest = postprocess.load_manifest(output_dir)
+        self.globals = ''
+        self.config = {}
+        self.articles = {}
+        self.article_sets = {}
+        self.templates = {}
+        self.previous = {}
+        self.pages = {}
+        self.kept = set()
+        self.skipped = 0
+
+    def load(self, **globals):
+        """读取上次的依赖图；globals（渲染配置、生成代码等）变化时全部重建"""
+        self.globals = digest_json(globals)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get('version') == STATE_VERSION and state.get('globals') == self.globals:
+            self.previous = state.get('pages', {})
+
+    def set_config(self, config):
+        self.config = config
+
+    def set_articles(self, site_index):
+        """计算每篇文章的哈希（源文本和元数据），以及全站、各分组和归档各年各月的整体哈希"""
+        self.articles = {
+            entry.path: digest_json({k: v for k, v in entry.article.items() if k != 'content'})
+            for entry in site_index.all
+        }
+        self.article_sets = {
+            '*': digest_json([(path, self.articles[path]) for path in site_index.all.paths()])
+        }
+        for group_name, group in site_index.groups.items():
+            self.article_sets[f"group:{group_name}"] = digest_json(
+                [(path, self.articles[path]) for path in group.paths()]
+            )
+        # 归档页依赖整个时间段的文章，按时间段记录，依赖图的大小不随 页数 x 文章数 增长
+        for year, _, months in site_index.years():
+            periods = [(f"archive:{year}", site_index.year_entries(year))]
+            periods.extend((f"archive:{year}/{month}", site_index.month_entries(year, month))
+                           for month, _ in months)
+            for key, entries in periods:
+                self.article_sets[key] = digest_json(
+                    [(entry.path, self.articles[entry.path]) for entry in entries]
+                )
+
+    def config_digest(self, key):
+        """配置项的哈希，key 可以是 site.title 这样的路径"""
+        value = self.config
+        for part in key.split('.'):
+            value = value.get(part) if isinstance(value, dict) else None
+        return digest_json(value)
+
+    def template_closure(self, name):
+        """模板本身及其继承、包含的所有模板 -> {模板名: 哈希}"""
+        if name not in self.templates:
+            from jinja2 import meta
+            source, _, _ = self.env.loader.get_source(self.env, name)
+            self.templates[name] = {name: hashlib.sha256(source.encode('utf-8')).hexdigest()}
+            for child in meta.find_referenced_templates(self.env.parse(source)):
+                if child:
+                    self.templates[name].update(self.template_closure(child))
+        return self.templates[name]
+
+    def check(self, path, template_name, articles=(), config_keys=(), outputs=None, extra=None):
+        """记录页面的依赖；输入与上次相同且输出仍在时返回True
+
+        articles 为文章路径列表（相邻文章不存在时为None），或 '*'（全部文章）、'group:分组名'、
+        'archive:年' 和 'archive:年/月'。
+        """
+        rel = Path(path).relative_to(self.build_dir).as_posix()
+        outputs = [Path(p).relative_to(self.build_dir).as_posix() for p in outputs or [path]]
+        templates = self.template_closure(template_name)
+
+        if isinstance(articles, str):
+            article_digests = self.article_sets.get(articles)
+        else:
+            articles = list(articles)
+            article_digests = [self.articles.get(p) if p else None for p in articles]
+
+        digest = digest_json({
+            'templates': templates,
+            'articles': article_digests,
+            'config': {key: self.config_digest(key) for key in config_keys},
+            'extra': extra
+        })
+        self.pages[rel] = {
+            'digest': digest,
+            'outputs': outputs,
+            'templates': sorted(templates),
+            'articles': articles,
+            'config': list(config_keys)
+        }
+
+        previous = self.previous.get(rel)
+        if not previous or previous['digest'] != digest:
+            return False
+        if not all(output in self.manifest and (self.output_dir / output).is_file()
+                   for output in outputs):
+            return False
+
+        self._keep(outputs)
+        self.skipped += 1
+        return True
+
+    def reuse_output(self, path, digest):
+        """输出目录中的文件内容哈希为 digest 时沿用它，返回True（用于不经模板生成的文件）"""
+        rel = Path(path).relative_to(self.build_dir).as_posix()
+        # 上次的依赖图作废时（全量构建、压缩配置变化等），预压缩版本也不可信
+        if not self.previous or self.manifest.get(rel) != digest:
+            return False
+        if not (self.output_dir / rel).is_file():
+            return False
+        self._keep([rel])
+        return True
+
+    def _keep(self, outputs):
+        for output in outputs:
+            self.kept.add(output)
+            self.kept.update(output + suffix for suffix in SIBLING_SUFFIXES
+                             if output + suffix in self.manifest)
+
+    def save(self):
+        """写入本次构建的依赖图"""
+        write_atomic(self.path, json.dumps({
+            'version': STATE_VERSION,
+            'globals': self.globals,
+            'pages': self.pages
+        }, ensure_ascii=False, separators=(',', ':')))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+缓存文件的公共操作：原子写入、按最近使用时间淘汰，以及按键追加写入的记录文件
+"""
+
+import os
+import json
+import threading
+from pathlib import Path
+
+def write_atomic(path, data):
+    """先写临时文件再替换，避免中断或并发写入时留下半个文件；data 为 bytes 或 str"""
+    path = Path(path)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # 临时文件名带进程号和线程号，线程池中同时写同一文件也不会冲突
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+def file_entries(paths):
+    """文件 -> (修改时间, 大小, 路径)，跳过已不存在的文件"""
+    for path in paths:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        yield stat.st_mtime, stat.st_size, path
+
+def prune_lru(entries, max_bytes, remove=os.unlink):
+    """
+    按最近使用时间淘汰缓存，使总大小不超过 max_bytes，返回删除的条目数
+
+    entries 为 (最近使用时间, 大小, 路径)；remove 删除一个条目，默认删除文件。
+    """
+    entries = sorted(entries, key=lambda entry: entry[0])
+    total = sum(size for _, size, _ in entries)
+
+    removed = 0
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+class RecordStore:
+    """
+    按键追加写入的记录文件：记录追加到 data_file，索引（键 -> [偏移, 长度]）为 index_file
+
+    记录只在读取时按需 seek，不常驻内存；保存时无用的记录超过一半（且多于 compact_min_bytes）
+    才整理数据文件。
+    """
+
+    def __init__(self, data_file, index_file, compact_min_bytes=1 << 20):
+        self.data_file = Path(data_file)
+        self.index_file = Path(index_file)
+        self.compact_min_bytes = compact_min_bytes
+        self._reader = None
+        self._writer = None
+        self._dirty = False
+        try:
+            index = json.loads(self.index_file.read_text(encoding='utf-8'))
+            size = self.data_file.stat().st_size
+            # 数据文件比索引短（被截断）时整个丢弃
+            if any(offset + length > size for offset, length in index.values()):
+                raise ValueError(self.data_file)
+        except (OSError, ValueError, TypeError, AttributeError):
+            index = {}
+            self.data_file.unlink(missing_ok=True)
+        self.index = index
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def add(self, key, data):
+        if self._writer is None:
+            self.data_file.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = open(self.data_file, 'ab')
+        # 同一文件可能被另一个实例追加过，偏移以文件实际末尾为准
+        offset = self._writer.seek(0, os.SEEK_END)
+        self._writer.write(data)
+        self.index[key] = [offset, len(data)]
+        self._dirty = True
+
+    def get(self, key):
+        if self._writer is not None:
+            self._writer.flush()
+        if self._reader is None:
+            self._reader = open(self.data_file, 'rb')
+        offset, length = self.index[key]
+        self._reader.seek(offset)
+        return self._reader.read(length)
+
+    def save(self, live_keys):
+        """写入索引；数据文件中的无用记录超过一半时只保留 live_keys 的记录"""
+        live_keys = set(live_keys)
+        live = sum(length for key, (_, length) in self.index.items() if key in live_keys)
+        total = sum(length for _, length in self.index.values())
+        if total > 2 * live + self.compact_min_bytes:
+            self._compact(live_keys)
+        elif not self._dirty:
+            return
+        self.close()
+        write_atomic(self.index_file, json.dumps(self.index, separators=(',', ':')))
+        self._dirty = False
+
+    def _compact(self, live_keys):
+        if self._writer is not None:
+            self._writer.flush()
+        tmp_file = self.data_file.with_name(f"{self.data_file.name}.{os.getpid()}.tmp")
+        index = {}
+        with open(self.data_file, 'rb') as src, open(tmp_file, 'wb') as dst:
+            for key in sorted(live_keys & self.index.keys()):
+                offset, length = self.index[key]
+                src.seek(offset)
+                index[key] = [dst.tell(), length]
+                dst.write(src.read(length))
+        self.close()
+        # 先删除旧索引，替换数据文件后中断时整个缓存作废，而不会读到错位的记录
+        self.index_file.unlink(missing_ok=True)
+        os.replace(tmp_file, self.data_file)
+        self.index = index
+        self._dirty = True
+
+    def close(self):
+        for f in (self._reader, self._writer):
+            if f is not None:
+                f.close()
+        self._reader = self._writer = None
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+HTTP响应缓存（ETag / Last-Modified 条件请求 + TTL）
+"""
+
+import json
+import time
+import hashlib
+from pathlib import Path
+
+from cache_files import write_atomic
+
+HTTP_CACHE_DIR = Path(".cache/http")
+
+def _cache_paths(url, cache_dir):
+    """返回缓存的元数据文件和内容文件路径"""
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return cache_dir / f"{key}.json", cache_dir / f"{key}.body"
+
+def load_cache_entry(url, cache_dir=HTTP_CACHE_DIR):
+    """读取缓存，返回 (元数据, 内容)，没有缓存时返回 (None, None)"""
+    meta_path, body_path = _cache_paths(url, cache_dir)
+    try:
+        meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        body = body_path.read_bytes()
+    except (OSError, ValueError):
+        return None, None
+    return meta, body
+
+def save_cache_entry(url, meta, body, cache_dir=HTTP_CACHE_DIR):
+    """保存缓存"""
+    meta_path, body_path = _cache_paths(url, cache_dir)
+    if body is not None:
+        write_atomic(body_path, body)
+    write_atomic(meta_path, json.dumps(meta, ensure_ascii=False))
+
+def cached_get(url, headers=None, ttl=3600, offline=False, timeout=10,
+               cache_dir=HTTP_CACHE_DIR):
+    """
+    带缓存的GET请求，返回 (内容bytes或None, 状态)
+
+    状态: fresh（缓存未过期）、revalidated（304）、fetched（重新下载）、
+    offline（离线模式使用缓存）、stale（请求失败使用旧缓存）、
+    其他字符串表示失败原因
+    """
+    meta, body = load_cache_entry(url, cache_dir)
+
+    if offline:
+        return (body, 'offline') if meta else (None, '离线模式且没有缓存')
+
+    now = time.time()
+    if meta and now - meta.get('fetched_at', 0) < ttl:
+        return body, 'fresh'
+
+    request_headers = dict(headers or {})
+    if meta:
+        if meta.get('etag'):
+            request_headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            request_headers['If-Modified-Since'] = meta['last_modified']
+
+    # requests导入较慢，只在需要访问网络时导入
+    import requests
+    try:
+        response = requests.get(url, headers=request_headers, timeout=timeout)
+    except requests.RequestException as e:
+        if meta:
+            return body, 'stale'
+        return None, str(e)
+
+    if response.status_code == 304 and meta:
+        meta['fetched_at'] = now
+        save_cache_entry(url, meta, None, cache_dir)
+        return body, 'revalidated'
+
+    if response.status_code == 200:
+        meta = {
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': now
+        }
+        save_cache_entry(url, meta, response.content, cache_dir)
+        return response.content, 'fetched'
+
+    if meta:
+        return body, 'stale'
+    return None, f"HTTP {response.status_code}"
+
+def cached_get_json(url, headers=None, ttl=3600, offline=False, timeout=10,
+                    cache_dir=HTTP_CACHE_DIR):
+    """带缓存的GET请求，返回 (JSON数据或None, 状态)"""
+    body, status = cached_get(url, headers, ttl, offline, timeout, cache_dir)
+    if body is None:
+        return None, status
+    try:
+        return json.loads(body.decode('utf-8')), status
+    except ValueError as e:
+        return None, f"JSON解析失败: {e}"
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+文章图片处理：为文章引用的本地图片生成多种宽度的WebP/AVIF版本，
+并把渲染后的 <img> 改写为带 srcset、宽高和 loading="lazy" 的 <picture>
+
+生成结果按图片内容（Git blob哈希）和处理参数缓存在 .cache/images，内容没有变化的图片不会重新编码。
+未安装Pillow时只复制原图，并尽量从文件头读出宽高。
+"""
+
+import os
+import re
+import html
+import json
+import shutil
+import struct
+import hashlib
+import posixpath
+from pathlib import Path
+from urllib.parse import unquote
+
+from profiling import profiler
+from cache_files import prune_lru
+
+IMAGE_CACHE_DIR = Path(".cache/images")
+IMAGE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+CACHE_VERSION = 1
+
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.svg'}
+# 这些格式只复制原图，不生成其他版本
+RAW_SUFFIXES = {'.svg', '.gif'}
+
+# 输出地址（相对站点根目录）
+OUTPUT_DIR = "articles/images"
+
+DEFAULT_SETTINGS = {
+    'widths': [480, 960, 1440],
+    'formats': ['avif', 'webp'],
+    'quality': 75,
+    # 文章正文最宽约1056px（max-w-6xl减去内边距）
+    'sizes': "(max-width: 1152px) 100vw, 1056px"
+}
+
+FORMATS = {
+    'avif': ('AVIF', 'image/avif'),
+    'webp': ('WEBP', 'image/webp')
+}
+
+# Markdown中的图片 ![alt](src "title") 和HTML中的 <img src="...">
+MD_IMAGE_RE = re.compile(r'!\[[^\]\n]*\]\(\s*<?([^)\s>]+)>?(?:\s+[^)\n]*)?\)')
+HTML_IMAGE_RE = re.compile(r'<img\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)["\']', re.I)
+IMG_TAG_RE = re.compile(r'<img\b[^>]*>', re.I)
+SRC_ATTR_RE = re.compile(r'\bsrc\s*=\s*"([^"]*)"', re.I)
+
+def git_blob_hash(data):
+    """与 git hash-object 相同的对象id，本地目录和Git分支中的同一张图片得到相同的键"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def find_image_refs(content):
+    """Markdown源文本中引用的图片地址（去重，保持顺序）"""
+    refs = MD_IMAGE_RE.findall(content) if '![' in content else []
+    if '<img' in content:
+        refs.extend(HTML_IMAGE_RE.findall(content))
+    return list(dict.fromkeys(refs))
+
+def resolve_image_path(article_path, src):
+    """把图片地址解析为文章仓库中的路径，外部图片或越界路径返回None"""
+    if ':' in src.split('/', 1)[0] or src.startswith('//'):
+        return None
+    src = unquote(src.split('#', 1)[0].split('?', 1)[0])
+    if not src or posixpath.splitext(src)[1].lower() not in IMAGE_SUFFIXES:
+        return None
+    if src.startswith('/'):
+        path = posixpath.normpath(src.lstrip('/'))
+    else:
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(article_path), src))
+    if path.startswith('../') or path == '..':
+        return None
+    return path
+
+def read_image_size(data):
+    """不依赖Pillow，从PNG/GIF/JPEG/WebP文件头读取 (宽, 高)，无法识别时返回None"""
+    try:
+        if data[:8] == b'\x89PNG\r\n\x1a\n':
+            return struct.unpack('>II', data[16:24])
+        if data[:6] in (b'GIF87a', b'GIF89a'):
+            return struct.unpack('<HH', data[6:10])
+        if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+            chunk = data[12:16]
+            if chunk == b'VP8 ':
+                w, h = struct.unpack('<HH', data[26:30])
+                return w & 0x3fff, h & 0x3fff
+            if chunk == b'VP8L':
+                bits = int.from_bytes(data[21:25], 'little')
+                return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+            if chunk == b'VP8X':
+                return (int.from_bytes(data[24:27], 'little') + 1,
+                        int.from_bytes(data[27:30], 'little') + 1)
+        if data[:2] == b'\xff\xd8':
+            pos = 2
+            while pos + 9 < len(data):
+                if data[pos] != 0xff:
+                    pos += 1
+                    continue
+                marker = data[pos + 1]
+                # SOF0-SOF15（除去DHT/JPG/DAC）记录了图片尺寸
+                if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+                    h, w = struct.unpack('>HH', data[pos + 5:pos + 9])
+                    return w, h
+                pos += 2 + struct.unpack('>H', data[pos + 2:pos + 4])[0]
+    except struct.error:
+        pass
+    return None
+
+_pillow = None
+
+def load_pillow():
+    """延迟导入Pillow（只在有图片时需要），未安装时返回None"""
+    global _pillow
+    if _pillow is None:
+        try:
+            from PIL import Image
+            Image.init()
+            _pillow = Image
+        except ImportError:
+            _pillow = False
+    return _pillow or None
+
+def available_formats(formats):
+    """Pillow能够写出的格式"""
+    Image = load_pillow()
+    if Image is None:
+        return []
+    return [fmt for fmt in formats if fmt in FORMATS and FORMATS[fmt][0] in Image.SAVE]
+
+def settings_fingerprint(settings):
+    """处理参数和Pillow版本，变化时缓存失效"""
+    return json.dumps({
+        'version': CACHE_VERSION,
+        'widths': sorted(settings['widths']),
+        'formats': available_formats(settings['formats']),
+        'quality': settings['quality'],
+        'pillow': getattr(load_pillow(), '__version__', None)
+    }, sort_keys=True)
+
+def encode_image(data, key, suffix, settings):
+    """生成各宽度、各格式的图片并写入缓存，返回元数据
+
+    在进程池中执行；先写到临时目录再改名，并发构建不会读到写了一半的结果。
+    """
+    cache_dir = IMAGE_CACHE_DIR / key[:2] / key
+    tmp_dir = cache_dir.with_name(f"{key}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    (tmp_dir / f"original{suffix}").write_bytes(data)
+
+    meta = {'suffix': suffix, 'size': read_image_size(data), 'variants': {}}
+    formats = available_formats(settings['formats'])
+    if formats and suffix not in RAW_SUFFIXES:
+        try:
+            meta['size'], meta['variants'] = encode_variants(data, tmp_dir, formats, settings)
+        except Exception as e:
+            # 无法解码的图片只保留原图
+            print(f"⚠ 图片编码失败（{key[:16]}{suffix}）: {e}")
+            for path in tmp_dir.glob("*.*"):
+                if not path.name.startswith("original"):
+                    path.unlink()
+
+    with open(tmp_dir / "meta.json", 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    try:
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        # 其他进程已经写入了相同的结果
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return meta
+
+def encode_variants(data, out_dir, formats, settings):
+    """用Pillow缩放并编码，返回 ([宽, 高], {MIME类型: [[宽度, 文件名]]})"""
+    import io
+    from PIL import ImageOps
+    Image = load_pillow()
+
+    variants = {}
+    with Image.open(io.BytesIO(data)) as img:
+        # 浏览器按EXIF方向显示原图，宽高也要按旋转后的计算
+        img = ImageOps.exif_transpose(img)
+        width, height = img.size
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info or 'A' in img.mode else 'RGB')
+        # 比原图窄的宽度，再加上原图宽度（不超过最大宽度）
+        max_width = max(settings['widths'])
+        widths = sorted({w for w in settings['widths'] if w < width} | {min(width, max_width)})
+        for fmt in formats:
+            pil_format, mime = FORMATS[fmt]
+            variants[mime] = []
+            for w in widths:
+                resized = img if w == width else img.resize(
+                    (w, max(1, round(height * w / width))), Image.LANCZOS)
+                name = f"{w}.{fmt}"
+                resized.save(out_dir / name, pil_format, quality=settings['quality'])
+                variants[mime].append([w, name])
+    return [width, height], variants
+
+def load_cached(key):
+    """读取缓存中的元数据，并刷新mtime供淘汰时排序"""
+    meta_file = IMAGE_CACHE_DIR / key[:2] / key / "meta.json"
+    try:
+        with open(meta_file, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        os.utime(meta_file)
+        return meta
+    except (OSError, ValueError):
+        return None
+
+def prune_image_cache(max_bytes=IMAGE_CACHE_MAX_BYTES):
+    """按最近使用时间淘汰图片缓存（整张图片的所有版本一起删除）"""
+    if not IMAGE_CACHE_DIR.exists():
+        return 0
+
+    entries = []
+    for meta_file in IMAGE_CACHE_DIR.glob("*/*/meta.json"):
+        try:
+            mtime = meta_file.stat().st_mtime
+            size = sum(p.stat().st_size for p in meta_file.parent.iterdir())
+        except OSError:
+            continue
+        entries.append((mtime, size, meta_file.parent))
+    return prune_lru(entries, max_bytes, lambda cache_dir: shutil.rmtree(cache_dir, ignore_errors=True))
+
+class DirImageSource:
+    """本地目录中的图片"""
+
+    def __init__(self, articles_dir):
+        self.articles_dir = Path(articles_dir)
+        self._data = {}
+
+    def lookup(self, path):
+        """返回图片的blob哈希，文件不存在时返回None"""
+        try:
+            data = (self.articles_dir / path).read_bytes()
+        except OSError:
+            return None
+        self._data[path] = data
+        return git_blob_hash(data)
+
+    def read(self, path):
+        return self._data.pop(path, None) or (self.articles_dir / path).read_bytes()
+
+class GitImageSource:
+    """Git分支中的图片；blob id就是内容哈希，缓存命中时不必读取图片"""
+
+    def __init__(self, blobs, reader):
+        self.blobs = blobs
+        self.reader = reader
+
+    def lookup(self, path):
+        return self.blobs.get(path)
+
+    def read(self, path):
+        return self.reader.read(self.blobs[path])
+
+class ImagePipeline:
+    """收集文章引用的图片，编码缺失的版本，并把结果写入构建目录"""
+
+    def __init__(self, settings=None, output_dir=OUTPUT_DIR):
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self.output_dir = output_dir
+        self._fingerprint = None
+        self.source = None
+        self.records = {}
+        self.pending = {}
+        self.stats = {'images': 0, 'encoded': 0, 'hits': 0, 'missing': 0}
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = settings_fingerprint(self.settings)
+        return self._fingerprint
+
+    def add_article(self, article_path, content):
+        """登记文章引用的本地图片，返回 [(原地址, 仓库路径)]"""
+        refs = []
+        for src in find_image_refs(content):
+            path = resolve_image_path(article_path, src)
+            if path is not None and self.add_image(path):
+                refs.append((src, path))
+        return refs
+
+    def add_image(self, path):
+        """登记一张图片（源中的路径），图片不存在时返回False"""
+        if path in self.records or path in self.pending:
+            return True
+        oid = self.source.lookup(path) if self.source else None
+        if oid is None:
+            self.stats['missing'] += 1
+            print(f"⚠ 图片不存在: {path}")
+            return False
+        key = hashlib.sha256(f"{self.fingerprint}\0{oid}".encode('utf-8')).hexdigest()
+        suffix = posixpath.splitext(path)[1].lower()
+        meta = load_cached(key)
+        if meta is not None:
+            self.records[path] = (key, meta)
+            self.stats['hits'] += 1
+        else:
+            # 原图在读取文章时取出，Git对象读取器和临时克隆在之后就会关闭
+            self.pending[path] = (key, suffix, self.source.read(path))
+        return True
+
+    def encode_pending(self, jobs=1):
+        """编码缓存中没有的图片，jobs > 1 时使用进程池"""
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        args = [(data, key, suffix, self.settings) for key, suffix, data in pending.values()]
+        if jobs > 1 and len(args) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(encode_image, *zip(*args)))
+        else:
+            results = [encode_image(*arg) for arg in args]
+
+        for (path, (key, _, _)), meta in zip(pending.items(), results):
+            self.records[path] = (key, meta)
+        self.stats['encoded'] += len(results)
+        profiler.add('images_encoded', len(results))
+
+    def image_urls(self, path):
+        """输出地址：(原图地址, 宽高, {MIME类型: [[宽度, 地址]]})"""
+        key, meta = self.records[path]
+        base = f"/{self.output_dir}/{key[:16]}"
+        variants = {
+            mime: [[w, f"{base}-{file_name}"] for w, file_name in files]
+            for mime, files in meta['variants'].items()
+        }
+        return f"{base}{meta['suffix']}", meta['size'], variants
+
+    def image_record(self, path):
+        """改写 <img> 用到的信息：原图地址、宽高、各格式的srcset"""
+        src, size, variants = self.image_urls(path)
+        return {
+            'src': src,
+            'size': size,
+            'sources': [
+                [mime, ", ".join(f"{url} {w}w" for w, url in urls)]
+                for mime, urls in variants.items()
+            ],
+            'sizes': self.settings['sizes']
+        }
+
+    def write(self, build_dir, originals=True):
+        """把原图和生成的版本从缓存复制到构建目录，返回写入的文件数
+
+        originals 为False时，只在没有生成其他版本的图片上写入原图。
+        """
+        out_dir = Path(build_dir) / self.output_dir
+        out_dir.mkdir(parents=True, exist_ok=True)
+        written = 0
+        for key, meta in self.records.values():
+            cache_dir = IMAGE_CACHE_DIR / key[:2] / key
+            files = []
+            if originals or not meta['variants']:
+                files.append((f"original{meta['suffix']}", f"{key[:16]}{meta['suffix']}"))
+            files.extend((file_name, f"{key[:16]}-{file_name}")
+                         for variants in meta['variants'].values() for _, file_name in variants)
+            for cache_name, out_name in files:
+                target = out_dir / out_name
+                if target.exists():
+                    continue
+                # 优先硬链接，避免复制大文件
+                try:
+                    os.link(cache_dir / cache_name, target)
+                except OSError:
+                    shutil.copyfile(cache_dir / cache_name, target)
+                written += 1
+        self.stats['images'] = len(self.records)
+        return written
+
+def rewrite_images(html_content, images):
+    """把渲染结果中的本地图片改写为 <picture>，images 为 {原地址: image_record}"""
+    def replace(match):
+        tag = match.group()
+        src = SRC_ATTR_RE.search(tag)
+        record = images.get(html.unescape(src.group(1))) if src else None
+        if record is None:
+            return tag
+
+        attrs = tag[4:].rstrip('/>').rstrip()
+        attrs = attrs[:src.start() - 4] + f'src="{record["src"]}"' + attrs[src.end() - 4:]
+        lower = attrs.lower()
+        if record['size'] and 'width=' not in lower and 'height=' not in lower:
+            attrs += f' width="{record["size"][0]}" height="{record["size"][1]}"'
+        if 'loading=' not in lower:
+            attrs += ' loading="lazy"'
+        if 'decoding=' not in lower:
+            attrs += ' decoding="async"'
+        img = f"<img{attrs} />"
+        if not record['sources']:
+            return img
+
+        sources = "".join(
+            f'<source type="{mime}" srcset="{srcset}" sizes="{record["sizes"]}" />'
+            for mime, srcset in record['sources']
+        )
+        return f"<picture>{sources}{img}</picture>"
+
+    return IMG_TAG_RE.sub(replace, html_content)
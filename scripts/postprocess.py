@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+构建输出后处理：压缩HTML/CSS，为文本文件生成 .gz / .br 预压缩版本，
+并把暂存目录按内容差异同步到输出目录
+
+预压缩结果按内容哈希缓存在 .cache/compress，内容没有变化的文件直接复用上次的结果。
+"""
+
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from profiling import profiler
+from cache_files import write_atomic, file_entries, prune_lru
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_CACHE_DIR = Path(".cache/compress")
+COMPRESS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+TEXT_SUFFIXES = {'.html', '.css', '.js', '.json', '.xml', '.svg', '.txt'}
+MIN_COMPRESS_SIZE = 256
+
+# 内容中空白有意义的标签，原样保留
+RAW_TAG_RE = re.compile(r'(<(pre|textarea|script|style)\b[^>]*>.*?</\2\s*>)', re.S | re.I)
+COMMENT_RE = re.compile(r'<!--(?!\[if).*?-->', re.S)
+SPACE_RE = re.compile(r'\s+')
+CSS_TOKEN_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.S)
+CSS_STRING_RE = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+CSS_PUNCT_RE = re.compile(r'\s*([{};,>])\s*')
+
+def minify_css(css):
+    """删除注释和多余空白（字符串原样保留）"""
+    css = CSS_TOKEN_RE.sub(lambda m: m.group(1) or '', css)
+    parts = CSS_STRING_RE.split(css)
+    # split带捕获组，奇数位置是字符串
+    return ''.join(
+        part if i % 2 else _minify_css_code(part) for i, part in enumerate(parts)
+    ).strip()
+
+def _minify_css_code(code):
+    code = SPACE_RE.sub(' ', code)
+    code = CSS_PUNCT_RE.sub(r'\1', code)
+    # 冒号前的空格在选择器中有意义（a :hover），只去掉冒号后的
+    code = code.replace(': ', ':')
+    return code.replace(';}', '}')
+
+def minify_html(html):
+    """删除注释、合并连续空白；pre/textarea/script原样保留，style中的CSS单独压缩"""
+    parts = []
+    last = 0
+    for match in RAW_TAG_RE.finditer(html):
+        parts.append(_minify_html_text(html[last:match.start()]))
+        block = match.group(1)
+        if match.group(2).lower() == 'style':
+            open_end = block.index('>') + 1
+            close_start = block.rindex('</')
+            block = block[:open_end] + minify_css(block[open_end:close_start]) + block[close_start:]
+        parts.append(block)
+        last = match.end()
+    parts.append(_minify_html_text(html[last:]))
+    return ''.join(parts).strip()
+
+def _minify_html_text(text):
+    text = COMMENT_RE.sub('', text)
+    # 空白只合并不删除，避免改变行内元素之间的间距
+    return SPACE_RE.sub(lambda m: '\n' if '\n' in m.group() else ' ', text)
+
+def minify_file(path):
+    """原地压缩HTML/CSS文件，返回节省的字节数"""
+    minifier = {'.html': minify_html, '.css': minify_css}.get(path.suffix)
+    if minifier is None:
+        return 0
+    data = path.read_bytes()
+    minified = minifier(data.decode('utf-8')).encode('utf-8')
+    if len(minified) >= len(data):
+        return 0
+    path.write_bytes(minified)
+    return len(data) - len(minified)
+
+def compress_gzip(data):
+    # mtime固定为0，相同内容得到相同的输出
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def compress_brotli(data):
+    return brotli.compress(data, quality=11)
+
+def get_compressors():
+    """可用的压缩方式 [(扩展名, 函数)]"""
+    compressors = [('.gz', compress_gzip)]
+    if brotli is not None:
+        compressors.append(('.br', compress_brotli))
+    return compressors
+
+def precompress_file(path, compressors):
+    """写入预压缩版本，返回 (写入的文件数, 复用缓存的文件数)"""
+    data = path.read_bytes()
+    key = hashlib.sha256(data).hexdigest()
+    written = hits = 0
+    for suffix, compress in compressors:
+        cache_file = COMPRESS_CACHE_DIR / key[:2] / f"{key}{suffix}"
+        try:
+            compressed = cache_file.read_bytes()
+            os.utime(cache_file)
+            hits += 1
+        except OSError:
+            compressed = compress(data)
+            try:
+                write_atomic(cache_file, compressed)
+            except OSError:
+                pass
+        # 压缩后反而更大时不写入，服务器会直接返回原文件
+        if len(compressed) < len(data):
+            path.with_name(path.name + suffix).write_bytes(compressed)
+            written += 1
+    return written, hits
+
+def prune_compress_cache(max_bytes=COMPRESS_CACHE_MAX_BYTES):
+    """按最近使用时间淘汰预压缩缓存"""
+    if not COMPRESS_CACHE_DIR.exists():
+        return 0
+    return prune_lru(file_entries(COMPRESS_CACHE_DIR.glob("*/*")), max_bytes)
+
+def postprocess_site(build_dir, minify=True, precompress=True, jobs=1):
+    """压缩并预压缩构建输出，返回统计信息"""
+    files = sorted(
+        path for path in Path(build_dir).rglob("*")
+        if path.is_file() and path.suffix in TEXT_SUFFIXES
+    )
+    stats = {'files': len(files), 'saved': 0, 'written': 0, 'hits': 0}
+
+    def process(path):
+        saved = minify_file(path) if minify else 0
+        written = hits = 0
+        if precompress and path.stat().st_size >= MIN_COMPRESS_SIZE:
+            written, hits = precompress_file(path, compressors)
+        return saved, written, hits
+
+    compressors = get_compressors()
+    # zlib和brotli压缩时释放GIL，线程池即可并行
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for saved, written, hits in pool.map(process, files):
+            stats['saved'] += saved
+            stats['written'] += written
+            stats['hits'] += hits
+
+    profiler.add('bytes_minified', stats['saved'])
+    profiler.add('compressed_files', stats['written'])
+    profiler.add('compress_cache_hits', stats['hits'])
+    return stats
+
+MANIFEST_NAME = "manifest.json"
+
+def hash_file(path):
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+def load_manifest(output_dir):
+    try:
+        with open(Path(output_dir) / MANIFEST_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def sync_output(staging_dir, output_dir, keep=()):
+    """把暂存目录中内容有变化的文件移入输出目录，删除多余的文件，并写入 manifest.json（路径 -> SHA-256）
+
+    内容没有变化的文件不会被改写，修改时间保持不变；keep 中的文件（本次没有重新生成）原样保留。
+    返回 (变化的文件数, 未变化的文件数, 删除的文件数)
+    """
+    staging_dir, output_dir = Path(staging_dir), Path(output_dir)
+    old_manifest = load_manifest(output_dir)
+
+    staged = {}
+    for path in sorted(staging_dir.rglob("*")):
+        if path.is_file():
+            staged[path.relative_to(staging_dir).as_posix()] = hash_file(path)
+    manifest = {rel: old_manifest[rel] for rel in keep if rel in old_manifest}
+    manifest.update(staged)
+
+    # 先删除多余的文件，避免与新文件的目录冲突
+    removed = 0
+    if output_dir.exists():
+        for path in sorted(output_dir.rglob("*"), reverse=True):
+            rel = path.relative_to(output_dir).as_posix()
+            if path.is_file() and rel not in manifest and rel != MANIFEST_NAME:
+                path.unlink()
+                removed += 1
+            elif path.is_dir() and not any(path.iterdir()):
+                path.rmdir()
+
+    # 沿用的文件计入未变化
+    changed = 0
+    unchanged = len(manifest) - len(staged)
+    for rel, digest in staged.items():
+        target = output_dir / rel
+        if target.is_file():
+            # 上次的清单可信时不必重新读取旧文件
+            if old_manifest.get(rel) == digest or hash_file(target) == digest:
+                unchanged += 1
+                continue
+        elif target.is_dir():
+            shutil.rmtree(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staging_dir / rel, target)
+        changed += 1
+
+    data = json.dumps(manifest, ensure_ascii=False, indent=1, sort_keys=True) + "\n"
+    manifest_file = output_dir / MANIFEST_NAME
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if old_manifest != manifest or not manifest_file.exists():
+        manifest_file.write_text(data, encoding='utf-8')
+    shutil.rmtree(staging_dir)
+
+    profiler.add('output_changed', changed)
+    profiler.add('output_removed', removed)
+    return changed, unchanged, removed
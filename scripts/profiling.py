@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+构建过程计时与统计（输出Chrome trace-event格式）
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+class BuildProfiler:
+    """嵌套计时器 + 计数器，未启用时开销接近于零"""
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.counters = {}
+        self._hook_installed = False
+
+    def enable(self):
+        """启用统计，并通过审计钩子统计子进程调用"""
+        self.enabled = True
+        if not self._hook_installed:
+            sys.addaudithook(self._audit_hook)
+            self._hook_installed = True
+
+    def _audit_hook(self, event, args):
+        if event == 'subprocess.Popen' and self.enabled:
+            self.add('subprocess_calls')
+
+    def record_startup(self):
+        """记录进程启动（解释器初始化和模块导入）消耗的CPU时间和已导入的模块数"""
+        self.add('startup_cpu_ms', round(time.process_time() * 1000, 1))
+        self.add('modules_loaded', len(sys.modules))
+
+    def add(self, name, value=1):
+        """累加计数器"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def span(self, name, cat='phase', **args):
+        """记录一段耗时，可嵌套"""
+        if not self.enabled:
+            yield
+            return
+
+        ts = time.time_ns() // 1000
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            event = {
+                'name': name,
+                'cat': cat,
+                'ph': 'X',
+                'ts': ts,
+                'dur': (time.perf_counter_ns() - start) // 1000,
+                'pid': os.getpid(),
+                'tid': threading.get_ident()
+            }
+            if args:
+                event['args'] = args
+            self.events.append(event)
+
+    def drain(self):
+        """取出并清空已记录的数据（用于子进程回传）"""
+        events, counters = self.events, self.counters
+        self.events, self.counters = [], {}
+        return events, counters
+
+    def merge(self, events, counters):
+        """合并子进程回传的数据"""
+        self.events.extend(events)
+        for name, value in counters.items():
+            self.add(name, value)
+
+    def peak_rss_kb(self):
+        """当前进程与子进程的峰值内存（KB）"""
+        if resource is None:
+            return None
+        scale = 1024 if sys.platform == 'darwin' else 1
+        own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale
+        children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+        return {'self': own, 'children': children}
+
+    def slowest(self, cat='article', top=10):
+        """耗时最长的若干事件"""
+        events = [e for e in self.events if e['cat'] == cat]
+        events.sort(key=lambda e: e['dur'], reverse=True)
+        return events[:top]
+
+    def step_totals(self):
+        """按步骤汇总每页的耗时（次数、总计、平均）"""
+        totals = {}
+        for e in self.events:
+            if e['cat'] == 'step':
+                count, dur = totals.get(e['name'], (0, 0))
+                totals[e['name']] = (count + 1, dur + e['dur'])
+        return {
+            name: {'count': count, 'ms': round(dur / 1000, 2), 'mean_ms': round(dur / 1000 / count, 3)}
+            for name, (count, dur) in sorted(totals.items(), key=lambda item: -item[1][1])
+        }
+
+    def summary(self, top=10):
+        """汇总统计"""
+        phases = [
+            {'name': e['name'], 'ms': round(e['dur'] / 1000, 2)}
+            for e in sorted(self.events, key=lambda e: e['ts'])
+            if e['cat'] == 'phase'
+        ]
+        slowest = [
+            {'name': e['name'], 'ms': round(e['dur'] / 1000, 2), **e.get('args', {})}
+            for e in self.slowest('article', top)
+        ]
+        return {
+            'phases': phases,
+            'counters': dict(sorted(self.counters.items())),
+            'steps': self.step_totals(),
+            'peak_rss_kb': self.peak_rss_kb(),
+            'slowest_articles': slowest
+        }
+
+    def write_trace(self, path, top=10):
+        """写入Chrome trace-event JSON（chrome://tracing 或 Perfetto 打开）"""
+        trace = {
+            'traceEvents': sorted(self.events, key=lambda e: e['ts']),
+            'displayTimeUnit': 'ms',
+            'otherData': self.summary(top)
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f, ensure_ascii=False)
+
+    def print_summary(self, top=10):
+        """打印汇总"""
+        summary = self.summary(top)
+        print("⏱ 阶段耗时:")
+        for phase in summary['phases']:
+            print(f"  {phase['name']}: {phase['ms']} ms")
+        print("🔢 计数:")
+        for name, value in summary['counters'].items():
+            print(f"  {name}: {value}")
+        if summary['steps']:
+            print("📄 每页步骤耗时:")
+            for name, step in summary['steps'].items():
+                print(f"  {name}: {step['count']} 次，共 {step['ms']} ms，平均 {step['mean_ms']} ms")
+        if summary['peak_rss_kb']:
+            rss = summary['peak_rss_kb']
+            print(f"💾 峰值内存: {rss['self'] / 1024:.1f} MB (子进程 {rss['children'] / 1024:.1f} MB)")
+        if summary['slowest_articles']:
+            print(f"🐢 最慢的 {len(summary['slowest_articles'])} 篇文章:")
+            for article in summary['slowest_articles']:
+                print(f"  {article['ms']} ms  {article['name']}")
+
+profiler = BuildProfiler()
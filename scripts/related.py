@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+相关文章
+
+每篇文章的签名为出现次数最多的若干个词（与搜索索引相同的切词：英文单词、中日文二元组）
+的哈希和词频，只取决于文章内容，按内容哈希追加写入 .cache/related，增量构建只为变化的文章
+重新切词；签名不常驻内存，计算时分批读出两遍：先统计词的文档频率，再逐批计算 TF-IDF，
+每篇文章只保留权重最高的词。之后以分块的稀疏矩阵乘积
+（NumPy 的 bincount 累加）求余弦相似度，取每篇文章最相似的几篇。未安装NumPy时用纯Python
+计算同样的结果，只是较慢。
+
+同一个索引再次计算时（预览服务器），只为签名或词的文档频率变化的文章重新计算向量，
+只为向量变化的文章和与它们共享词的文章重新计算相关文章。
+"""
+
+import math
+import zlib
+import heapq
+import hashlib
+from array import array
+from collections import Counter
+from pathlib import Path
+
+from search_index import tokenize
+from profiling import profiler
+from cache_files import RecordStore
+
+RELATED_CACHE_DIR = Path(".cache/related")
+SIGNATURE_FILE = RELATED_CACHE_DIR / "signatures.bin"
+SIGNATURE_INDEX = RELATED_CACHE_DIR / "signatures.json"
+# 签名缓存中无用的记录超过一半且多于此大小时整理
+COMPACT_MIN_BYTES = 1 << 20
+
+# 签名保留的词数
+SIGNATURE_TERMS = 256
+DEFAULT_SETTINGS = {
+    'count': 5,
+    # 计算相似度时每篇文章保留的词数
+    'terms': 64,
+    # 低于此相似度的文章不列出
+    'minScore': 0.05,
+    # 出现在超过此比例的文章中的词视为停用词
+    'maxDocFreq': 0.5
+}
+
+# 每块的 查询文章数 x 全部文章数 不超过此值
+BLOCK_CELLS = 1 << 19
+# 每块展开的倒排表项数不超过此值（词的文章数很多时限制内存）
+BLOCK_POSTINGS = 1 << 18
+# 每批读出的签名数
+VECTOR_CHUNK = 256
+
+def load_numpy():
+    """NumPy是可选依赖"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def make_signature(content):
+    """文章内容 -> (词哈希, 词频) 两个数组，按词频从高到低取 SIGNATURE_TERMS 个"""
+    counts = Counter(tokenize(content))
+    hashed = [(-tf, zlib.crc32(term.encode('utf-8'))) for term, tf in counts.items()]
+    top = [(term, -tf) for tf, term in heapq.nsmallest(SIGNATURE_TERMS, hashed)]
+    return array('I', [term for term, _ in top]), array('I', [tf for _, tf in top])
+
+class SignatureStore(RecordStore):
+    """按内容哈希缓存的签名，记录为词哈希数组和词频数组"""
+
+    def __init__(self, data_file=SIGNATURE_FILE, index_file=SIGNATURE_INDEX):
+        super().__init__(data_file, index_file, COMPACT_MIN_BYTES)
+
+    def add(self, key, signature):
+        terms, tfs = signature
+        super().add(key, terms.tobytes() + tfs.tobytes())
+
+    def get(self, key):
+        values = array('I')
+        values.frombytes(super().get(key))
+        n = len(values) // 2
+        return values[:n], values[n:]
+
+def _score_blocks(np, queries, row_ptr, cols, weights, csc, width):
+    """
+    分块计算查询文章与倒排表 csc（词 -> 文章）中各文章的相似度，逐块返回 (查询文章, 相似度矩阵)
+
+    每块的 查询文章数 x width 不超过 BLOCK_CELLS，展开的倒排表项数（查询文章各词的文章数之和）
+    不超过 BLOCK_POSTINGS；单篇文章超过时单独成块。
+    """
+    col_ptr, post_rows, post_weights = csc
+    col_len = np.diff(col_ptr)
+    entry_cost = np.concatenate(([0], np.cumsum(col_len[cols])))
+    row_cost = entry_cost[row_ptr[queries + 1]] - entry_cost[row_ptr[queries]]
+    cost = np.concatenate(([0], np.cumsum(row_cost)))
+    max_rows = max(1, BLOCK_CELLS // width)
+
+    start = 0
+    while start < len(queries):
+        stop = int(np.searchsorted(cost, cost[start] + BLOCK_POSTINGS, side='right')) - 1
+        stop = max(start + 1, min(len(queries), start + max_rows, stop))
+        block = queries[start:stop]
+        start = stop
+
+        # 取出查询文章的词
+        counts = row_ptr[block + 1] - row_ptr[block]
+        seg = np.repeat(row_ptr[block] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        q_rows = np.repeat(np.arange(len(block)), counts)
+        q_cols, q_weights = cols[seg], weights[seg]
+
+        # 展开查询词的倒排表：每个 (查询文章, 词) 对应该词出现的所有文章
+        lens = col_len[q_cols]
+        total = int(lens.sum())
+        offsets = np.repeat(col_ptr[q_cols] - np.cumsum(lens) + lens, lens) + np.arange(total)
+        keys = np.repeat(q_rows, lens) * width + post_rows[offsets]
+        values = np.repeat(q_weights, lens) * post_weights[offsets]
+        scores = np.bincount(keys, weights=values, minlength=len(block) * width)
+        yield block, scores.reshape(len(block), width)
+
+class RelatedIndex:
+    """收集文章签名，计算每篇文章的相关文章"""
+
+    def __init__(self, settings=None):
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        # 文章路径 -> 内容哈希，签名在 self.store 中
+        self.docs = {}
+        self.store = None
+        # 上次计算的文章向量和结果，下次只重新计算受影响的文章
+        self._previous = None
+        self.stats = {'hits': 0, 'computed': 0, 'rows': 0, 'merged': 0}
+
+    def add_document(self, path, content):
+        """添加或更新一篇文章，内容没有变化时直接使用缓存的签名"""
+        if self.store is None:
+            self.store = SignatureStore()
+        key = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        if key in self.store:
+            self.stats['hits'] += 1
+        else:
+            self.store.add(key, make_signature(content))
+            self.stats['computed'] += 1
+        self.docs[path] = key
+
+    def remove_document(self, path):
+        self.docs.pop(path, None)
+
+    def save(self):
+        """写入签名缓存，无用的签名过多时只保留当前文章的签名"""
+        if self.store is not None:
+            self.store.save(self.docs.values())
+
+    def compute(self):
+        """返回 {文章路径: [相关文章路径]}，按相似度从高到低"""
+        paths = sorted(self.docs)
+        if len(paths) < 2 or self.settings['count'] <= 0:
+            return {path: [] for path in paths}
+        np = load_numpy()
+        with profiler.span("related", cat='step'):
+            if np is None:
+                self.stats['rows'] = len(paths)
+                return self._compute_python(paths)
+            return self._compute_numpy(np, paths)
+
+    def _compute_numpy(self, np, paths):
+        settings = self.settings
+        n = len(paths)
+        keys = [self.docs[path] for path in paths]
+
+        # 第一遍：词表和文档频率，逐批合并
+        vocab = np.zeros(0, dtype=np.uint32)
+        df = np.zeros(0, dtype=np.int64)
+        for _, _, terms, _ in self._chunks(np, keys):
+            terms, counts = np.unique(terms, return_counts=True)
+            vocab, inverse = np.unique(np.concatenate((vocab, terms)), return_inverse=True)
+            df = np.bincount(inverse, weights=np.concatenate((df, counts))).astype(np.int64)
+
+        previous = self._previous
+        count = settings['count']
+        k = min(count, n - 1)
+        min_score = settings['minScore']
+        # 合并依赖 “不在结果中的文章相似度都更低”，相似度为0的文章也可能列出时不成立
+        incremental = previous is not None and previous['paths'] == paths and min_score > 0
+        if incremental:
+            # 签名变化的文章，以及含有文档频率变化的词的文章，重新计算向量，其余沿用上次的向量
+            _, new_idx, old_idx = np.intersect1d(vocab, previous['vocab'], assume_unique=True,
+                                                 return_indices=True)
+            df_changed = np.ones(len(vocab), dtype=bool)
+            df_changed[new_idx[df[new_idx] == previous['df'][old_idx]]] = False
+            recompute = np.zeros(n, dtype=bool)
+            recompute[[i for i, key in enumerate(keys) if key != previous['keys'][i]]] = True
+            new_rows, new_cols, new_weights = self._chunk_vectors(np, n, keys, vocab, df,
+                                                                  recompute, df_changed)
+            old_ptr = previous['row_ptr']
+            old_rows = np.repeat(np.arange(n), np.diff(old_ptr))
+            seg = ~recompute[old_rows]
+            rows = np.concatenate((old_rows[seg], new_rows))
+            cols = np.concatenate((np.searchsorted(vocab, previous['hashes'][seg]), new_cols))
+            weights = np.concatenate((previous['weights'][seg], new_weights))
+            # 每篇文章的词都来自同一处，按文章稳定排序后顺序不变
+            order = np.argsort(rows, kind='stable')
+            rows, cols, weights = rows[order], cols[order], weights[order]
+        else:
+            rows, cols, weights = self._chunk_vectors(np, n, keys, vocab, df)
+        row_ptr = np.searchsorted(rows, np.arange(n + 1))
+        hashes = vocab[cols]
+
+        # 与上次计算比较，向量变化的文章及相关文章中有这些文章的，整行重新计算；
+        # 其余与变化的向量共享词的文章，只把变化的文章作为候选并入原有的结果
+        if incremental:
+            related, scores = dict(previous['related']), dict(previous['scores'])
+            changed = [
+                i for i in np.flatnonzero(recompute).tolist()
+                if not (np.array_equal(hashes[row_ptr[i]:row_ptr[i + 1]],
+                                       previous['hashes'][old_ptr[i]:old_ptr[i + 1]])
+                        and np.array_equal(weights[row_ptr[i]:row_ptr[i + 1]],
+                                           previous['weights'][old_ptr[i]:old_ptr[i + 1]]))
+            ]
+            changed_set = set(changed)
+            position = {path: i for i, path in enumerate(paths)}
+            queries = [i for i, path in enumerate(paths) if i in changed_set
+                       or any(position[p] in changed_set for p in related[path])]
+            changed = np.array(changed, dtype=np.int64)
+            queries = np.array(queries, dtype=np.int64)
+        else:
+            related, scores = {}, {}
+            changed = queries = np.arange(n)
+        self._previous = {
+            'paths': paths, 'keys': keys, 'vocab': vocab, 'df': df,
+            'row_ptr': row_ptr, 'hashes': hashes, 'weights': weights,
+            'related': related, 'scores': scores
+        }
+        self.stats['rows'] = self.stats['merged'] = 0
+        if not len(changed):
+            return dict(related)
+
+        # 按词排列的倒排表（CSC）
+        order = np.argsort(cols, kind='stable')
+        csc = (np.searchsorted(cols[order], np.arange(len(df) + 1)), rows[order], weights[order])
+
+        for block, block_scores in _score_blocks(np, queries, row_ptr, cols, weights, csc, n):
+            block_scores[np.arange(len(block)), block] = 0
+
+            # 每行取前k篇：先 argpartition，再按 (相似度, 路径顺序) 排序
+            top = np.argpartition(block_scores, n - k, axis=1)[:, n - k:]
+            top_scores = np.take_along_axis(block_scores, top, axis=1)
+            order = np.lexsort((top, -top_scores), axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+            for i, cands, cand_scores in zip(block.tolist(), top.tolist(), top_scores.tolist()):
+                kept = [(j, score) for j, score in zip(cands, cand_scores) if score >= min_score]
+                related[paths[i]] = [paths[j] for j, _ in kept]
+                scores[paths[i]] = [score for _, score in kept]
+        self.stats['rows'] = len(queries)
+
+        # 只需合并的文章：与变化的文章的相似度只用这些文章的倒排表计算，求和顺序与整行计算相同
+        in_changed = np.isin(rows, changed)
+        merge = np.isin(cols, np.unique(cols[in_changed]))
+        merge = np.setdiff1d(np.unique(rows[merge]), queries)
+        if len(merge):
+            order = np.argsort(cols[in_changed], kind='stable')
+            csc = (np.searchsorted(cols[in_changed][order], np.arange(len(df) + 1)),
+                   np.searchsorted(changed, rows[in_changed][order]), weights[in_changed][order])
+            changed = changed.tolist()
+            for block, block_scores in _score_blocks(np, merge, row_ptr, cols, weights, csc,
+                                                     len(changed)):
+                for i, row in zip(block.tolist(), block_scores.tolist()):
+                    path = paths[i]
+                    cands = [(-score, position[p]) for p, score in zip(related[path], scores[path])]
+                    cands += [(-score, j) for j, score in zip(changed, row) if score >= min_score]
+                    cands = sorted(cands)[:k]
+                    related[path] = [paths[j] for _, j in cands]
+                    scores[path] = [-score for score, _ in cands]
+            self.stats['merged'] = len(merge)
+        return dict(related)
+
+    def _chunks(self, np, keys):
+        """分批读出签名，逐批返回 (起始文章号, 批内文章号, 词哈希, 词频)"""
+        for start in range(0, len(keys), VECTOR_CHUNK):
+            signatures = [self.store.get(key) for key in keys[start:start + VECTOR_CHUNK]]
+            lengths = np.array([len(terms) for terms, _ in signatures], dtype=np.int64)
+            rows = np.repeat(np.arange(len(signatures)), lengths)
+            terms = np.frombuffer(b''.join(terms for terms, _ in signatures), dtype=np.uint32)
+            tfs = np.frombuffer(b''.join(tfs for _, tfs in signatures), dtype=np.uint32)
+            yield start, rows, terms, tfs
+
+    def _chunk_vectors(self, np, n, keys, vocab, df, recompute=None, df_changed=None):
+        """
+        第二遍：逐批计算 TF-IDF 向量 (rows, cols, weights)，只保留截断后的向量
+
+        给出 recompute 和 df_changed 时只计算签名变化（recompute 中已标出）或含有文档频率
+        变化的词的文章，并把它们标入 recompute。
+        """
+        parts = []
+        for start, rows, terms, tfs in self._chunks(np, keys):
+            cols = np.searchsorted(vocab, terms)
+            size = min(VECTOR_CHUNK, n - start)
+            if recompute is not None:
+                chunk = recompute[start:start + VECTOR_CHUNK]
+                chunk[rows[df_changed[cols]]] = True
+                seg = chunk[rows]
+                rows, cols, terms, tfs = rows[seg], cols[seg], terms[seg], tfs[seg]
+            rows, cols, weights = self._vectors(np, n, size, rows, cols, terms, tfs, df)
+            parts.append((rows + start, cols, weights))
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+    def _vectors(self, np, n, size, rows, cols, terms, tfs, df):
+        """一批文章的签名（按文章排列的词，文章号小于 size）-> TF-IDF 向量 (rows, cols, weights)"""
+        settings = self.settings
+        # TF-IDF；只出现在一篇文章中的词与相似度无关，出现得太多的词视为停用词
+        max_df = max(2, int(settings['maxDocFreq'] * n))
+        keep = (df[cols] >= 2) & (df[cols] <= max_df)
+        rows, cols, terms, tfs = rows[keep], cols[keep], terms[keep], tfs[keep]
+        idf = np.log((1 + n) / (1 + df)) + 1
+        weights = (1 + np.log(tfs)) * idf[cols]
+
+        # 每篇文章保留权重最高的词（权重相同时取哈希小的词），再归一化
+        order = np.lexsort((terms, -weights, rows))
+        rows, cols, weights = rows[order], cols[order], weights[order]
+        row_start = np.searchsorted(rows, np.arange(size))
+        keep = np.arange(len(rows)) - row_start[rows] < settings['terms']
+        rows, cols, weights = rows[keep], cols[keep], weights[keep]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=size))
+        return rows, cols, weights / norms[rows]
+
+    def _compute_python(self, paths):
+        settings = self.settings
+        n = len(paths)
+        df = Counter()
+        for path in paths:
+            df.update(self.store.get(self.docs[path])[0])
+        max_df = max(2, int(settings['maxDocFreq'] * n))
+
+        vectors = []
+        postings = {}
+        for i, path in enumerate(paths):
+            terms, tfs = self.store.get(self.docs[path])
+            weighted = [(-(1 + math.log(tf)) * (math.log((1 + n) / (1 + df[term])) + 1), term)
+                        for term, tf in zip(terms, tfs) if 2 <= df[term] <= max_df]
+            top = heapq.nsmallest(settings['terms'], weighted)
+            norm = math.sqrt(sum(w * w for w, _ in top)) or 1
+            vector = [(term, -w / norm) for w, term in top]
+            vectors.append(vector)
+            for term, w in vector:
+                postings.setdefault(term, []).append((i, w))
+
+        related = {}
+        for i, path in enumerate(paths):
+            scores = {}
+            for term, w in vectors[i]:
+                for j, w2 in postings[term]:
+                    scores[j] = scores.get(j, 0) + w * w2
+            scores.pop(i, None)
+            top = heapq.nsmallest(settings['count'], scores.items(), key=lambda item: (-item[1], item[0]))
+            related[path] = [paths[j] for j, score in top if score >= settings['minScore']]
+        return related
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+构建时全文搜索索引
+
+英文/数字按单词切分，中日文按二元组（bigram）切分。倒排表按词的前缀分片，
+浏览器只需下载查询词所在的分片；倒排表采用 文档号差值 + 词频 的varint编码，
+再用base64url压缩成字符串。
+
+索引增量维护，状态保存在 .cache/search：
+- 文档号稳定：新文章追加在末尾，删除的文章留下空位，空位过多时才重新编号；
+- 每篇文章的词频表按内容哈希缓存，内容没有变化的文章不再切词；
+- 只重新编码变化的文章所含的词所在的分片，其余分片和文档块沿用上次的文件。
+"""
+
+import re
+import json
+import base64
+import shutil
+import hashlib
+from array import array
+from collections import Counter
+from pathlib import Path
+
+from cache_files import write_atomic, RecordStore
+
+INDEX_VERSION = 1
+DOC_CHUNK = 500
+
+SEARCH_CACHE_DIR = Path(".cache/search")
+STATE_VERSION = 1
+# 切词和编码方式由本文件决定，文件变化时从头建立索引
+CODE_DIGEST = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+# 空位超过文章数的此比例（且至少 MIN_TOMBSTONES 个）时重新编号
+TOMBSTONE_RATIO = 0.25
+MIN_TOMBSTONES = 64
+# 一批最多处理的倒排表更新数，从头建立索引时分批进行，内存占用有上限
+UPDATE_BATCH = 1 << 18
+# 词频表缓存中无用的记录超过一半且多于此大小时整理
+COMPACT_MIN_BYTES = 1 << 20
+
+TOKEN_RE = re.compile(r'[a-z0-9]+|[\u3040-\u30ff\u3400-\u9fff\uf900-\ufaff]+')
+LINK_RE = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+MAX_WORD_LENGTH = 32
+
+def tokenize(text):
+    """切分文本：英文单词（至少2个字符）、中日文二元组（单字成词时保留单字）"""
+    text = LINK_RE.sub(r'\1', text).lower()
+    for match in TOKEN_RE.finditer(text):
+        token = match.group()
+        if token[0] < '\u0080':
+            if 2 <= len(token) <= MAX_WORD_LENGTH:
+                yield token
+        elif len(token) == 1:
+            yield token
+        else:
+            for i in range(len(token) - 1):
+                yield token[i:i + 2]
+
+def shard_key(term):
+    """分片键：英文取前两个字符，中日文按码位每16个字一组"""
+    if term[0] < '\u0080':
+        return term[:2]
+    return f"u{ord(term[0]) >> 4:x}"
+
+def encode_varints(numbers):
+    """无符号LEB128编码"""
+    out = bytearray()
+    for n in numbers:
+        while n >= 0x80:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+    return bytes(out)
+
+def decode_varints(data):
+    numbers = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            numbers.append(value)
+            value = shift = 0
+    return numbers
+
+def decode_postings(encoded):
+    """encode_postings 的逆运算，返回 [(文档号, 词频)]"""
+    numbers = decode_varints(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+    postings = []
+    doc_id = 0
+    for i in range(0, len(numbers), 2):
+        doc_id += numbers[i]
+        postings.append((doc_id, numbers[i + 1]))
+    return postings
+
+def encode_postings(postings):
+    """[(文档号, 词频)]（文档号递增）-> base64url字符串"""
+    numbers = []
+    last = 0
+    for doc_id, tf in postings:
+        numbers.append(doc_id - last)
+        numbers.append(tf)
+        last = doc_id
+    return base64.urlsafe_b64encode(encode_varints(numbers)).rstrip(b'=').decode('ascii')
+
+class TermCache(RecordStore):
+    """每篇文章的 (词列表, 词频数组)，按内容哈希追加写入 terms.bin，索引为 terms.json
+
+    内容没有变化的文章不必重新切词；删除或修改文章时，从这里读出它原来的词，
+    只更新这些词的倒排表。
+    """
+
+    def __init__(self, directory):
+        super().__init__(Path(directory) / "terms.bin", Path(directory) / "terms.json",
+                         COMPACT_MIN_BYTES)
+
+    def add(self, key, terms, tfs):
+        # 记录：词数（uint32）、词频数组、换行分隔的词
+        count = array('I', [len(tfs)])
+        super().add(key, count.tobytes() + tfs.tobytes() + '\n'.join(terms).encode('utf-8'))
+
+    def get(self, key):
+        """返回 {词: 词频}"""
+        data = super().get(key)
+        count = array('I')
+        count.frombytes(data[:4])
+        if not count[0]:
+            return {}
+        tfs = array('I')
+        tfs.frombytes(data[4:4 + 4 * count[0]])
+        return dict(zip(data[4 + 4 * count[0]:].decode('utf-8').split('\n'), tfs))
+
+def dump_json(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+class SearchIndex:
+    """增量维护的搜索索引
+
+    docs 为当前的文章 {路径: (meta, 内容哈希)}；写出时与上次写出的状态比较，只为新增、删除和
+    内容变化的文章更新倒排表。上次写出的索引文件在 .cache/search/data 中保留一份，
+    未受影响的分片直接沿用。
+    """
+
+    def __init__(self, cache_dir=SEARCH_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        self.data_dir = self.cache_dir / "data"
+        self.state_file = self.cache_dir / "state.json"
+        self.docs = {}
+        self.terms = None
+        # 上次写出时的状态
+        self.ids = {}
+        self.previous = {}
+        self.next_id = 0
+        self.files = {}
+        self._written = {}
+
+    def _load(self):
+        """读取上次写出的状态，状态不完整时从头建立索引"""
+        if self.terms is not None:
+            return
+        self.terms = TermCache(self.cache_dir)
+        try:
+            state = json.loads(self.state_file.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            state = None
+        if (state and state.get('version') == STATE_VERSION and state.get('code') == CODE_DIGEST
+                and all(key in self.terms for _, key, _ in state['docs'].values())
+                and all((self.data_dir / rel).is_file() for rel in state['files'])):
+            self.ids = {path: doc_id for path, (doc_id, _, _) in state['docs'].items()}
+            self.previous = {path: (meta, key) for path, (_, key, meta) in state['docs'].items()}
+            self.next_id = state['next_id']
+            self.files = state['files']
+        else:
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def add_document(self, path, content, meta):
+        """添加或更新一篇文章，meta为 [标题, 地址, 分组, 日期]；内容没有变化时不再切词"""
+        self._load()
+        key = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        if key not in self.terms:
+            counts = Counter(tokenize(content))
+            terms = sorted(counts)
+            self.terms.add(key, terms, array('I', [counts[term] for term in terms]))
+        self.docs[path] = (list(meta), key)
+
+    def remove_document(self, path):
+        self.docs.pop(path, None)
+
+    def _plan(self):
+        """与上次写出的状态比较并分配文档号
+
+        返回 (变化 [(文档号, 旧内容哈希, 新内容哈希)], 文档信息变化的文档号, 是否重新编号)
+        """
+        removed = [path for path in self.previous if path not in self.docs]
+        added = sorted(path for path in self.docs if path not in self.previous)
+        tombstones = self.next_id - len(self.previous) + len(removed)
+        renumber = tombstones > max(MIN_TOMBSTONES, TOMBSTONE_RATIO * len(self.docs))
+        if renumber:
+            self.ids, self.previous, self.next_id = {}, {}, 0
+            removed, added = [], sorted(self.docs)
+
+        changes = []
+        dirty = set()
+        for path in removed:
+            doc_id = self.ids.pop(path)
+            changes.append((doc_id, self.previous[path][1], None))
+            dirty.add(doc_id)
+        for path in added:
+            doc_id = self.ids[path] = self.next_id
+            self.next_id += 1
+            changes.append((doc_id, None, self.docs[path][1]))
+            dirty.add(doc_id)
+        for path, (meta, key) in self.docs.items():
+            old = self.previous.get(path)
+            if old is None:
+                continue
+            if old[1] != key:
+                changes.append((self.ids[path], old[1], key))
+            if old[0] != meta:
+                dirty.add(self.ids[path])
+        # 按文档号排序，每个词的更新也按文档号递增
+        changes.sort()
+        return changes, dirty, renumber
+
+    def _term_updates(self, old_key, new_key):
+        """一篇文章从旧内容变为新内容时，各词的新词频（0表示删除）"""
+        old = self.terms.get(old_key) if old_key else {}
+        new = self.terms.get(new_key) if new_key else {}
+        for term, tf in new.items():
+            if old.get(term) != tf:
+                yield term, tf
+        for term in old:
+            if term not in new:
+                yield term, 0
+
+    def _update_shards(self, changes):
+        """把变化应用到受影响的分片，逐个生成 (分片文件, 新内容或None（删除）)"""
+        counts = Counter()
+        for _, old_key, new_key in changes:
+            for term, _ in self._term_updates(old_key, new_key):
+                counts[shard_key(term)] += 1
+
+        # 分片按更新数分批，每批重新读一遍变化的文章
+        batches = []
+        size = UPDATE_BATCH
+        for key in sorted(counts):
+            if size + counts[key] > UPDATE_BATCH:
+                batches.append(set())
+                size = 0
+            batches[-1].add(key)
+            size += counts[key]
+
+        for batch in batches:
+            # 词 -> [文档号, 词频, 文档号, 词频, ...]
+            updates = {}
+            for doc_id, old_key, new_key in changes:
+                for term, tf in self._term_updates(old_key, new_key):
+                    if shard_key(term) in batch:
+                        flat = updates.get(term)
+                        if flat is None:
+                            flat = updates[term] = array('I')
+                        flat.append(doc_id)
+                        flat.append(tf)
+
+            by_shard = {}
+            for term in updates:
+                by_shard.setdefault(shard_key(term), []).append(term)
+            for key, terms in by_shard.items():
+                rel = f"shards/{key}.json"
+                shard = self._read(rel) if rel in self.files else {}
+                for term in terms:
+                    flat = updates.pop(term)
+                    pairs = zip(flat[::2], flat[1::2])
+                    if term in shard:
+                        postings = dict(decode_postings(shard[term]))
+                        for doc_id, tf in pairs:
+                            if tf:
+                                postings[doc_id] = tf
+                            else:
+                                postings.pop(doc_id, None)
+                        pairs = sorted(postings.items())
+                    else:
+                        pairs = [(doc_id, tf) for doc_id, tf in pairs if tf]
+                    if pairs:
+                        shard[term] = encode_postings(pairs)
+                    else:
+                        shard.pop(term, None)
+                yield rel, dict(sorted(shard.items())) if shard else None
+
+    def _read(self, rel):
+        with open(self.data_dir / rel, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def write(self, out_dir, reuse=None):
+        """
+        写出索引文件，返回 (分片数, 重新编码的文件数, 写入 out_dir 的文件数)
+
+        reuse(路径, 内容哈希) 返回True时不写出该文件（调用方沿用上次的输出），
+        默认为上次写入 out_dir 的内容相同且文件仍在。
+        """
+        self._load()
+        old_files = dict(self.files)
+        # 更新期间缓存的状态不完整，中断后下次从头建立
+        self.state_file.unlink(missing_ok=True)
+
+        changes, dirty, renumber = self._plan()
+        if renumber:
+            self.files = {}
+        # 分片逐个写入缓存目录，不在内存中积累整个索引
+        encoded = 0
+        for rel, payload in self._update_shards(changes):
+            encoded += self._store(rel, payload)
+
+        # 文档信息分块，只改写包含变化文章的块
+        doc_list = [None] * self.next_id
+        for path, (meta, _) in self.docs.items():
+            doc_list[self.ids[path]] = meta
+        chunk_count = (self.next_id + DOC_CHUNK - 1) // DOC_CHUNK
+        for chunk in range(chunk_count) if renumber else sorted({d // DOC_CHUNK for d in dirty}):
+            encoded += self._store(f"docs/{chunk}.json",
+                                   doc_list[chunk * DOC_CHUNK:(chunk + 1) * DOC_CHUNK])
+
+        shard_keys = sorted(rel[7:-5] for rel in self.files if rel.startswith("shards/"))
+        data = dump_json({
+            'version': INDEX_VERSION,
+            'docs': len(self.docs),
+            'doc_chunk': DOC_CHUNK,
+            'shards': shard_keys
+        })
+        digest = hashlib.sha256(data).hexdigest()
+        if self.files.get("meta.json") != digest:
+            write_atomic(self.data_dir / "meta.json", data)
+            self.files["meta.json"] = digest
+            encoded += 1
+
+        # 删除已经不存在的分片和文档块
+        for rel in old_files.keys() - self.files.keys():
+            (self.data_dir / rel).unlink(missing_ok=True)
+        self._save()
+
+        out_dir = Path(out_dir)
+        reuse = reuse or self._reuse_written
+        written = 0
+        for rel, digest in sorted(self.files.items()):
+            path = out_dir / rel
+            if reuse(path, digest):
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(self.data_dir / rel, path)
+            self._written[path] = digest
+            written += 1
+        self._remove_stale(out_dir)
+        return len(shard_keys), encoded, written
+
+    def _store(self, rel, payload):
+        """把一个文件写入缓存目录（None为删除），内容有变化时返回1"""
+        if payload is None:
+            self.files.pop(rel, None)
+            return 0
+        data = dump_json(payload)
+        digest = hashlib.sha256(data).hexdigest()
+        if self.files.get(rel) == digest:
+            return 0
+        write_atomic(self.data_dir / rel, data)
+        self.files[rel] = digest
+        return 1
+
+    def _reuse_written(self, path, digest):
+        return self._written.get(path) == digest and path.exists()
+
+    def _save(self):
+        """保存本次写出的状态"""
+        self.terms.save(key for _, key in self.docs.values())
+        write_atomic(self.state_file, dump_json({
+            'version': STATE_VERSION,
+            'code': CODE_DIGEST,
+            'next_id': self.next_id,
+            'docs': {path: [self.ids[path], key, meta] for path, (meta, key) in self.docs.items()},
+            'files': self.files
+        }))
+        self.previous = dict(self.docs)
+
+    def _remove_stale(self, out_dir):
+        """删除输出目录中已经不属于索引的文件"""
+        for directory in ("shards", "docs"):
+            for stale_file in (out_dir / directory).glob("*.json"):
+                if f"{directory}/{stale_file.name}" not in self.files:
+                    stale_file.unlink()
+                    self._written.pop(stale_file, None)
+
+    def size_bytes(self):
+        """索引总大小"""
+        return sum((self.data_dir / rel).stat().st_size for rel in self.files)
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+本地预览服务器与增量重建（python scripts/build.py serve --watch）
+"""
+
+import time
+import shutil
+import threading
+from pathlib import Path
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import build
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    """不输出访问日志的静态文件处理器"""
+
+    def log_message(self, format, *args):
+        pass
+
+def neighbours(site_index):
+    """每篇文章的 (上一篇, 下一篇) 路径"""
+    result = {}
+    for group in site_index.groups.values():
+        paths = group.paths()
+        for i, path in enumerate(paths):
+            prev_path = paths[i-1] if i > 0 else None
+            next_path = paths[i+1] if i < len(paths)-1 else None
+            result[path] = (prev_path, next_path)
+    return result
+
+class ListingFilter:
+    """代替 build.BUILD_STATE 判断列表页是否需要渲染：只渲染 pages 中的页面，其余记为跳过"""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.skipped = 0
+
+    def check(self, path, template_name, articles=(), config_keys=(), outputs=None, extra=None):
+        if Path(path) in self.pages:
+            return False
+        self.skipped += 1
+        return True
+
+class SiteWatcher:
+    """在内存中保存模板环境、配置和站点索引，文件变化时只重建受影响的页面"""
+
+    def __init__(self, build_dir, articles_dir=None, jobs=1):
+        self.build_dir = Path(build_dir)
+        self.articles_dir = Path(articles_dir) if articles_dir else None
+        self.jobs = jobs
+        # 模板会在运行中被修改，需要检查修改时间
+        self.env = build.init_jinja(auto_reload=True)
+        self.config = None
+        self.git_index = {}
+        self.articles = {}
+        self.site_index = build.SiteIndex()
+        self.snapshot = {}
+        self.search_index = None
+        self.image_pipeline = None
+        self.related_index = None
+        self.avatar_urls = {}
+        # 留待空闲时渲染的列表页：全站的列表页，以及这些分组的列表页
+        self.stale_listings = False
+        self.stale_groups = set()
+
+    def load_config(self):
+        """读取配置，并应用缓存的GitHub用户信息（不访问网络）"""
+        config = build.load_config()
+        if config is None:
+            return False
+        build.apply_github_profile(config, *build.fetch_github_profile(config, offline=True))
+        self.config = config
+        build.STABLE_BUILD_TIME = config.get('build', {}).get('stableBuildTime', False)
+        if config.get('build', {}).get('searchIndex', True):
+            self.search_index = self.search_index or build.SearchIndex()
+        else:
+            self.search_index = None
+        # 图片处理、相关文章的参数只在启动时读取
+        if self.related_index is None:
+            self.related_index = build.make_related_index(config)
+        if self.image_pipeline is None:
+            self.image_pipeline = build.make_image_pipeline(config)
+            if self.image_pipeline is not None and self.articles_dir:
+                self.image_pipeline.source = build.images.DirImageSource(self.articles_dir)
+        return True
+
+    def read_article(self, path):
+        """读取本地目录中的一篇文章"""
+        parts = path.split('/')
+        group_name = parts[0] if len(parts) == 2 else "default"
+        content = (self.articles_dir / path).read_text(encoding='utf-8')
+        return build.make_article(content, parts[-1], group_name, path, self.git_index,
+                                  self.search_index, self.image_pipeline,
+                                  related_index=self.related_index)
+
+    def load_articles(self):
+        """首次加载全部文章"""
+        if self.articles_dir:
+            if (self.articles_dir / ".git").exists():
+                self.git_index = build.build_git_index(self.articles_dir)
+            self.articles = {
+                path: self.read_article(path)
+                for _, _, path in build.list_article_files(self.articles_dir)
+            }
+        else:
+            all_articles, _ = build.fetch_articles(search_index=self.search_index,
+                                                   image_pipeline=self.image_pipeline,
+                                                   related_index=self.related_index)
+            self.articles = {article['path']: article for article in all_articles}
+        self.process_images()
+        # 只使用缓存中的头像，不访问网络
+        self.avatar_urls = build.process_avatars(self.config, list(self.articles.values()),
+                                                 self.build_dir, offline=True, jobs=self.jobs)
+        self.site_index = build.SiteIndex(self.articles.values())
+        if self.related_index is not None:
+            build.process_related(self.related_index, self.site_index)
+
+    def process_images(self):
+        """编码新引用的图片，并附加到刚读取的文章"""
+        if self.image_pipeline is not None and self.articles:
+            build.process_article_images(self.image_pipeline, list(self.articles.values()),
+                                         self.build_dir, self.jobs)
+
+    def render_listings(self):
+        """重新生成所有文章、所有分组和归档页面"""
+        page_sizes = build.get_page_sizes(self.config)
+        prefetch = build.get_prefetch_settings(self.config)['listingItems']
+        build.generate_all_groups_page(self.env, self.site_index, self.build_dir,
+                                       page_sizes['groupsPerPage'], prefetch)
+        build.generate_all_articles_page(self.env, self.site_index, self.build_dir,
+                                         page_sizes['articlesPerPage'], prefetch)
+        build.generate_archive_pages(self.env, self.site_index, self.build_dir,
+                                     page_sizes['articlesPerPage'], prefetch)
+
+    def listing_pages(self, paths):
+        """列出了这些文章的列表页（index.html 的路径），以及所有分组页和归档首页"""
+        page_sizes = build.get_page_sizes(self.config)
+        articles_dir = self.build_dir / "articles"
+        pages = {articles_dir / "groups" / "index.html", articles_dir / "archive" / "index.html"}
+        for path in paths:
+            entry = self.site_index.entries.get(path)
+            if entry is None:
+                continue
+            year, month = entry.date[:4], entry.date[5:7]
+            views = [
+                (articles_dir, self.site_index.all.entries, page_sizes['articlesPerPage']),
+                (articles_dir / "groups" / entry.group, self.site_index.groups[entry.group].entries,
+                 page_sizes['groupArticlesPerPage']),
+                (articles_dir / "archive" / year, self.site_index.year_entries(year),
+                 page_sizes['articlesPerPage']),
+                (articles_dir / "archive" / year / month, self.site_index.month_entries(year, month),
+                 page_sizes['articlesPerPage'])
+            ]
+            for base_dir, entries, per_page in views:
+                # 与 build.paginate 相同的分页
+                n = entries.index(entry) // per_page + 1 if per_page and per_page > 0 else 1
+                pages.add((base_dir if n == 1 else base_dir / "page" / str(n)) / "index.html")
+        return pages
+
+    def remove_extra_pages(self):
+        """删除文章减少后多出的分页，以及已经没有文章的归档年、月"""
+        page_sizes = build.get_page_sizes(self.config)
+        articles_dir = self.build_dir / "articles"
+        archive_dir = articles_dir / "archive"
+        listings = [
+            (articles_dir, self.site_index.all.count, page_sizes['articlesPerPage']),
+            (articles_dir / "groups", len(self.site_index.groups), page_sizes['groupsPerPage'])
+        ]
+        listings.extend((articles_dir / "groups" / name, group.count, page_sizes['groupArticlesPerPage'])
+                        for name, group in self.site_index.groups.items())
+        periods = set()
+        for year, count, months in self.site_index.years():
+            periods.add(archive_dir / year)
+            listings.append((archive_dir / year, count, page_sizes['articlesPerPage']))
+            for month, month_count in months:
+                periods.add(archive_dir / year / month)
+                listings.append((archive_dir / year / month, month_count, page_sizes['articlesPerPage']))
+
+        if archive_dir.exists():
+            for year_dir in archive_dir.iterdir():
+                if not year_dir.is_dir():
+                    continue
+                if year_dir not in periods:
+                    shutil.rmtree(year_dir)
+                    continue
+                for month_dir in year_dir.iterdir():
+                    if month_dir.name.isdigit() and month_dir not in periods:
+                        shutil.rmtree(month_dir)
+        for base_dir, count, per_page in listings:
+            pages = len(build.paginate(range(count), per_page))
+            page_dir = base_dir / "page"
+            if page_dir.is_dir():
+                for extra in page_dir.iterdir():
+                    if extra.name.isdigit() and int(extra.name) > pages:
+                        shutil.rmtree(extra)
+                if not any(page_dir.iterdir()):
+                    page_dir.rmdir()
+
+    def render_stale_listings(self):
+        """渲染上次重建时跳过的列表页"""
+        start = time.perf_counter()
+        if self.stale_listings:
+            self.render_listings()
+        page_sizes = build.get_page_sizes(self.config)
+        prefetch = build.get_prefetch_settings(self.config)['listingItems']
+        for group_name in self.stale_groups:
+            group = self.site_index.groups.get(group_name)
+            if group is not None:
+                build.generate_group_index(self.env, group, self.build_dir,
+                                           page_sizes['groupArticlesPerPage'], prefetch)
+        self.stale_listings = False
+        self.stale_groups = set()
+        print(f"⚡ 其余列表页更新完成: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def render_all(self):
+        """重新生成全部页面（模板或配置变化时）"""
+        self.stale_listings = False
+        self.stale_groups = set()
+        build.generate_home_page(self.env, self.config, self.build_dir)
+        if len(self.site_index):
+            self.render_listings()
+            build.generate_group_pages(self.env, self.site_index, self.build_dir,
+                                       self.config, self.jobs)
+        self.render_search()
+
+    def render_search(self):
+        """更新搜索索引（只重新编码变化的文章所在的分片）"""
+        if self.search_index is not None:
+            build.generate_search_index(self.env, self.search_index, self.build_dir)
+
+    def full_build(self):
+        """完整构建一次"""
+        if self.build_dir.exists():
+            shutil.rmtree(self.build_dir)
+        self.build_dir.mkdir(parents=True)
+
+        if not self.load_config():
+            return False
+        self.load_articles()
+        self.render_all()
+        build.copy_static_files(self.build_dir)
+        build.generate_backgrounds(self.config, *build.fetch_backgrounds(self.config, offline=True),
+                                   self.build_dir, self.jobs)
+        (self.build_dir / ".nojekyll").touch()
+        self.snapshot = self.take_snapshot()
+        return True
+
+    def take_snapshot(self):
+        """记录被监视文件的修改时间"""
+        files = {}
+
+        def add(kind, key, path):
+            try:
+                files[(kind, key)] = path.stat().st_mtime_ns
+            except OSError:
+                pass
+
+        if self.articles_dir:
+            for _, _, path in build.list_article_files(self.articles_dir):
+                add('article', path, self.articles_dir / path)
+        for path in Path("templates").rglob("*"):
+            if path.is_file():
+                add('template', path.as_posix(), path)
+        for path in Path("site").iterdir():
+            if path.is_file():
+                add('static', path.name, path)
+        add('config', "config.json", Path("config.json"))
+        return files
+
+    def poll(self):
+        """检查文件变化，返回变化的 (类型, 路径) 集合"""
+        snapshot = self.take_snapshot()
+        changed = {key for key in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(key) != self.snapshot.get(key)}
+        self.snapshot = snapshot
+        return changed
+
+    def apply_article_changes(self, paths):
+        """更新内存中的文章，返回需要重新渲染的文章路径"""
+        old_neighbours = neighbours(self.site_index)
+        old_related = {path: article.get('related') for path, article in self.articles.items()}
+        old_groups = {path: self.articles[path]['group'] for path in paths if path in self.articles}
+
+        for path in paths:
+            if (self.articles_dir / path).exists():
+                self.articles[path] = self.read_article(path)
+                print(f"✎ 更新: {path}")
+            elif self.articles.pop(path, None) is not None:
+                self.site_index.remove(path)
+                if self.related_index is not None:
+                    self.related_index.remove_document(path)
+                if self.search_index is not None:
+                    self.search_index.remove_document(path)
+                print(f"✗ 删除: {path}")
+        self.process_images()
+        updated = [self.articles[path] for path in paths if path in self.articles]
+        build.apply_avatars(updated, self.avatar_urls)
+        # 增量更新索引，文章按日期插入，不必重新排序
+        for article in updated:
+            self.site_index.add(article)
+        if self.related_index is not None:
+            build.process_related(self.related_index, self.site_index)
+        new_neighbours = neighbours(self.site_index)
+
+        # 删除已不存在的文章页面和空分组
+        for path, group_name in old_groups.items():
+            if path not in self.articles:
+                html_name = f"{Path(path).stem}.html"
+                (self.build_dir / "articles" / "groups" / group_name / html_name).unlink(missing_ok=True)
+                if group_name not in self.site_index.groups:
+                    shutil.rmtree(self.build_dir / "articles" / "groups" / group_name,
+                                  ignore_errors=True)
+
+        # 变化的文章本身、它们的相邻文章，以及相邻关系改变的文章
+        dirty = {path for path in paths if path in self.articles}
+        for path in list(dirty):
+            dirty.update(p for p in new_neighbours[path] if p)
+        for path, pair in new_neighbours.items():
+            if old_neighbours.get(path) != pair:
+                dirty.add(path)
+        # 相关文章列表变化、或列出了变化的文章（页面上有其标题）的文章
+        for path, article in self.articles.items():
+            related = article.get('related', [])
+            if old_related.get(path) != related or not paths.isdisjoint(related):
+                dirty.add(path)
+        return dirty
+
+    def render_articles(self, dirty):
+        """只渲染指定的文章及其所在分组首页"""
+        site_title = self.config['site']['title']
+        per_page = build.get_page_sizes(self.config)['groupArticlesPerPage']
+        prefetch = build.get_prefetch_settings(self.config)
+        groups = {self.articles[path]['group'] for path in dirty}
+
+        tasks = []
+        for group_name in groups:
+            group = self.site_index.groups[group_name]
+            group_dir = build.generate_group_index(self.env, group, self.build_dir, per_page,
+                                                   prefetch['listingItems'])
+            if prefetch['instantNavigation']:
+                build.write_nav_manifest(group, group_dir)
+            tasks.extend(task for task in build.make_article_tasks(
+                group.articles(), group_name, group_dir, site_title, self.site_index.entries,
+                prefetch
+            ) if task['article']['path'] in dirty)
+        build.run_article_tasks(self.env, tasks)
+
+    def rebuild(self, changed):
+        """根据变化重建受影响的页面"""
+        start = time.perf_counter()
+        kinds = {kind for kind, _ in changed}
+
+        if 'config' in kinds and not self.load_config():
+            return
+
+        article_paths = {key for kind, key in changed if kind == 'article'}
+        # 文章原来所在的列表页和分组
+        pages = self.listing_pages(article_paths) if article_paths else set()
+        groups = {self.site_index.entries[path].group for path in article_paths
+                  if path in self.site_index.entries}
+        dirty = self.apply_article_changes(article_paths) if article_paths else set()
+
+        if kinds & {'config', 'template'}:
+            self.render_all()
+        elif article_paths:
+            # 先只渲染变化的文章所在的列表页；其余列表页只有合计数字和分页位置变化，空闲时再渲染
+            listing_filter = ListingFilter(pages | self.listing_pages(article_paths))
+            build.BUILD_STATE = listing_filter
+            try:
+                self.render_listings()
+                self.render_articles(dirty)
+            finally:
+                build.BUILD_STATE = None
+            if listing_filter.skipped:
+                self.stale_listings = True
+                self.stale_groups.update(groups)
+                self.stale_groups.update(self.site_index.entries[path].group
+                                         for path in article_paths if path in self.site_index.entries)
+                print(f"⏳ 其余 {listing_filter.skipped} 个列表页稍后更新")
+            self.remove_extra_pages()
+            self.render_search()
+
+        if 'static' in kinds:
+            build.copy_static_files(self.build_dir)
+
+        print(f"⚡ 重建完成: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def watch(self, interval=0.5):
+        """轮询文件变化"""
+        while True:
+            time.sleep(interval)
+            changed = self.poll()
+            try:
+                if changed:
+                    self.rebuild(changed)
+                elif self.stale_listings or self.stale_groups:
+                    self.render_stale_listings()
+            except Exception as e:
+                print(f"✗ 重建失败: {e}")
+
+def serve(args):
+    """构建并启动本地预览服务器"""
+    build_dir = Path("site/_site")
+    if args.watch and not args.articles_dir:
+        print("⚠ 未指定 --articles-dir，只监视模板、静态文件和配置")
+
+    watcher = SiteWatcher(build_dir, args.articles_dir, args.jobs)
+    print("🚀 首次构建...")
+    if not watcher.full_build():
+        return False
+
+    handler = partial(QuietHandler, directory=str(build_dir))
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"🌐 预览地址: http://{args.host}:{args.port}/")
+
+    try:
+        if args.watch:
+            print("👀 监视文件变化中，按 Ctrl+C 退出")
+            watcher.watch()
+        else:
+            thread.join()
+    except KeyboardInterrupt:
+        print("\n👋 已停止")
+    finally:
+        server.shutdown()
+    return True
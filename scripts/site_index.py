@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+站点索引
+
+文章读取完成后构建一次，所有页面生成函数共用：
+- 每篇文章一条 __slots__ 记录，保存列表页和清单用到的字段；
+- 全站和各分组的合计（文章数、字数、阅读时间、最近更新）；
+- 按日期（新到旧）排序的视图，排序键保存在 array 中，用 bisect 插入、删除，
+  预览服务器增量更新时不必重新排序；年、月归档只是排序视图中的一段。
+"""
+
+from array import array
+from bisect import bisect_left
+
+# 排序键 = -日期 << SEQ_BITS | 读取顺序：日期新的在前，同一天的按读取顺序
+SEQ_BITS = 32
+SEQ_MASK = (1 << SEQ_BITS) - 1
+
+def date_number(date):
+    """'YYYY-MM-DD' -> YYYYMMDD"""
+    return int(date[:4]) * 10000 + int(date[5:7]) * 100 + int(date[8:10])
+
+class ArticleEntry:
+    """一篇文章在索引中的记录，article 为完整的文章数据（渲染详情页用）"""
+
+    __slots__ = ('article', 'path', 'group', 'html_name', 'url', 'title', 'description',
+                 'author', 'date', 'word_count', 'reading_time', 'commit_count', 'key')
+
+    def __init__(self, article, seq):
+        self.article = article
+        self.path = article['path']
+        self.group = article['group']
+        self.html_name = article['html_name']
+        self.url = f"/articles/groups/{self.group}/{self.html_name}"
+        self.title = article['title']
+        self.description = article['description']
+        self.author = article['author']
+        self.date = article['date']
+        self.word_count = article['word_count']
+        self.reading_time = article['reading_time']
+        self.commit_count = article['commit_count']
+        self.key = (-date_number(self.date) << SEQ_BITS) | seq
+
+    @property
+    def seq(self):
+        return self.key & SEQ_MASK
+
+    def record(self):
+        """文章在列表清单中的精简记录"""
+        return {
+            'title': self.title,
+            'url': self.url,
+            'group': self.group,
+            'date': self.date,
+            'description': self.description,
+            'author': self.author,
+            'words': self.word_count,
+            'commits': self.commit_count
+        }
+
+class DateView:
+    """按日期排序的一组文章及其合计"""
+
+    __slots__ = ('keys', 'entries', 'total_words', 'total_reading_time')
+
+    def __init__(self):
+        self.keys = array('q')
+        self.entries = []
+        self.total_words = 0
+        self.total_reading_time = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    @property
+    def count(self):
+        return len(self.entries)
+
+    @property
+    def latest_date(self):
+        return self.entries[0].date if self.entries else ''
+
+    def add(self, entry):
+        i = bisect_left(self.keys, entry.key)
+        self.keys.insert(i, entry.key)
+        self.entries.insert(i, entry)
+        self.total_words += entry.word_count
+        self.total_reading_time += entry.reading_time
+
+    def remove(self, entry):
+        i = bisect_left(self.keys, entry.key)
+        del self.keys[i]
+        del self.entries[i]
+        self.total_words -= entry.word_count
+        self.total_reading_time -= entry.reading_time
+
+    def between(self, first, last):
+        """日期在 [first, last]（YYYYMMDD）之间的文章，仍按日期排序"""
+        lo = bisect_left(self.keys, -last << SEQ_BITS)
+        hi = bisect_left(self.keys, -(first - 1) << SEQ_BITS)
+        return self.entries[lo:hi]
+
+    def articles(self):
+        """完整的文章数据，按日期排序"""
+        return [entry.article for entry in self.entries]
+
+    def paths(self):
+        return [entry.path for entry in self.entries]
+
+class GroupView(DateView):
+    """一个分组的文章，模板中的 group_info"""
+
+    __slots__ = ('name', 'url', 'description')
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.url = f"/articles/groups/{name}/"
+        self.description = f"{name} 分类的文章"
+
+    def record(self):
+        """分组在列表清单中的精简记录"""
+        return {
+            'name': self.name,
+            'url': self.url,
+            'count': self.count,
+            'words': self.total_words,
+            'reading_time': self.total_reading_time,
+            'latest_date': self.latest_date
+        }
+
+class SiteIndex:
+    """全站文章索引：全部文章、各分组（按首次出现的顺序）、各月的文章数"""
+
+    def __init__(self, articles=()):
+        self.entries = {}
+        self.all = DateView()
+        self.groups = {}
+        self.months = {}
+        self._next_seq = 0
+        for article in articles:
+            self.add(article)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, article):
+        """加入一篇文章；同一路径的文章已存在时替换它，并保持原来的读取顺序"""
+        old = self.entries.get(article['path'])
+        if old is None:
+            seq = self._next_seq
+            self._next_seq += 1
+        else:
+            seq = old.seq
+            self._unlink(old)
+
+        entry = ArticleEntry(article, seq)
+        self.entries[entry.path] = entry
+        self.all.add(entry)
+        group = self.groups.get(entry.group)
+        if group is None:
+            group = self.groups[entry.group] = GroupView(entry.group)
+        group.add(entry)
+        month = entry.date[:7]
+        self.months[month] = self.months.get(month, 0) + 1
+
+        # 替换后原分组为空时才删除，避免分组的顺序变化
+        if old is not None and not self.groups[old.group]:
+            del self.groups[old.group]
+        return entry
+
+    def remove(self, path):
+        """删除一篇文章，不存在时返回None"""
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        self._unlink(entry)
+        if not self.groups[entry.group]:
+            del self.groups[entry.group]
+        return entry
+
+    def _unlink(self, entry):
+        del self.entries[entry.path]
+        self.all.remove(entry)
+        self.groups[entry.group].remove(entry)
+        month = entry.date[:7]
+        self.months[month] -= 1
+        if not self.months[month]:
+            del self.months[month]
+
+    def recent(self, n):
+        """最近更新的 n 篇文章"""
+        return self.all.entries[:n]
+
+    def years(self):
+        """[(年份, 文章数, [(月份, 文章数)])]，新到旧"""
+        years = {}
+        for month in sorted(self.months, reverse=True):
+            year = month[:4]
+            if year not in years:
+                years[year] = [0, []]
+            years[year][0] += self.months[month]
+            years[year][1].append((month[5:], self.months[month]))
+        return [(year, count, months) for year, (count, months) in years.items()]
+
+    def year_entries(self, year):
+        """某年的文章"""
+        year = int(year)
+        return self.all.between(year * 10000 + 101, year * 10000 + 1231)
+
+    def month_entries(self, year, month):
+        """某月的文章"""
+        base = int(year) * 10000 + int(month) * 100
+        return self.all.between(base + 1, base + 31)
@@ -0,0 +1,163 @@
+// 文章页之间的即时跳转
+//
+// 点击指向文章页的链接时，只取回目标页面并替换 <main>，不重新加载 Tailwind、Font Awesome
+// 和背景图片；地址、标题和浏览器历史照常更新。每个分组的导航清单（nav.json，构建时生成）
+// 按上一篇/下一篇的顺序列出文章，替换后据此预取新页面的相邻文章。
+// 出错时退回普通的页面跳转。
+(function () {
+    if (!window.fetch || !window.DOMParser || !window.URL || !history.pushState) return;
+
+    var ARTICLE_PATH = /^\/articles\/groups\/[^\/]+\/[^\/]+\.html$/;
+    // 内存中最多保留的页面数
+    var MAX_PAGES = 16;
+
+    var pages = {};      // 路径 -> Promise(页面HTML)
+    var order = [];      // 取回页面的先后顺序，用于淘汰
+    var manifests = {};  // 清单地址 -> Promise({base, pages, index})
+    var current = manifestUrl(document);
+    var shown = location.pathname;  // <main> 当前显示的页面
+    var navigation = 0;
+
+    function manifestUrl(doc) {
+        var meta = doc.querySelector('meta[name="nav-manifest"]');
+        return meta ? meta.getAttribute('content') : null;
+    }
+
+    function fetchOk(url) {
+        return fetch(url, {credentials: 'same-origin'}).then(function (response) {
+            if (!response.ok) throw new Error(url + ': HTTP ' + response.status);
+            return response;
+        });
+    }
+
+    // 取回页面（与 <link rel="prefetch"> 共用浏览器缓存）
+    function load(path) {
+        if (!pages[path]) {
+            pages[path] = fetchOk(path).then(function (response) { return response.text(); });
+            pages[path].catch(function () { forget(path); });
+            order.push(path);
+            if (order.length > MAX_PAGES) delete pages[order.shift()];
+        }
+        return pages[path];
+    }
+
+    function forget(path) {
+        delete pages[path];
+        order = order.filter(function (p) { return p !== path; });
+    }
+
+    function loadManifest(url) {
+        if (!manifests[url]) {
+            manifests[url] = fetchOk(url).then(function (response) {
+                return response.json();
+            }).then(function (manifest) {
+                manifest.index = {};
+                manifest.pages.forEach(function (name, i) { manifest.index[name] = i; });
+                return manifest;
+            });
+            manifests[url].catch(function () { delete manifests[url]; });
+        }
+        return manifests[url];
+    }
+
+    // 按清单预取当前文章的下一篇和上一篇
+    function prefetchNeighbours() {
+        if (!current) return;
+        var path = location.pathname;
+        loadManifest(current).then(function (manifest) {
+            var i = manifest.index[path.slice(path.lastIndexOf('/') + 1)];
+            if (i === undefined) return;
+            [i + 1, i - 1].forEach(function (j) {
+                if (j >= 0 && j < manifest.pages.length) load(manifest.base + manifest.pages[j]);
+            });
+        }).catch(function () {});
+    }
+
+    // 指向其他文章页的同源链接返回其URL，否则返回null
+    function articleUrl(link) {
+        if (!link || link.target || link.hasAttribute('download')) return null;
+        var url = new URL(link.href, location.href);
+        if (url.origin !== location.origin || !ARTICLE_PATH.test(url.pathname)) return null;
+        if (url.pathname === location.pathname) return null;
+        return url;
+    }
+
+    function findLink(target) {
+        return target && target.closest ? target.closest('a[href]') : null;
+    }
+
+    // 用取回的页面替换 <main> 和标题，页面结构不符时返回false
+    function swap(path, html) {
+        var doc = new DOMParser().parseFromString(html, 'text/html');
+        var main = doc.querySelector('main');
+        var old = document.querySelector('main');
+        if (!main || !old) return false;
+        document.title = doc.title;
+        old.parentNode.replaceChild(document.adoptNode(main), old);
+        current = manifestUrl(doc);
+        shown = path;
+        return true;
+    }
+
+    function restoreScroll(hash, y) {
+        var target = !y && hash && document.getElementById(decodeURIComponent(hash.slice(1)));
+        if (target) {
+            target.scrollIntoView();
+        } else {
+            window.scrollTo(0, y || 0);
+        }
+    }
+
+    function navigate(url) {
+        var id = ++navigation;
+        // 记住离开时的滚动位置，返回时恢复
+        history.replaceState({instant: true, y: window.scrollY}, '', location.href);
+        load(url.pathname).then(function (html) {
+            if (id !== navigation) return;
+            if (!swap(url.pathname, html)) throw new Error('页面结构不符');
+            history.pushState({instant: true, y: 0}, '', url.href);
+            restoreScroll(url.hash, 0);
+            prefetchNeighbours();
+        }).catch(function () {
+            if (id === navigation) location.href = url.href;
+        });
+    }
+
+    document.addEventListener('click', function (event) {
+        if (event.defaultPrevented || event.button !== 0 ||
+            event.metaKey || event.ctrlKey || event.shiftKey || event.altKey) return;
+        var url = articleUrl(findLink(event.target));
+        if (!url) return;
+        event.preventDefault();
+        navigate(url);
+    });
+
+    // 鼠标悬停或触摸时提前取回页面
+    function warm(event) {
+        var url = articleUrl(findLink(event.target));
+        if (url) load(url.pathname).catch(function () {});
+    }
+    document.addEventListener('mouseover', warm);
+    document.addEventListener('touchstart', warm, {passive: true});
+
+    // 前进/后退到另一篇文章时同样只替换正文
+    window.addEventListener('popstate', function (event) {
+        var state = event.state;
+        var path = location.pathname;
+        // 同一页面内的锚点跳转交给浏览器处理
+        if (path === shown) return;
+        if (!ARTICLE_PATH.test(path)) {
+            location.reload();
+            return;
+        }
+        var id = ++navigation;
+        load(path).then(function (html) {
+            if (id !== navigation) return;
+            if (!swap(path, html)) throw new Error('页面结构不符');
+            restoreScroll(location.hash, state && state.instant ? state.y : 0);
+            prefetchNeighbours();
+        }).catch(function () {
+            if (id === navigation) location.reload();
+        });
+    });
+})();
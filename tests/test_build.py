@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+增量构建：只修改模板时，重新渲染的页面所在目录仍要在暂存目录中创建，页面不能丢失
+
+在临时目录中用 bench.py 生成一个小的合成articles仓库，离线构建。
+
+用法:
+    python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import json
+import tempfile
+import unittest
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import bench
+import build
+
+CORPUS = {
+    'articles': 12,
+    'groups': 2,
+    'code_blocks': 1,
+    'tables': 0,
+    'paragraphs': 2,
+    'commits': 1,
+    'edit_ratio': 0.5,
+    'cjk_ratio': 0.5,
+    'seed': 57
+}
+
+class IncrementalBuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.old_cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.workspace = Path(self.tmp.name)
+        self.quiet(bench.prepare_workspace, self.workspace, CORPUS)
+        os.chdir(self.workspace)
+        self.site = self.workspace / "site" / "_site"
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        self.tmp.cleanup()
+
+    def quiet(self, func, *args, **kwargs):
+        with open(os.devnull, 'w', encoding='utf-8') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                return func(*args, **kwargs)
+
+    def build(self, full=False):
+        self.quiet(build.build_with_templates, offline=True, full=full)
+
+    def set_config(self, section, key, value):
+        path = self.workspace / "config.json"
+        config = json.loads(path.read_text(encoding='utf-8'))
+        config['build'][section][key] = value
+        path.write_text(json.dumps(config, ensure_ascii=False, indent=2), encoding='utf-8')
+
+    def edit_template(self, name):
+        path = self.workspace / "templates" / "articles" / name
+        path.write_text(path.read_text(encoding='utf-8') + "\n{# changed #}\n", encoding='utf-8')
+
+    def article_pages(self):
+        pages = (self.site / "articles" / "groups").glob("*/*.html")
+        return sorted(page.relative_to(self.site) for page in pages if page.name != "index.html")
+
+    def test_search_page_survives_template_edit(self):
+        self.build(full=True)
+        self.assertTrue((self.site / "search" / "index.html").is_file())
+
+        # 搜索索引文件全部沿用，只有搜索页重新渲染
+        self.edit_template("base.html")
+        self.build()
+        self.assertTrue((self.site / "search" / "index.html").is_file())
+
+    def test_article_pages_survive_detail_template_edit(self):
+        # 即时跳转的清单也会创建分组目录，关闭后才能覆盖这种情况
+        self.set_config('prefetch', 'instantNavigation', False)
+        self.build(full=True)
+        pages = self.article_pages()
+        self.assertEqual(len(pages), CORPUS['articles'])
+
+        # 分组首页都沿用，只有文章页重新渲染
+        self.edit_template("article_detail.html")
+        self.build()
+        self.assertEqual(self.article_pages(), pages)
+
+class WordCountTest(unittest.TestCase):
+
+    def test_links_and_tags_not_counted(self):
+        self.assertEqual(build.count_words("see [the docs](https://example.com/a-b) now"), (4, 0))
+        self.assertEqual(build.count_words("<span class=\"x\">中文</span> text"), (1, 2))
+
+    def test_comparisons_are_prose(self):
+        self.assertEqual(build.count_words("a < b and c > d"), (5, 0))
+        self.assertEqual(build.count_words("if x <= 3 and y >= 2"), (6, 0))
+
+    def test_counts_from_position(self):
+        text = "skipped words\n一二三 four <b>five</b>"
+        self.assertEqual(build.count_words(text, text.index("\n")), (2, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+http_cache 的条件请求、TTL、离线和失败回退，以及头像、背景图片在离线时的回退
+
+在 127.0.0.1 上启动一个本地 HTTP 服务器，不访问外部网络。
+
+用法:
+    python -m unittest discover -s tests
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+import avatars
+import backgrounds
+from http_cache import cached_get, save_cache_entry
+
+PNG_BODY = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+ETAG = '"v1"'
+
+class Handler(BaseHTTPRequestHandler):
+    """/text 带ETag，/image.png 为图片；server.fail 为True时全部返回500"""
+
+    def do_GET(self):
+        self.server.seen.append((self.path, self.headers.get('If-None-Match')))
+        if self.server.fail:
+            self.send_response(500)
+            self.end_headers()
+            return
+        path = self.path.split('?')[0]
+        if path == '/text':
+            if self.headers.get('If-None-Match') == ETAG:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body, content_type = b'hello', 'text/plain'
+        elif path.endswith('.png') or path.startswith('/avatars/'):
+            body, content_type = PNG_BODY, 'image/png'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', ETAG)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class LocalServerTestCase(unittest.TestCase):
+    """每个测试使用新的服务器和临时工作目录（缓存目录都是相对路径）"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.seen = []
+        self.server.fail = False
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+        self.old_cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        self.cache_dir = Path(self.tmp.name) / "http"
+
+    def tearDown(self):
+        os.chdir(self.old_cwd)
+        self.tmp.cleanup()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def closed_port_url(self):
+        """一个没有服务监听的地址，请求时连接被拒绝"""
+        server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        port = server.server_address[1]
+        server.server_close()
+        return f"http://127.0.0.1:{port}/text"
+
+class CachedGetTest(LocalServerTestCase):
+
+    def get(self, path, **kwargs):
+        return cached_get(self.base_url + path, cache_dir=self.cache_dir, timeout=5, **kwargs)
+
+    def test_fetch_then_fresh_within_ttl(self):
+        self.assertEqual(self.get('/text'), (b'hello', 'fetched'))
+        self.assertEqual(self.get('/text', ttl=3600), (b'hello', 'fresh'))
+        self.assertEqual(len(self.server.seen), 1)
+
+    def test_revalidate_with_etag(self):
+        self.get('/text')
+        self.assertEqual(self.get('/text', ttl=0), (b'hello', 'revalidated'))
+        self.assertEqual(self.server.seen[-1], ('/text', ETAG))
+        # 304 刷新了获取时间，TTL内不再请求
+        self.assertEqual(self.get('/text', ttl=3600), (b'hello', 'fresh'))
+        self.assertEqual(len(self.server.seen), 2)
+
+    def test_offline_uses_cache_without_request(self):
+        self.assertEqual(self.get('/text', offline=True), (None, '离线模式且没有缓存'))
+
+        self.get('/text')
+        self.assertEqual(self.get('/text', ttl=0, offline=True), (b'hello', 'offline'))
+        self.assertEqual(len(self.server.seen), 1)
+
+    def test_stale_on_http_error(self):
+        self.get('/text')
+        self.server.fail = True
+        self.assertEqual(self.get('/text', ttl=0), (b'hello', 'stale'))
+        self.assertEqual(self.get('/other', ttl=0), (None, 'HTTP 500'))
+
+    def test_stale_on_connection_error(self):
+        url = self.closed_port_url()
+        save_cache_entry(url, {'url': url, 'etag': ETAG, 'fetched_at': 0}, b'old', self.cache_dir)
+        self.assertEqual(cached_get(url, ttl=0, timeout=5, cache_dir=self.cache_dir),
+                         (b'old', 'stale'))
+
+class OfflineFallbackTest(LocalServerTestCase):
+
+    def test_avatars(self):
+        settings = {'githubUrl': f"{self.base_url}/avatars", 'gravatarUrl': '', 'concurrency': 1}
+        author = ('octocat', 'octocat@example.com')
+        files, counts = avatars.fetch_avatars({author}, settings)
+        self.assertEqual(counts, {'fetched': 1})
+        requests_made = len(self.server.seen)
+
+        # 离线时使用缓存的头像，不发出请求
+        offline_files, counts = avatars.fetch_avatars({author}, settings, offline=True)
+        self.assertEqual(offline_files, files)
+        self.assertEqual(counts, {'offline': 1})
+        self.assertEqual(len(self.server.seen), requests_made)
+
+        # 没有缓存的作者离线时没有头像
+        files, counts = avatars.fetch_avatars({('someone', 'someone@example.com')}, settings,
+                                              offline=True)
+        self.assertEqual(files, {})
+        self.assertEqual(counts, {'离线模式且没有缓存': 1})
+        self.assertEqual(len(self.server.seen), requests_made)
+
+    def test_backgrounds(self):
+        api_url = f"{self.base_url}/image.png"
+        self.assertEqual(backgrounds.fetch_background_pool(api_url, size=2, offline=True),
+                         ([], '离线模式且没有缓存'))
+        self.assertEqual(self.server.seen, [])
+
+        pool, status = backgrounds.fetch_background_pool(api_url, size=2)
+        self.assertEqual(status, 'fetched')
+        self.assertEqual(len(pool), 1)
+        requests_made = len(self.server.seen)
+
+        self.assertEqual(backgrounds.fetch_background_pool(api_url, size=2, offline=True),
+                         (pool, 'offline'))
+        self.assertEqual(len(self.server.seen), requests_made)
+
+        # API失败时沿用上次的图片
+        self.server.fail = True
+        self.assertEqual(backgrounds.fetch_background_pool(api_url, size=2, ttl=0),
+                         (pool, 'stale'))
+
+
+if __name__ == "__main__":
+    unittest.main()